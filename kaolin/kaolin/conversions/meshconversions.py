@@ -55,15 +55,27 @@ def trianglemesh_to_pointcloud(mesh: kaolin.rep.Mesh, num_points: int):
 
 
 def trianglemesh_to_voxelgrid(mesh: kaolin.rep.Mesh, resolution: int,
-             normalize: bool = True, vertex_offset: float = 0.):
+             normalize: bool = True, vertex_offset: float = 0.,
+             conservative: bool = False, solid: bool = False):
     r""" Converts mesh to a voxel model of a given resolution
 
+    Every triangle is rasterized into exactly the voxels it overlaps, found
+    with separating axis tests against the voxels of its bounding box. After
+    normalization voxel i spans [i, i + 1) / (resolution - 1) along each
+    axis, so that the mesh covers the whole grid.
+
     Args:
         mesh (kaolin.rep.Mesh): mesh to convert
         resolution (int): desired dresolution of generated voxel array
         normalize (bool): Determines whether to normalize vertices
         vertex_offset (float): Offset applied to all vertices after
                                normalizing.
+        conservative (bool): If True, voxels are closed boxes, so a voxel
+                             is also occupied when the surface only touches
+                             its boundary.
+        solid (bool): If True, the interior of the mesh is filled as well,
+                      using the parity of the surface crossings along z.
+                      The mesh should be watertight.
 
     Returns:
         voxels (torch.Tensor): voxel array of desired resolution
@@ -74,82 +86,255 @@ def trianglemesh_to_voxelgrid(mesh: kaolin.rep.Mesh, resolution: int,
         >>> voxel.shape
 
     """
-    mesh = kal.rep.Mesh.from_tensors(mesh.vertices.clone(), mesh.faces.clone())
-    if normalize:
-        verts_max = mesh.vertices.max()
-        verts_min = mesh.vertices.min()
-        mesh.vertices = (mesh.vertices - verts_min) / (verts_max - verts_min)
+    triangles = _voxel_triangles(mesh, resolution, normalize, vertex_offset)
+
+    voxel = torch.zeros(resolution ** 3, device=triangles.device)
+    occupied = _voxelize_triangles(triangles, resolution, conservative)
+    voxel[occupied] = 1
+    voxel = voxel.view(resolution, resolution, resolution)
+    if solid:
+        voxel[_parity_fill(triangles, resolution)] = 1
+    return voxel
+
+
+def trianglemesh_to_sparsevoxelgrid(mesh: kaolin.rep.Mesh, resolution: int,
+                                    normalize: bool = True,
+                                    vertex_offset: float = 0.,
+                                    conservative: bool = False):
+    r""" Converts mesh to a sparse voxel grid of a given resolution, with the
+    same voxels as the surface of :func:`trianglemesh_to_voxelgrid` but
+    without allocating the dense array.
+
+    Args:
+        mesh (kaolin.rep.Mesh): mesh to convert
+        resolution (int): desired resolution of generated voxel grid
+        normalize (bool): Determines whether to normalize vertices
+        vertex_offset (float): Offset applied to all vertices after
+                               normalizing.
+        conservative (bool): If True, voxels are closed boxes, so a voxel
+                             is also occupied when the surface only touches
+                             its boundary.
 
-    mesh.vertices = mesh.vertices + vertex_offset
+    Returns:
+        (kaolin.rep.SparseVoxelGrid): occupied voxels
 
-    points = mesh.vertices
-    smallest_side = (1. / resolution)**2
+    Example:
+        >>> mesh = kal.TriangleMesh.from_obj('model.obj')
+        >>> grid = kal.conversions.trianglemesh_to_sparsevoxelgrid(mesh, 1024)
+        >>> grid.coords.shape
+        torch.Size([3865611, 3])
+
+    """
+    triangles = _voxel_triangles(mesh, resolution, normalize, vertex_offset)
+    occupied = _voxelize_triangles(triangles, resolution, conservative)
+    coords = torch.stack((occupied // resolution ** 2,
+                          occupied // resolution % resolution,
+                          occupied % resolution), dim=1)
+    return kal.rep.SparseVoxelGrid(coords, resolution=resolution)
+
+
+def _voxel_triangles(mesh, resolution, normalize, vertex_offset):
+    """Triangles of the mesh in voxel units."""
+    vertices = mesh.vertices.double()
+    if normalize:
+        verts_max = vertices.max()
+        verts_min = vertices.min()
+        vertices = (vertices - verts_min) / (verts_max - verts_min)
+
+    vertices = vertices + vertex_offset
 
     if mesh.faces.shape[-1] == 4:
         tri_faces_1 = torch.cat((mesh.faces[:, :2], mesh.faces[:, 3:]), dim=1)
         tri_faces_2 = torch.cat((mesh.faces[:, :1], mesh.faces[:, 2:]), dim=1)
         faces = torch.cat((tri_faces_1, tri_faces_2))
     else:
-        faces = mesh.faces.clone()
+        faces = mesh.faces
+
+    return vertices[faces] * (resolution - 1)
 
-    v1 = torch.index_select(mesh.vertices, 0, faces[:, 0])
-    v2 = torch.index_select(mesh.vertices, 0, faces[:, 1])
-    v3 = torch.index_select(mesh.vertices, 0, faces[:, 2])
 
+def _voxelize_triangles(triangles, resolution, conservative,
+                        max_extent=3, chunk_size=2 ** 15):
+    """Linear indices of the unit voxels overlapped by the triangles, with
+    repeats."""
+    # large triangles are split in four, so that the candidate voxels of a
+    # triangle stay close to the ones it actually overlaps
+    done = []
     while True:
-        side_1 = (torch.abs(v1 - v2)**2).sum(dim=1).unsqueeze(1)
-        side_2 = (torch.abs(v2 - v3)**2).sum(dim=1).unsqueeze(1)
-        side_3 = (torch.abs(v3 - v1)**2).sum(dim=1).unsqueeze(1)
-        sides = torch.cat((side_1, side_2, side_3), dim=1)
-        sides = sides.max(dim=1)[0]
-
-        keep = sides > smallest_side
-        if keep.sum() == 0:
+        tri_min, tri_max = triangles.min(dim=1)[0], triangles.max(dim=1)[0]
+        large = (tri_max.floor() - tri_min.floor()).max(dim=1)[0] > max_extent
+        done.append((triangles[~large], tri_min[~large], tri_max[~large]))
+        if not large.any():
             break
-        v1 = v1[keep]
-        v2 = v2[keep]
-        v3 = v3[keep]
-        del(side_1, side_2, side_3, keep, sides)
-
-        v4 = (v1 + v3) / 2.
-        v5 = (v1 + v2) / 2.
-        v6 = (v2 + v3) / 2.
-
-        points = torch.cat((points, v4, v5, v6))
-
-        vertex_set = [v1, v2, v3, v4, v5, v6]
-        new_traingles = [[0, 3, 4], [4, 1, 5], [4, 3, 5], [3, 2, 5]]
-        new_verts = []
-
-        for i in range(4):
-            for j in range(3):
-                if i == 0:
-                    new_verts.append(vertex_set[new_traingles[i][j]])
-                else:
-                    new_verts[j] = torch.cat(
-                        (new_verts[j], vertex_set[new_traingles[i][j]]))
-        v1, v2, v3 = new_verts
-        del(v4, v5, v6, vertex_set, new_verts)
-
-    del(v1, v2, v3)
-
-    voxel = torch.zeros((resolution, resolution, resolution))
-    points = (points * (resolution - 1)).long()
-    points = torch.split(points.permute(1, 0), 1, dim=0)
-    points = [m.unsqueeze(0) for m in points]
-    voxel[points] = 1
-    return voxel
+        v1, v2, v3 = triangles[large].unbind(1)
+        v4, v5, v6 = (v1 + v2) / 2, (v2 + v3) / 2, (v3 + v1) / 2
+        triangles = torch.cat((torch.stack((v1, v4, v6), dim=1),
+                               torch.stack((v4, v2, v5), dim=1),
+                               torch.stack((v6, v5, v3), dim=1),
+                               torch.stack((v4, v5, v6), dim=1)))
+    triangles, tri_min, tri_max = [torch.cat(t) for t in zip(*done)]
+
+    # the voxels of the grid overlapping the bounding box, which is the
+    # separating axis test along the box axes. A vertex on the lower face of
+    # a voxel only touches it.
+    lower = tri_min.floor()
+    if conservative:
+        lower = tri_min.ceil() - 1
+    lower = lower.clamp(0, resolution).long()
+    upper = tri_max.floor().clamp(-1, resolution - 1).long()
+    extent = (upper - lower + 1).clamp(min=0)
+
+    # the other axes are tested in single precision, relative to the lower
+    # corner of every triangle. Half open voxels [i, i + 1) are tested as
+    # closed boxes moved slightly down, and closed voxels as slightly grown
+    # ones, so that surfaces lying on a voxel face are not decided by
+    # rounding.
+    eps = 1e-5
+    half = 0.5 + eps if conservative else 0.5
+    center = 0.5 if conservative else 0.5 - eps
+    local = (triangles - lower.unsqueeze(1).to(triangles.dtype)).float()
+    axes, axes_lower, axes_upper = _separating_axes(local, half)
+    # axes scaled to unit half width, with the offset of the middle as a
+    # fourth coordinate, so that a voxel center c meets the triangle when
+    # |(c, 1) . axis| <= 1 for all of them
+    width = (axes_upper - axes_lower) / 2
+    axes = torch.cat((axes, -(axes_lower + axes_upper).unsqueeze(2) / 2),
+                     dim=2)
+    # a degenerate triangle has null axes, which don't separate anything
+    axes = axes / width.masked_fill(width == 0, float('inf')).unsqueeze(2)
+
+    # candidates are the voxels of the bounding box of every triangle.
+    # Triangles are grouped by bounding box size, and the voxel centers of
+    # a box are projected on the axes of all its triangles at once.
+    base = max_extent + 3
+    group = (extent[:, 0] * base + extent[:, 1]) * base + extent[:, 2]
+    group, order = group.sort()
+    lower, extent, axes = lower[order], extent[order], axes[order]
+    counts = torch.unique_consecutive(group, return_counts=True)[1]
+    occupied = [torch.zeros(0, dtype=torch.long, device=triangles.device)]
+    end = 0
+    for count in counts.tolist():
+        start, end = end, end + count
+        size = extent[start].tolist()
+        if 0 in size:
+            continue
+        block = torch.stack(torch.meshgrid(
+            *[torch.arange(n, device=triangles.device) for n in size],
+            indexing='ij'), dim=-1).view(-1, 3)
+        centers = F.pad(block.float() + center, (0, 1), value=1.).t()
+        step = max(1, chunk_size // len(block))
+        for lo in range(start, end, step):
+            hi = min(lo + step, end)
+            projection = torch.mm(axes[lo:hi].view(-1, 4), centers).abs_()
+            projection = projection.view(hi - lo, -1, len(block))
+            overlap = projection.amax(dim=1) <= 1
+            tri, cell = overlap.nonzero().unbind(1)
+            cell = lower[lo:hi][tri] + block[cell]
+            occupied.append((cell[:, 0] * resolution + cell[:, 1]) *
+                            resolution + cell[:, 2])
+    return torch.cat(occupied)
+
+
+def _separating_axes(triangles, half):
+    """Axes of the separating axis test between triangles and boxes of half
+    size half, besides the box axes: the normal of the triangle and the
+    cross products of the box axes and the edges. A box of center c that
+    meets the bounding box of the triangle meets the triangle when
+    lower <= c . axis <= upper for all of them.
 
+    Args:
+        triangles (torch.Tensor): (N, 3, 3) triangles
+        half (float): half size of the boxes
 
-def trianglemesh_to_sdf(mesh: kaolin.rep.Mesh, num_points: int = 10000):
+    Returns:
+        (torch.Tensor, torch.Tensor, torch.Tensor): (N, 10, 3) axes and
+        (N, 10) lower and upper bounds
+    """
+    edges = triangles.roll(-1, dims=1) - triangles
+    axes = [torch.cross(edges[:, 0], edges[:, 1], dim=1).unsqueeze(1)]
+    for axis in range(3):
+        a = torch.zeros_like(edges)
+        a[..., (axis + 1) % 3] = -edges[..., (axis + 2) % 3]
+        a[..., (axis + 2) % 3] = edges[..., (axis + 1) % 3]
+        axes.append(a)
+    axes = torch.cat(axes, dim=1)
+
+    projection = torch.bmm(triangles, axes.transpose(1, 2))
+    radius = half * axes.abs().sum(dim=2)
+    lower = projection.min(dim=1)[0] - radius
+    upper = projection.max(dim=1)[0] + radius
+    return axes, lower, upper
+
+
+def _parity_fill(triangles, resolution):
+    """Voxels whose center is inside the surface, by the parity of the
+    crossings of the ray from the center towards +z."""
+    # counter clockwise triangles in the xy plane
+    xy = triangles[..., :2]
+    area = ((xy[:, 1, 0] - xy[:, 0, 0]) * (xy[:, 2, 1] - xy[:, 0, 1]) -
+            (xy[:, 1, 1] - xy[:, 0, 1]) * (xy[:, 2, 0] - xy[:, 0, 0]))
+    triangles = triangles[area != 0]
+    triangles = torch.where((area[area != 0] < 0).view(-1, 1, 1),
+                            triangles.flip(1), triangles)
+    xy = triangles[..., :2]
+
+    lower = (xy.min(dim=1)[0] - 0.5).ceil().clamp(0, resolution - 1).long()
+    upper = (xy.max(dim=1)[0] - 0.5).floor().clamp(-1, resolution - 1).long()
+    size = (upper - lower + 1).clamp(min=0)
+    counts = size.prod(dim=1)
+    tri = torch.arange(len(triangles), device=triangles.device)
+    tri = tri.repeat_interleave(counts)
+    offset = torch.arange(len(tri), device=triangles.device) - \
+        (torch.cumsum(counts, dim=0) - counts)[tri]
+    column = lower[tri] + torch.stack(
+        (offset // size[tri, 1], offset % size[tri, 1]), dim=1)
+    center = column.double() + 0.5
+
+    # edge functions, with a top-left rule so that a column through a
+    # shared edge or vertex crosses exactly one of the triangles
+    inside = torch.ones(len(tri), dtype=torch.bool, device=triangles.device)
+    weights = []
+    for e in range(3):
+        a, b = xy[tri, e], xy[tri, (e + 1) % 3]
+        edge = b - a
+        w = edge[:, 0] * (center[:, 1] - a[:, 1]) - \
+            edge[:, 1] * (center[:, 0] - a[:, 0])
+        top_left = (edge[:, 1] < 0) | ((edge[:, 1] == 0) & (edge[:, 0] < 0))
+        inside &= (w > 0) | ((w == 0) & top_left)
+        weights.append(w)
+    weights = torch.stack(weights, dim=1)[inside]
+    tri, column = tri[inside], column[inside]
+
+    # height of the crossing, weight of each vertex is the edge function of
+    # the opposite edge
+    z = triangles[tri, :, 2]
+    z = (weights[:, 1] * z[:, 0] + weights[:, 2] * z[:, 1] +
+         weights[:, 0] * z[:, 2]) / weights.sum(dim=1)
+
+    # every crossing flips the voxels whose center lies below it
+    below = (z - 0.5).ceil().clamp(0, resolution).long()
+    flips = torch.zeros(resolution ** 2 * (resolution + 1),
+                        device=triangles.device)
+    flips.index_add_(0, (column[:, 0] * resolution + column[:, 1]) *
+                     (resolution + 1) + below, torch.ones_like(z).float())
+    flips = flips.view(resolution, resolution, resolution + 1)
+    crossings = flips.flip(2).cumsum(dim=2).flip(2)[..., 1:]
+    return crossings.long() % 2 == 1
+
+
+def trianglemesh_to_sdf(mesh: kaolin.rep.Mesh, num_points: int = 10000,
+                        resolution: int = None):
     r""" Converts mesh to a SDF function
 
     Args:
         mesh (kaolin.rep.Mesh): mesh to convert.
-        num_points (int): number of points to sample on surface of the mesh.
+        num_points (int): unused, kept for backwards compatibility.
+        resolution (int): if given, resolution of a narrow band grid of
+            precomputed distances used to speed up queries near the surface.
 
     Returns:
-        sdf: a signed distance function
+        (kaolin.rep.MeshSDF): a signed distance function, returning exact
+        point to triangle distances, negative inside the mesh.
 
     Example:
         >>> mesh = kal.TriangleMesh.from_obj('object.obj')
@@ -157,14 +342,4 @@ def trianglemesh_to_sdf(mesh: kaolin.rep.Mesh, num_points: int = 10000):
         >>> points = torch.rand(100,3)
         >>> distances = sdf(points)
     """
-    surface_points, _ = mesh.sample(num_points)
-
-    def eval_query(query):
-        distances = directed_distance(query, surface_points, mean=False)
-        occ_points = kal.rep.SDF.check_sign(mesh, query)
-        if torch.is_tensor(occ_points):
-            occ_points = occ_points.cpu().numpy()[0]
-        distances[np.where(occ_points)] *= -1
-        return distances
-
-    return eval_query
+    return kal.rep.MeshSDF(mesh, resolution=resolution)
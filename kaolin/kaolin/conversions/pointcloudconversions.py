@@ -12,7 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from typing import Union
+from typing import Optional, Union
 
 import torch
 import os
@@ -21,16 +21,121 @@ import numpy as np
 import trimesh
 
 from kaolin.rep.PointCloud import PointCloud
-from kaolin.metrics.point import directed_distance
+from kaolin.rep.SparseVoxelGrid import SparseVoxelGrid
 from kaolin import helpers
 from kaolin.conversions.voxelgridconversions import voxelgrid_to_trianglemesh
 from kaolin.conversions.voxelgridconversions import voxelgrid_to_sdf
 
 
 def pointcloud_to_voxelgrid(pts: Union[torch.Tensor, PointCloud, np.ndarray],
-                        voxres: int, voxsize: float):
+                            voxres: int, voxsize: float,
+                            radius: Optional[float] = None,
+                            reduce: str = 'occupancy',
+                            features: Optional[torch.Tensor] = None):
     r"""Converts a pointcloud into a voxel grid.
 
+    Each point is scattered directly into the cells whose center lies within
+    ``radius`` of it, so the cost grows with the number of points rather than
+    with the size of the grid. Cell :math:`i` is centered at
+    :math:`voxsize \cdot (i - (voxres - 1) / 2)`, and points outside the grid
+    are dropped.
+
+    Args:
+        - pts (torch.Tensor or PointCloud): Pointcloud
+            (shape: :math:`N \times 3`, where :math:`N` is the number of points
+            in the pointcloud), or batch of pointclouds
+            (shape: :math:`B \times N \times 3`).
+        - voxres (int): Resolution of the voxel grid.
+        - voxsize (float): size of each voxel grid cell.
+        - radius (float, optional): distance from a point within which cells
+            are marked (default: voxsize). The cell containing the point is
+            always marked.
+        - reduce (str):
+            -'occupancy': 1 for the marked cells, 0 elsewhere.
+            -'count': number of points marking each cell.
+            -'mean': mean of the features of the points marking each cell.
+        - features (torch.Tensor, optional): features of the points for
+            ``reduce='mean'`` (shape: :math:`N \times C`, or
+            :math:`B \times N \times C` for a batch).
+
+    Returns:
+        (torch.Tensor): Voxel grid (shape: :math:`voxres^3`, with a leading
+        batch dimension for a batch of pointclouds and a trailing :math:`C`
+        dimension for features).
+
+    Example:
+        >>> pts = torch.rand(1000, 3) - .5
+        >>> voxels = pointcloud_to_voxelgrid(pts, 32, 1. / 32)
+        >>> voxels.shape
+        torch.Size([32, 32, 32])
+    """
+    assert reduce in ['occupancy', 'count', 'mean'], \
+        'reduce must be occupancy, count or mean'
+    assert (reduce == 'mean') == (features is not None), \
+        'features are needed for, and only used by, reduce=mean'
+
+    if isinstance(pts, PointCloud):
+        pts = pts.points
+    helpers._assert_tensor(pts)
+    batched = pts.dim() == 3
+    pts = pts.view(-1, pts.shape[-2], 3)
+    batch_size, num_points = pts.shape[:2]
+
+    point_idx, cells = _cells_near_points(pts.view(-1, 3), voxres, voxsize,
+                                          radius)
+    batch_idx = point_idx // num_points
+    keys = ((batch_idx * voxres + cells[:, 0]) * voxres + cells[:, 1]) * \
+        voxres + cells[:, 2]
+
+    num_cells = batch_size * voxres ** 3
+    if reduce == 'occupancy':
+        voxels = torch.zeros(num_cells, device=pts.device)
+        voxels[keys] = 1
+    else:
+        voxels = torch.zeros(num_cells, device=pts.device).index_add_(
+            0, keys, torch.ones(keys.shape[0], device=pts.device))
+    if reduce == 'mean':
+        features = features.reshape(batch_size * num_points, -1)
+        sums = torch.zeros(num_cells, features.shape[-1], dtype=features.dtype,
+                           device=pts.device)
+        sums.index_add_(0, keys, features[point_idx])
+        voxels = sums / voxels.clamp(min=1).unsqueeze(-1).to(sums.dtype)
+
+    voxels = voxels.view(batch_size, voxres, voxres, voxres,
+                         *voxels.shape[1:])
+    return voxels if batched else voxels[0]
+
+
+def _cells_near_points(pts: torch.Tensor, voxres: int, voxsize: float,
+                       radius: Optional[float] = None):
+    r"""Pairs of point indices and cells of the grid of
+    :func:`pointcloud_to_voxelgrid` with centers within radius of the point,
+    plus the cell containing each point.
+    """
+    reach = 1. if radius is None else radius / voxsize
+    # continuous grid coordinates of the points, the cells within reach of a
+    # point are at most reach + 1 / 2 away from the nearest one
+    grid_pts = pts.double() / voxsize + (voxres - 1) / 2
+    steps = int(np.floor(reach + .5))
+    offsets = torch.arange(-steps, steps + 1, device=pts.device)
+    offsets = torch.stack(torch.meshgrid(offsets, offsets, offsets,
+                                         indexing='ij'), dim=-1).view(-1, 3)
+    cells = grid_pts.round().long().unsqueeze(1) + offsets
+    close = ((cells.double() - grid_pts.unsqueeze(1)) ** 2).sum(dim=-1) <= \
+        reach ** 2
+    close[:, offsets.shape[0] // 2] = True
+    inside = ((cells >= 0) & (cells < voxres)).all(dim=-1)
+    point_idx, offset_idx = (close & inside).nonzero(as_tuple=True)
+    return point_idx, cells[point_idx, offset_idx]
+
+
+def pointcloud_to_sparsevoxelgrid(pts: Union[torch.Tensor, PointCloud],
+                                  voxres: int, voxsize: float):
+    r"""Converts a pointcloud into a sparse voxel grid, laid out like the
+    grid of :func:`pointcloud_to_voxelgrid`: cell :math:`i` is centered at
+    :math:`voxsize \cdot (i - (voxres - 1) / 2)`. A cell is occupied when a
+    point lies within voxsize of its center.
+
     Args:
         - pts (torch.Tensor or PointCloud): Pointcloud
             (shape: :math:`N \times 3`, where :math:`N` is the number of points
@@ -39,43 +144,22 @@ def pointcloud_to_voxelgrid(pts: Union[torch.Tensor, PointCloud, np.ndarray],
         - voxsize (float): size of each voxel grid cell.
 
     Returns:
-        (torch.Tensor): Voxel grid.
+        (kaolin.rep.SparseVoxelGrid): occupied voxels.
     """
 
     if isinstance(pts, PointCloud):
         pts = pts.points
     helpers._assert_tensor(pts)
 
-    # Create a voxel grid.
-    voxels= np.zeros((voxres, voxres, voxres), dtype=np.float32)
-    # Enumerate the coordinates of each grid cell
-    gridpts = np.where(voxels==0)
-    gridpts = np.asarray([gridpts[0], gridpts[1], gridpts[2]]).T.astype(
-        np.float32)
-    gridpts = torch.from_numpy(gridpts)
-    # Scale grid coordinates appropriately. We currently have coordinated
-    # denoting the corners of a voxel; modify so that we represent the center.
-    gridpts = voxsize * (gridpts - (voxres-1)/2)
-    # Get the distance of the closest point in the pointcloud to each grid
-    # point.
-    dists = directed_distance(gridpts.cuda().view(-1, 3).contiguous(),
-                              pts.cuda().view(-1, 3).contiguous(), mean=False)
-    dists = dists.view((voxres, voxres, voxres))
-    # If this distance is less than the size of a voxel, treat as occupied,
-    # else free.
-    on_voxels = np.where(dists.cpu().numpy() <= voxsize)
-    voxels[on_voxels] = 1
-
-    return voxels
+    _, cells = _cells_near_points(pts.view(-1, 3), voxres, voxsize)
+    return SparseVoxelGrid(cells, resolution=voxres)
 
 
 def pointcloud_to_trianglemesh(points: torch.Tensor):
-    device = points.device
     voxels = pointcloud_to_voxelgrid(points, 32, 0.1)
-    return voxelgrid_to_trianglemesh(torch.from_numpy(voxels).to(device))
+    return voxelgrid_to_trianglemesh(voxels)
 
 
 def pointcloud_to_sdf(points: torch.Tensor, num_points=5000):
-    device = points.device
     voxels = pointcloud_to_voxelgrid(points, 32, 0.1)
-    return voxelgrid_to_sdf(torch.from_numpy(voxels).to(device))
+    return voxelgrid_to_sdf(voxels)
@@ -35,6 +35,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+
 import torch
 import os
 import torch.nn.functional as F
@@ -42,18 +45,22 @@ import numpy as np
 import trimesh
 
 from kaolin.mise import MISE
+from kaolin.mcubes import marching_cubes_sparse
 import kaolin
 import kaolin as kal
 
 
 def sdf_to_voxelgrid(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
                      bbox_dim: float = 1., resolution: int = 32,
-                     upsampling_steps: int = 2):
+                     upsampling_steps: int = 2,
+                     batch_size: Optional[int] = None,
+                     num_workers: Optional[int] = None):
     r"""Converts an SDF to a voxel grid.
 
     Args:
         sdf (kaolin.rep.SDF) : an object with a .eval_occ function that
-            indicates which of a set of passed points is inside the surface.
+            indicates which of a set of passed points is inside the surface,
+            or a list of them, converted concurrently.
         bbox_center (float): center of the surface's bounding box.
         bbox_dim (float): largest dimension of the surface's bounding box.
         resolution (int) : the initial resolution of the voxel, should be
@@ -61,43 +68,38 @@ def sdf_to_voxelgrid(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
         upsampling_steps (int) : Number of times the initial resolution will
             be doubled.
             The returned resolution will be resolution * (2 ^ upsampling_steps)
+        batch_size (int): largest number of points passed to the SDF at once
+            (default: all the points of a refinement step).
+        num_workers (int): number of threads evaluating batches of points,
+            or converting the SDFs of a list (default: number of CPUs).
 
     Returns:
-        (torch.Tensor): a voxel grid
+        (torch.Tensor): a voxel grid, or a list of them for a list of SDFs
 
     Example:
         >>> sdf = kal.rep.SDF.sphere()
         >>> voxel = kal.conversions.sdf_to_voxelgrid(sdf, bbox_dim = 2)
     """
+    def convert(sdf, num_workers):
+        mesh_extractor = _evaluate_mise(sdf, bbox_center, bbox_dim,
+                                        resolution, upsampling_steps,
+                                        batch_size, num_workers)
+        return torch.FloatTensor(mesh_extractor.to_dense())
 
-    mesh_extractor = MISE(
-        resolution, upsampling_steps, .5)
-
-    points = mesh_extractor.query()
-    while points.shape[0] != 0:
-        # Query points
-        pointsf = torch.FloatTensor(points)
-        # Normalize to bounding box
-        pointsf = pointsf / (mesh_extractor.resolution - 1)
-        pointsf = bbox_dim * (pointsf + (bbox_center - 0.5))
-        values = sdf(pointsf) <= 0
-        values = values.data.cpu().numpy().astype(np.float64)
-        mesh_extractor.update(points, values)
-        points = mesh_extractor.query()
-
-    voxels = torch.FloatTensor(mesh_extractor.to_dense())
-
-    return voxels
+    return _map_sdfs(convert, sdf, num_workers)
 
 
 def sdf_to_trianglemesh(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
                         bbox_dim: float = 1., resolution: int = 32,
-                        upsampling_steps: int = 2):
+                        upsampling_steps: int = 2,
+                        batch_size: Optional[int] = None,
+                        num_workers: Optional[int] = None):
     r""" Converts an SDF function to a mesh
 
     Args:
         sdf (kaolin.rep.SDF): an object with a .eval_occ function that
-            indicates which of a set of passed points is inside the surface.
+            indicates which of a set of passed points is inside the surface,
+            or a list of them, converted concurrently.
         bbox_center (float): center of the surface's bounding box.
         bbox_dim (float): largest dimension of the surface's bounding box.
         resolution (int) : the initial resolution of the voxel, should be large
@@ -105,9 +107,19 @@ def sdf_to_trianglemesh(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
         upsampling_steps (int) : Number of times the initial resolution will be
             doubled.
             The returned resolution will be resolution * (2 ^ upsampling_steps)
+        batch_size (int): largest number of points passed to the SDF at once
+            (default: all the points of a refinement step).
+        num_workers (int): number of threads evaluating batches of points,
+            or converting the SDFs of a list (default: number of CPUs).
 
     Returns:
-        (torch.Tensor): computed mesh preperties
+        (torch.Tensor): computed mesh preperties, or lists of them for a list
+        of SDFs
+
+    Note:
+        Marching cubes only visits the cells of the refined grid crossing
+        the surface, so time and memory grow with the area of the surface
+        rather than the volume of the grid.
 
     Example:
         >>> sdf = kal.rep.SDF.sphere()
@@ -115,20 +127,37 @@ def sdf_to_trianglemesh(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
         >>> mesh = kal.rep.TriangleMesh.from_tensors(verts, faces)
 
     """
-    voxel = sdf_to_voxelgrid(sdf, bbox_center, bbox_dim,
-                             resolution, upsampling_steps)
-    verts, faces = kal.conversions.voxelgrid_to_trianglemesh(voxel)
-    return verts, faces
+    def convert(sdf, num_workers):
+        mesh_extractor = _evaluate_mise(sdf, bbox_center, bbox_dim,
+                                        resolution, upsampling_steps,
+                                        batch_size, num_workers)
+        # empty padding closes the surface on the border of the bounding box
+        cells, values = mesh_extractor.to_sparse(padding=0.)
+        num_points = mesh_extractor.resolution + 1
+        verts, faces = marching_cubes_sparse(cells, values, num_points, .5)
+        verts = torch.FloatTensor(verts)
+        faces = torch.LongTensor(faces)
+        # same normalization as voxelgrid_to_trianglemesh on the dense grid
+        verts = verts / num_points - .5
+        return verts, faces
+
+    meshes = _map_sdfs(convert, sdf, num_workers)
+    if isinstance(sdf, (list, tuple)):
+        return [m[0] for m in meshes], [m[1] for m in meshes]
+    return meshes
 
 
 def sdf_to_pointcloud(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
                       bbox_dim: float = 1., resolution: int = 32,
-                      upsampling_steps: int = 2, num_points: int = 5000):
+                      upsampling_steps: int = 2, num_points: int = 5000,
+                      batch_size: Optional[int] = None,
+                      num_workers: Optional[int] = None):
     r"""Converts an SDF fucntion to a point cloud.
 
     Args:
         sdf (kaolin.rep.SDF) : an object with a .eval_occ function that
-            indicates which of a set of passed points is inside the surface.
+            indicates which of a set of passed points is inside the surface,
+            or a list of them, converted concurrently.
         bbox_center (float): center of the surface's bounding box.
         bbox_dim (float): largest dimension of the surface's bounding box.
         resolution (int) : the initial resolution of the voxel, should be large
@@ -137,9 +166,14 @@ def sdf_to_pointcloud(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
             doubled.
             The returned resolution will be resolution * (2 ^ upsampling_steps)
         num_points (int): number of points in computed point cloud.
+        batch_size (int): largest number of points passed to the SDF at once
+            (default: all the points of a refinement step).
+        num_workers (int): number of threads evaluating batches of points,
+            or converting the SDFs of a list (default: number of CPUs).
 
     Returns:
-        (torch.FloatTensor): computed point cloud
+        (torch.FloatTensor): computed point cloud, or a list of them for a
+        list of SDFs
 
     Example:
         >>> sdf = kal.rep.SDF.sphere()
@@ -147,6 +181,76 @@ def sdf_to_pointcloud(sdf: kaolin.rep.SDF, bbox_center: float = 0.,
 
     """
     verts, faces = sdf_to_trianglemesh(sdf, bbox_center, bbox_dim,
-                                        resolution, upsampling_steps)
+                                       resolution, upsampling_steps,
+                                       batch_size, num_workers)
+    if isinstance(sdf, (list, tuple)):
+        return [kal.rep.TriangleMesh.from_tensors(v, f).sample(num_points)[0]
+                for v, f in zip(verts, faces)]
     mesh = kal.rep.TriangleMesh.from_tensors(verts, faces)
     return mesh.sample(num_points)[0]
+
+
+def _map_sdfs(convert, sdf, num_workers):
+    r"""Applies convert(sdf, num_workers) to an SDF, or concurrently to a
+    list of SDFs, each of them then evaluated by a single thread.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+    if not isinstance(sdf, (list, tuple)):
+        return convert(sdf, num_workers)
+    if num_workers == 1 or len(sdf) <= 1:
+        return [convert(s, 1) for s in sdf]
+    with ThreadPoolExecutor(num_workers) as pool:
+        return list(pool.map(lambda s: convert(s, 1), sdf))
+
+
+def _evaluate_mise(sdf, bbox_center, bbox_dim, resolution, upsampling_steps,
+                   batch_size=None, num_workers=1):
+    r"""Evaluates the occupancy of an SDF on a grid refined around its
+    surface.
+
+    The points of every refinement step are evaluated in batches of at most
+    batch_size points, by num_workers threads. The results of finished
+    batches are gathered while the next ones are evaluated, and the buffers
+    holding the points and their values are reused across steps.
+
+    Returns:
+        (kaolin.mise.MISE): the refined grid
+    """
+    mesh_extractor = MISE(
+        resolution, upsampling_steps, .5)
+    pool = ThreadPoolExecutor(num_workers) if num_workers > 1 else None
+    pointsf = torch.empty(0, 3)
+    values = np.empty(0)
+
+    try:
+        points = mesh_extractor.query()
+        while points.shape[0] != 0:
+            num_points = points.shape[0]
+            if pointsf.shape[0] < num_points:
+                pointsf = torch.empty(num_points, 3)
+                values = np.empty(num_points)
+            # Normalize to bounding box
+            batch = pointsf[:num_points].copy_(torch.from_numpy(points))
+            batch.div_(mesh_extractor.resolution - 1)
+            batch.add_(bbox_center - 0.5).mul_(bbox_dim)
+
+            # Query points
+            step = batch_size or num_points
+            chunks = [(i, min(i + step, num_points))
+                      for i in range(0, num_points, step)]
+            occupancy = (lambda c: sdf(batch[c[0]:c[1]]) <= 0)
+            if pool is None or len(chunks) == 1:
+                occupied = map(occupancy, chunks)
+            else:
+                occupied = pool.map(occupancy, chunks)
+            values_t = torch.from_numpy(values)
+            for (lo, hi), occ in zip(chunks, occupied):
+                values_t[lo:hi].copy_(occ.detach().view(-1))
+
+            mesh_extractor.update(points, values[:num_points])
+            points = mesh_extractor.query()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    return mesh_extractor
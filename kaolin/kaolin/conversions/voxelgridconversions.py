@@ -42,12 +42,13 @@ import os
 import torch.nn.functional as F
 import numpy as np
 import kaolin as kal
-import trimesh
+from concurrent.futures import ThreadPoolExecutor
 from scipy import ndimage
 
 # from kaolin.transforms import voxelfunc
-from kaolin.rep import VoxelGrid
+from kaolin.rep import VoxelGrid, SparseVoxelGrid
 from kaolin import helpers
+from kaolin.mcubes import marching_cubes_contiguous
 
 
 def downsample(voxel: Union[torch.Tensor, VoxelGrid], scale: List[int],
@@ -60,7 +61,8 @@ def downsample(voxel: Union[torch.Tensor, VoxelGrid], scale: List[int],
 
     Args:
         voxel (torch.Tensor): Voxel grid to be downsampled (shape: must
-            be a tensor containing exactly 3 dimensions).
+            be a tensor containing exactly 3 dimensions), or a batch of
+            voxel grids (shape: :math:`B \times D \times H \times W`).
         scale (list): List of tensors to scale each dimension down by
             (length: 3).
         inplace (bool, optional): Bool to make the operation in-place.
@@ -78,7 +80,7 @@ def downsample(voxel: Union[torch.Tensor, VoxelGrid], scale: List[int],
     """
     if isinstance(voxel, VoxelGrid):
         voxel = voxel.voxels
-    voxel = confirm_def(voxel)
+    voxel = confirm_def(voxel, batched=True)
 
     if not inplace:
         voxel = voxel.clone()
@@ -91,16 +93,17 @@ def downsample(voxel: Union[torch.Tensor, VoxelGrid], scale: List[int],
         if scale[i] < 1:
             raise ValueError('Downsample ratio must be at least 1 along every'
                 ' dimension.')
-        if scale[i] >= voxel.shape[i]:
+        if scale[i] >= voxel.shape[i - 3]:
             raise ValueError('Downsample ratio must be less than voxel shape'
                 ' along every dimension.')
         scale_filter.append(scale[i])
         scale_factor *= scale[i]
     conv_filter = torch.ones(scale_filter).to(voxel.device) / scale_factor
 
-    voxel = F.conv3d(voxel.unsqueeze(0).unsqueeze(
-        0), conv_filter, stride=scale, padding=0)
-    voxel = voxel.squeeze(0).squeeze(0)
+    batch = voxel.shape[:-3]
+    voxel = F.conv3d(voxel.reshape(-1, 1, *voxel.shape[-3:]), conv_filter,
+                     stride=scale, padding=0)
+    voxel = voxel.view(batch + voxel.shape[-3:])
 
     return voxel
 
@@ -113,7 +116,8 @@ def upsample(voxel: torch.Tensor, dim: int):
 
     Args:
         voxel (torch.Tensor): Voxel grid to be upsampled (shape: must
-            be a 3D tensor)
+            be a 3D tensor), or a batch of voxel grids (shape:
+            :math:`B \times D \times H \times W`).
         dim (int): New dimensionality (number of voxels along each dimension
             in the resulting voxel grid).
 
@@ -130,39 +134,25 @@ def upsample(voxel: torch.Tensor, dim: int):
     """
     if isinstance(voxel, VoxelGrid):
         voxel = voxel.voxels
-    voxel = confirm_def(voxel)
+    voxel = confirm_def(voxel, batched=True)
 
-    cur_shape = voxel.shape
+    cur_shape = voxel.shape[-3:]
     assert (dim >= cur_shape[0]) and ((dim >= cur_shape[1]) and (
         dim >= cur_shape[2])), 'All dim values must be larger then current dim'
 
-    new_positions = []
-    old_positions = []
-
-    # Defining position correspondences
+    # every new voxel takes the value of the old voxel it falls in, axis by
+    # axis
+    scaled_voxel = voxel.float()
+    new_pos = torch.arange(dim, device=voxel.device, dtype=torch.double)
     for i in range(3):
-        shape_params = [1, 1, 1]
-        shape_params[i] = dim
-        new_pos = np.arange(dim).reshape(shape_params)
-
-        for j in range(3):
-            if i == j:
-                continue
-            new_pos = np.repeat(new_pos, dim, axis=j)
-        new_pos = new_pos.reshape(-1)
-
-        ratio = float(cur_shape[i]) / float(dim)
-        old_pos = (new_pos * ratio).astype(int)
-
-        new_positions.append(new_pos)
-        old_positions.append(old_pos)
-
-    scaled_voxel = torch.FloatTensor(np.zeros([dim, dim, dim])).to(
-        voxel.device)
-    if voxel.is_cuda:
-        scaled_voxel = scaled_voxel.cuda()
-
-    scaled_voxel[tuple(new_positions)] = voxel[tuple(old_positions)]
+        axis = i - 3
+        if dim % cur_shape[i] == 0:
+            scaled_voxel = scaled_voxel.repeat_interleave(
+                dim // cur_shape[i], dim=axis)
+        else:
+            ratio = float(cur_shape[i]) / float(dim)
+            old_pos = (new_pos * ratio).long()
+            scaled_voxel = scaled_voxel.index_select(axis, old_pos)
 
     return scaled_voxel
 
@@ -171,8 +161,16 @@ def fill(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
     r""" Fills the internal structures in a voxel grid. Used to fill holds
     and 'solidify' objects.
 
+    Empty voxels are kept when they are connected to the border of the grid
+    through empty voxels sharing a face, as in
+    :func:`scipy.ndimage.binary_fill_holes`. On GPU the outside is flood
+    filled from the border, along whole runs of empty voxels at each step,
+    and on CPU it is found among the components of
+    :func:`scipy.ndimage.label`, with one call for the whole batch.
+
     Args:
-        voxel (torch.Tensor): Voxel grid to be filled.
+        voxel (torch.Tensor): Voxel grid to be filled, or a batch of voxel
+            grids (shape: :math:`B \times D \times H \times W`).
         thresh (float): Threshold to use for binarization of the grid.
 
     Returns:
@@ -181,22 +179,66 @@ def fill(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
 
     if isinstance(voxel, VoxelGrid):
         voxel = voxel.voxels
-    voxel = confirm_def(voxel)
+    voxel = confirm_def(voxel, batched=True)
     voxel = threshold(voxel, thresh)
-    voxel = voxel.clone()
-    on = ndimage.binary_fill_holes(voxel.data.cpu())
-    voxel[np.where(on)] = 1
-    return voxel
+    empty = voxel == 0
+
+    # empty voxels on the border of the grid
+    border = torch.zeros_like(empty)
+    for axis in [-3, -2, -1]:
+        border.narrow(axis, 0, 1).fill_(True)
+        border.narrow(axis, voxel.shape[axis] - 1, 1).fill_(True)
+
+    if voxel.is_cuda:
+        outside = empty & border
+        count = -1
+        while count != int(outside.sum()):
+            count = int(outside.sum())
+            for axis in [-3, -2, -1]:
+                outside = _fill_runs(outside, empty, axis)
+    else:
+        structure = ndimage.generate_binary_structure(3, 1)
+        if voxel.dim() == 4:
+            # no connection across the batch
+            structure = np.stack((np.zeros_like(structure), structure,
+                                  np.zeros_like(structure)))
+        labels, _ = ndimage.label(empty.numpy(), structure)
+        labels = torch.from_numpy(labels)
+        outside = torch.zeros(labels.max() + 1, dtype=torch.bool)
+        outside[labels[border]] = True
+        outside[0] = False
+        outside = outside[labels]
+
+    return (~outside).float()
+
+
+def _fill_runs(marked: torch.Tensor, empty: torch.Tensor, axis: int):
+    r""" Marks the runs of empty voxels along an axis which contain a
+    marked voxel.
+    """
+    # voxels of a run share the number of occupied voxels before them
+    run = torch.cumsum(~empty, dim=axis, dtype=torch.int32)
+    before = torch.where(marked, run, torch.full_like(run, -1))
+    before = torch.cummax(before, dim=axis)[0]
+    after = torch.where(marked, run, torch.full_like(run, run.numel()))
+    after = torch.cummin(after.flip(axis), dim=axis)[0].flip(axis)
+    return empty & ((before == run) | (after == run))
 
 
 def extract_odms(voxel: Union[torch.Tensor, VoxelGrid]):
     r"""Extracts an orthographic depth map from a voxel grid.
 
+    The depth of a pixel is the number of empty voxels in front of the first
+    occupied one along its column, or the size of the grid if the column is
+    empty. The six views look along -z, +z, -y, +y, -x and +x.
+
     Args:
-        voxel (torch.Tensor): Voxel grid from which odms are extracted.
+        voxel (torch.Tensor): Voxel grid from which odms are extracted, or a
+            batch of grids (shape: :math:`B \times D \times D \times D`).
 
     Returns:
-        (torch.Tensor): 6 ODMs from the 6 primary viewing angles.
+        (torch.Tensor): 6 ODMs from the 6 primary viewing angles, for every
+        grid of the batch.
 
     Example:
         >>> voxel = torch.ones([128,128,128])
@@ -206,108 +248,90 @@ def extract_odms(voxel: Union[torch.Tensor, VoxelGrid]):
     """
     if isinstance(voxel, VoxelGrid):
         voxel = voxel.voxels
-    voxel = confirm_def(voxel)
-    cuda = voxel.is_cuda
-    voxel = extract_surface(voxel)
-    voxel = voxel.data.cpu().numpy()
+    voxel = confirm_def(voxel, batched=True)
+    voxel = threshold(voxel, .5)
+    occupied = voxel == 1
 
     dim = voxel.shape[-1]
-    a, b, c = np.where(voxel == 1)
-    big_list = [[[[dim, dim]
-                  for j in range(dim)] for i in range(dim)] for k in range(3)]
-    for i, j, k in zip(a, b, c):
-        big_list[0][i][j][0] = (min(dim - k - 1, big_list[0][i][j][0]))
-        big_list[0][i][j][1] = (min(k, big_list[0][i][j][1]))
-        big_list[1][i][k][0] = (min(dim - j - 1, big_list[1][i][k][0]))
-        big_list[1][i][k][1] = (min(j, big_list[1][i][k][1]))
-        big_list[2][j][k][0] = (min(dim - i - 1, big_list[2][j][k][0]))
-        big_list[2][j][k][1] = (min(i, big_list[2][j][k][1]))
-
-    odms = np.zeros((6, dim, dim))
-    big_list = np.array(big_list)
-    for k in range(6):
-        odms[k] = big_list[k // 2, :, :, k % 2]
-    odms = torch.FloatTensor(np.array(odms))
-
-    if cuda:
-        odms = odms.cuda()
-
-    return odms
+    index = torch.arange(dim, device=voxel.device)
+    odms = []
+    for axis in [-1, -2, -3]:
+        shape = [dim if a == axis else 1 for a in [-3, -2, -1]]
+        column = index.view(shape)
+        last = torch.where(occupied, column, torch.full_like(column, -1))
+        last = last.max(dim=axis)[0]
+        first = torch.where(occupied, column, torch.full_like(column, dim))
+        first = first.min(dim=axis)[0]
+        odms.append(torch.where(last >= 0, dim - 1 - last,
+                                torch.full_like(last, dim)))
+        odms.append(first)
+    return torch.stack(odms, dim=-3).float()
 
 
 def project_odms(odms: torch.Tensor,
                  voxel: torch.Tensor = None, votes: int = 1):
     r"""Projects orthographic depth map onto a voxel array.
 
+    Every depth carves the voxels in front of it along its column, and a
+    voxel stays occupied until it has been carved by ``votes`` views.
+
     .. Note::
         If no voxel grid is provided, we poject onto a completely filled grid.
 
     Args:
-        odms (torch.Tensor): ODMs which are to be projected.
+        odms (torch.Tensor): ODMs which are to be projected, as extracted by
+            :func:`extract_odms`, or a batch of them (shape:
+            :math:`B \times 6 \times D \times D`). Views after the sixth
+            are projected like the sixth.
         voxel (torch.Tensor): Voxel grid onto which ODMs are projected.
+        votes (int): number of views which must carve a voxel to remove it.
 
     Returns:
         (torch.Tensor): Updated voxel grid.
 
     Example:
         >>> odms = torch.rand([6,128,128])*128
-        >>> odms = voxel.int()
+        >>> odms = odms.int()
         >>> voxel = project_odms(odms)
         >>> voxel.shape
         torch.Size([128, 128, 128])
     """
-    cuda = odms.is_cuda
     dim = odms.shape[-1]
-    subtractor = 1. / float(votes)
+    batch = odms.shape[:-3]
 
     if voxel is None:
-        voxel = torch.ones((dim, dim, dim))
+        voxel = torch.ones(batch + (dim, dim, dim), device=odms.device)
     else:
-        for i in range(3):
-            assert (voxel.shape[i] == odms.shape[-1]
-                    ), 'Voxel and odm dimension size must be the same'
         if isinstance(voxel, VoxelGrid):
             voxel = voxel.voxels
-        voxel = confirm_def(voxel)
-        voxel = threshold(voxel, .5)
-    voxel = voxel.data.cpu().numpy()
-    odms = odms.data.cpu().numpy()
-
-    for i in range(3):
-        odms[2 * i] = dim - odms[2 * i]
-
-    depths = np.where(odms <= dim)
-    for x, y, z in zip(*depths):
-        pos = int(odms[x, y, z])
-        if x == 0:
-            voxel[y, z, pos:dim] -= subtractor
-        elif x == 1:
-            voxel[y, z, 0:pos] -= subtractor
-        elif x == 2:
-            voxel[y, pos:dim, z] -= subtractor
-        elif x == 3:
-            voxel[y, 0:pos, z] -= subtractor
-        elif x == 4:
-            voxel[pos:dim, y, z] -= subtractor
+        assert voxel.shape[-3:] == (dim, dim, dim), \
+            'Voxel and odm dimension size must be the same'
+        voxel = confirm_def(voxel, batched=True)
+        voxel = threshold(voxel, .5, inplace=False).to(odms.device)
+
+    # number of views carving every voxel
+    carved = torch.zeros(voxel.shape, dtype=torch.long, device=odms.device)
+    index = torch.arange(dim, device=odms.device)
+    for view in range(odms.shape[-3]):
+        depth = odms[..., view, :, :]
+        axis = [-1, -2, -3][min(view, 5) // 2]
+        # the depth map is indexed by the two other axes, in order
+        depth = depth.unsqueeze(axis)
+        column = index.view([dim if a == axis else 1 for a in [-3, -2, -1]])
+        if view % 2 == 0 and view < 5:
+            carved += column >= (dim - depth).long()
         else:
-            voxel[0:pos, y, z] -= subtractor
+            carved += (column < depth.long()) & (depth <= dim)
 
-    on = np.where(voxel > 0)
-    off = np.where(voxel <= 0)
-    voxel[on] = 1
-    voxel[off] = 0
-
-    voxel = confirm_def(voxel)
-    if cuda:
-        voxel = voxel.cuda()
-    return voxel
+    return (voxel - carved.float() / votes > 0).float()
 
 
-def confirm_def(voxgrid: torch.Tensor):
+def confirm_def(voxgrid: torch.Tensor, batched: bool = False):
     r""" Checks that the definition of the voxelgrid is correct.
 
     Args:
         voxgrid (torch.Tensor): Passed voxelgrid.
+        batched (bool): Whether a batch of voxel grids is also accepted.
 
     Return:
         (torch.Tensor): Voxel grid as torch.Tensor.
@@ -316,7 +340,11 @@ def confirm_def(voxgrid: torch.Tensor):
     if isinstance(voxgrid, np.ndarray):
         voxgrid = torch.Tensor(voxgrid)
     helpers._assert_tensor(voxgrid)
-    helpers._assert_dim_eq(voxgrid, 3)
+    if batched:
+        assert voxgrid.dim() in [3, 4], \
+            'Expected a voxel grid or a batch of voxel grids'
+    else:
+        helpers._assert_dim_eq(voxgrid, 3)
     assert ((voxgrid.max() <= 1.) and (voxgrid.min() >= 0.)
             ), 'All values in passed voxel grid must be in range [0,1]'
     return voxgrid
@@ -349,7 +377,9 @@ def extract_surface(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
     r"""Removes any inernal structure(s) from a voxel array.
 
     Args:
-        voxel (torch.Tensor): voxel array from which to extract surface
+        voxel (torch.Tensor): voxel array from which to extract surface, or a
+            batch of voxel arrays (shape: :math:`B \times D \times H \times
+            W`).
         thresh (float): threshold with which to binarize
 
     Returns:
@@ -358,19 +388,16 @@ def extract_surface(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
 
     if isinstance(voxel, VoxelGrid):
         voxel = voxel.voxels
-    voxel = confirm_def(voxel)
+    voxel = confirm_def(voxel, batched=True)
     voxel = threshold(voxel, thresh)
     off_positions = voxel == 0
 
-    conv_filter = torch.ones((1, 1, 3, 3, 3))
-    surface_voxel = torch.zeros(voxel.shape)
-    if voxel.is_cuda:
-        conv_filter = conv_filter.cuda()
-        surface_voxel = surface_voxel.cuda()
+    conv_filter = torch.ones((1, 1, 3, 3, 3), device=voxel.device)
+    surface_voxel = torch.zeros(voxel.shape, device=voxel.device)
 
-    local_occupancy = F.conv3d(voxel.unsqueeze(
-        0).unsqueeze(0), conv_filter, padding=1)
-    local_occupancy = local_occupancy.squeeze(0).squeeze(0)
+    local_occupancy = F.conv3d(voxel.reshape(-1, 1, *voxel.shape[-3:]),
+                               conv_filter, padding=1)
+    local_occupancy = local_occupancy.view(voxel.shape)
     # only elements with exposed faces
     surface_positions = (local_occupancy < 27) * (local_occupancy > 0)
     surface_voxel[surface_positions] = 1
@@ -443,21 +470,30 @@ def voxelgrid_to_pointcloud(voxel: torch.Tensor, num_points: int,
     return point_positions
 
 
-def voxelgrid_to_trianglemesh(voxel: torch.Tensor, thresh: int = .5,
+def voxelgrid_to_trianglemesh(voxel: torch.Tensor, thresh: float = .5,
                               mode: str = 'marching_cubes',
-                              normalize: bool = True):
+                              normalize: bool = True,
+                              num_workers: Optional[int] = None):
     r""" Converts  passed voxel to a mesh
 
+    Marching cubes runs in kaolin's compiled extractor directly on the
+    padded occupancy array, which shares the vertices between neighboring
+    faces. A batch of grids is extracted in a thread pool, as the extractor
+    releases the GIL.
+
     Args:
-        voxel (torch.Tensor): voxel array
+        voxel (torch.Tensor): voxel array, or batch of voxel arrays
         thresh (float): threshold from which to make voxel binary
         mode (str):
             -'exact': exect mesh conversion
             -'marching_cubes': marching cubes is applied to passed voxel
         normalize (bool): whether to scale the array to (-.5,.5)
+        num_workers (int): number of threads extracting a batch of grids
+            (default: number of CPUs)
 
     Returns:
-        (torch.Tensor): computed mesh properties
+        (torch.Tensor): computed mesh properties, or lists of them for a
+        batch of voxel arrays
 
     Example:
         >>> voxel = torch.ones([32,32,32])
@@ -467,39 +503,69 @@ def voxelgrid_to_trianglemesh(voxel: torch.Tensor, thresh: int = .5,
 
     """
     assert (mode in ['exact', 'marching_cubes'])
-    voxel = confirm_def(voxel)
-    voxel = threshold(voxel, thresh=thresh)
-    voxel_np = np.array((voxel.cpu() > thresh)).astype(bool)
-    trimesh_voxel = trimesh.voxel.VoxelGrid(voxel_np)
-
+    voxel = confirm_def(voxel, batched=True)
+    batched = voxel.dim() == 4
+    grids = (voxel > thresh).to('cpu', torch.uint8).view(-1, *voxel.shape[-3:])
     if mode == 'exact':
-        trimesh_voxel = trimesh_voxel.as_boxes()
-    elif mode == 'marching_cubes':
-        trimesh_voxel = trimesh_voxel.marching_cubes
+        extract = _voxel_boxes
+    else:
+        # empty padding closes the surface on the border of the grid
+        grids = F.pad(grids, [1, 1, 1, 1, 1, 1])
+        extract = _marching_cubes
 
-    verts = torch.FloatTensor(trimesh_voxel.vertices)
-    faces = torch.LongTensor(trimesh_voxel.faces)
-    shape = torch.FloatTensor(np.array(voxel.shape))
-    if voxel.is_cuda:
-        verts = verts.cuda()
-        faces = faces.cuda()
-        shape = shape.cuda()
-    if normalize:
+    num_workers = num_workers or os.cpu_count() or 1
+    if num_workers == 1 or len(grids) == 1:
+        meshes = [extract(grid) for grid in grids]
+    else:
+        with ThreadPoolExecutor(num_workers) as pool:
+            meshes = list(pool.map(extract, grids))
+
+    shape = torch.tensor(voxel.shape[-3:], dtype=torch.float,
+                         device=voxel.device)
+    verts_list, faces_list = [], []
+    for verts, faces in meshes:
+        verts = verts.to(voxel.device)
+        if normalize:
+            verts = verts / shape - .5
+        verts_list.append(verts)
+        faces_list.append(faces.to(voxel.device))
+    if not batched:
+        return verts_list[0], faces_list[0]
+    return verts_list, faces_list
 
-        verts /= shape
-        verts = verts - .5
 
-    return verts, faces
+def _marching_cubes(grid: torch.Tensor):
+    r""" Marching cubes on an occupancy grid padded by one empty voxel,
+    with the vertices in the coordinates of the unpadded grid.
+    """
+    verts, faces = marching_cubes_contiguous(grid.numpy(), .5)
+    return torch.from_numpy(verts).float() - 1, torch.from_numpy(faces)
+
+
+def _voxel_boxes(grid: torch.Tensor):
+    r""" Boxes of the occupied voxels of a grid. """
+    import trimesh
+    boxes = trimesh.voxel.VoxelGrid(grid.numpy().astype(bool)).as_boxes()
+    return (torch.FloatTensor(boxes.vertices),
+            torch.LongTensor(boxes.faces))
 
 
 def voxelgrid_to_quadmesh(voxel: torch.Tensor, thresh: str = .5,
-                          normalize: bool = True):
+                          normalize: bool = True, merge: bool = False):
     r""" Converts passed voxel to quad mesh
 
+    Every face of an occupied voxel next to an empty one, or on the border
+    of the grid, becomes a quad. Vertices are numbered in order of first
+    appearance, voxel by voxel in lexicographic order.
+
     Args:
         voxel (torch.Tensor): voxel array
         thresh (float): threshold from which to make voxel binary
         normalize (bool): whether to scale the array to (-.5,.5)
+        merge (bool): whether to merge adjacent coplanar faces into larger
+            rectangles, first along z (or y) then along the other axis.
+            Merged quads can have vertices of their neighbours on their
+            edges.
 
     Returns:
         (torch.Tensor): converted mesh properties
@@ -508,98 +574,275 @@ def voxelgrid_to_quadmesh(voxel: torch.Tensor, thresh: str = .5,
         >>> voxel = torch.ones([32,32,32])
         >>> verts, faces = voxelgrid_to_quadmesh(voxel)
         >>> [verts.shape, faces.shape]
-        [torch.Size([6144, 3]), torch.Size([6142, 4])]
+        [torch.Size([6146, 3]), torch.Size([6144, 4])]
+        >>> verts, faces = voxelgrid_to_quadmesh(voxel, merge=True)
+        >>> [verts.shape, faces.shape]
+        [torch.Size([8, 3]), torch.Size([6, 4])]
 
     """
     voxel = confirm_def(voxel)
     voxel = threshold(voxel, thresh=thresh)
-    dim = voxel.shape[0]
-    new_voxel = np.zeros((dim + 2, dim + 2, dim + 2))
-    new_voxel[1:dim + 1, 1:dim + 1, 1:dim + 1] = voxel.cpu()
-
-    voxel = new_voxel
-
-    vert_dict = {}
-    verts = []
-    faces = []
-    curr_vert_num = 1
-    a, b, c = np.where(voxel == 1)
-    for i, j, k in zip(a, b, c):
-
-        # top
-        if voxel[i, j, k + 1] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                0, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-        # bottom
-        if voxel[i, j, k - 1] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                1, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-        # left
-        if voxel[i - 1, j, k] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                2, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-        # right
-        if voxel[i + 1, j, k] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                3, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-        # front
-        if voxel[i, j - 1, k] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                4, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-        # back
-        if voxel[i, j + 1, k] != 1:
-            vert_dict, verts, faces, curr_vert_num = _add_face(
-                5, vert_dict, verts, faces, [i, j, k], curr_vert_num)
-    verts = torch.FloatTensor(np.array(verts))
-    faces = torch.LongTensor(np.array(faces) - 1)
+    # pad by one empty voxel on each side
+    occupied = F.pad(voxel == 1, (1, 1, 1, 1, 1, 1))
+    coords = occupied.nonzero()
+
+    # a face is exposed when the voxel shifted by its direction is empty
+    exposed = []
+    for direction in _FACE_DIRECTIONS.tolist():
+        neighbor = occupied
+        for axis, shift in enumerate(direction):
+            if shift != 0:
+                neighbor = neighbor.roll(-shift, dims=axis)
+        exposed.append((occupied & ~neighbor)[coords[:, 0], coords[:, 1],
+                                              coords[:, 2]])
+
+    if merge:
+        verts, faces = _merged_quads(coords, exposed)
+    else:
+        verts, faces = _exposed_quads(coords, exposed)
+    verts = verts.float()
     if normalize:
-        shape = torch.FloatTensor(np.array(voxel.shape))
+        shape = verts.new_tensor(occupied.shape)
         verts /= shape
         verts = verts - .5
 
     return verts, faces
 
 
-def _add_face(vert_set_index: int, vert_dict: dict, verts: torch.Tensor,
-              faces: torch.Tensor, location: list, curr_vert_num: int):
-    r""" Adds a face to the set of observed faces and verticies
+def sparsevoxelgrid_to_pointcloud(grid: SparseVoxelGrid, num_points: int,
+                                  mode: str = 'full', normalize: bool = True):
+    r""" Converts a sparse voxel grid to a pointcloud, like
+    :func:`voxelgrid_to_pointcloud`.
+
+    Args:
+        grid (kaolin.rep.SparseVoxelGrid): occupied voxels
+        num_points (int): number of points in converted point cloud
+        mode (str):
+            -'full': sample the whole voxel model
+            -'surface': sample only the surface voxels
+        normalize (bool): whether to scale the array to (-.5,.5)
+
+    Returns:
+       (torch.Tensor): converted pointcloud
+
+    Example:
+        >>> grid = SparseVoxelGrid(torch.randint(512, (1000, 3)), resolution=512)
+        >>> points = sparsevoxelgrid_to_pointcloud(grid, 10)
+        >>> points.shape
+        torch.Size([10, 3])
     """
-    top_verts = np.array([[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]])
-    bottom_verts = np.array([[0, 0, 0], [0, 1, 0], [1, 1, 0], [1, 0, 0]])
-    left_verts = np.array([[0, 0, 0], [0, 0, 1], [0, 1, 1], [0, 1, 0]])
-    right_verts = np.array([[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1]])
-    front_verts = np.array([[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1]])
-    back_verts = np.array([[0, 1, 0], [0, 1, 1], [1, 1, 1], [1, 1, 0]])
-    vert_sets = [top_verts, bottom_verts, left_verts,
-                 right_verts, front_verts, back_verts]
-
-    vert_set = vert_sets[vert_set_index]
-    face = np.array([0, 1, 2, 3]) + curr_vert_num
-    update = 4
-    for e, vs in enumerate(vert_set):
-        new_position = vs + np.array(location)
-        if str(new_position) in vert_dict:
-            index = vert_dict[str(new_position)]
-            face[e] = index
-            for idx in range(e + 1, 4):
-                face[idx] -= 1
-            update -= 1
-        else:
-            vert_dict[str(new_position)] = len(verts) + 1
-            verts.append(list(new_position))
-    faces.append(face)
-    curr_vert_num += update
-    return vert_dict, verts, faces, curr_vert_num
+    assert (mode in ['full', 'surface'])
+    if mode == 'surface':
+        grid = grid.extract_surface()
+
+    select_index = torch.randint(len(grid), (num_points,), device=grid.device)
+    point_positions = grid.coords[select_index].float()
+    point_positions += torch.rand(point_positions.shape,
+                                  device=point_positions.device)
+
+    if normalize:
+        shape = point_positions.new_tensor(grid.resolution)
+        point_positions /= shape
+        point_positions = point_positions - .5
+
+    return point_positions
+
+
+def sparsevoxelgrid_to_quadmesh(grid: SparseVoxelGrid, normalize: bool = True,
+                                merge: bool = False):
+    r""" Converts a sparse voxel grid to the quad mesh of the exposed voxel
+    faces. Vertices and faces are the ones of :func:`voxelgrid_to_quadmesh`
+    on the dense grid, in the same order.
+
+    Args:
+        grid (kaolin.rep.SparseVoxelGrid): occupied voxels
+        normalize (bool): whether to scale the array to (-.5,.5)
+        merge (bool): whether to merge adjacent coplanar faces, see
+            :func:`voxelgrid_to_quadmesh`
+
+    Returns:
+        (torch.Tensor): converted mesh properties
+
+    Example:
+        >>> grid = SparseVoxelGrid.from_dense(torch.ones([32, 32, 32]))
+        >>> verts, faces = sparsevoxelgrid_to_quadmesh(grid)
+        >>> [verts.shape, faces.shape]
+        [torch.Size([6146, 3]), torch.Size([6144, 4])]
+
+    """
+    # voxels in the grid padded by one empty voxel on each side
+    exposed = [~grid.contains(grid.coords + direction)
+               for direction in _FACE_DIRECTIONS]
+    if merge:
+        verts, faces = _merged_quads(grid.coords + 1, exposed)
+    else:
+        verts, faces = _exposed_quads(grid.coords + 1, exposed)
+    verts = verts.float()
+    if normalize:
+        shape = verts.new_tensor(grid.resolution) + 2
+        verts /= shape
+        verts = verts - .5
+
+    return verts, faces
+
+
+def sparsevoxelgrid_to_trianglemesh(grid: SparseVoxelGrid,
+                                    normalize: bool = True):
+    r""" Converts a sparse voxel grid to the triangle mesh of the exposed
+    voxel faces, each split in two triangles.
+
+    Args:
+        grid (kaolin.rep.SparseVoxelGrid): occupied voxels
+        normalize (bool): whether to scale the array to (-.5,.5)
+
+    Returns:
+        (torch.Tensor): computed mesh properties
+
+    Example:
+        >>> grid = SparseVoxelGrid.from_dense(torch.ones([32, 32, 32]))
+        >>> verts, faces = sparsevoxelgrid_to_trianglemesh(grid)
+        >>> [verts.shape, faces.shape]
+        [torch.Size([6146, 3]), torch.Size([12288, 3])]
+
+    """
+    verts, faces = sparsevoxelgrid_to_quadmesh(grid, normalize=normalize)
+    faces = torch.cat((faces[:, :3], faces[:, [0, 2, 3]]), dim=1).view(-1, 3)
+    return verts, faces
+
+
+# neighbor direction and corners of the six faces of a voxel: top, bottom,
+# left, right, front, back
+_FACE_DIRECTIONS = torch.tensor([[0, 0, 1], [0, 0, -1], [-1, 0, 0],
+                                 [1, 0, 0], [0, -1, 0], [0, 1, 0]])
+_FACE_CORNERS = torch.tensor([
+    [[0, 0, 1], [1, 0, 1], [1, 1, 1], [0, 1, 1]],
+    [[0, 0, 0], [0, 1, 0], [1, 1, 0], [1, 0, 0]],
+    [[0, 0, 0], [0, 0, 1], [0, 1, 1], [0, 1, 0]],
+    [[1, 0, 0], [1, 1, 0], [1, 1, 1], [1, 0, 1]],
+    [[0, 0, 0], [1, 0, 0], [1, 0, 1], [0, 0, 1]],
+    [[0, 1, 0], [0, 1, 1], [1, 1, 1], [1, 1, 0]]])
+
+
+def _exposed_quads(coords: torch.Tensor, exposed: List[torch.Tensor]):
+    r""" Quads of the exposed faces of voxels, with vertices numbered in
+    order of first appearance, voxel by voxel in the order of coords and
+    face by face in the order of _FACE_DIRECTIONS.
+
+    Args:
+        coords (torch.Tensor): voxel coordinates (shape: N x 3)
+        exposed (list of torch.Tensor): for every direction, which voxels
+            have an exposed face (shape: N)
+
+    Returns:
+        (torch.LongTensor, torch.LongTensor): integer vertex positions and
+        quad faces
+    """
+    exposed = torch.stack(exposed, dim=1)
+    voxel, direction = exposed.nonzero(as_tuple=True)
+    corners = coords[voxel].unsqueeze(1) + \
+        _FACE_CORNERS.to(coords.device)[direction]
+    return _weld_quads(corners.view(-1, 3))
+
+
+def _merged_quads(coords: torch.Tensor, exposed: List[torch.Tensor]):
+    r""" Quads of the exposed faces of voxels, where adjacent coplanar faces
+    are merged: faces are first joined in runs along the last axis of their
+    plane, then runs of the same extent are stacked along the other axis.
+
+    Args:
+        coords (torch.Tensor): voxel coordinates (shape: N x 3)
+        exposed (list of torch.Tensor): for every direction, which voxels
+            have an exposed face (shape: N)
+
+    Returns:
+        (torch.LongTensor, torch.LongTensor): integer vertex positions and
+        quad faces
+    """
+    corners = []
+    for direction, face_corners in enumerate(_FACE_CORNERS.to(coords.device)):
+        normal = int(_FACE_DIRECTIONS[direction].abs().argmax())
+        u, v = [axis for axis in range(3) if axis != normal]
+        faces = coords[exposed[direction]]
+        if faces.shape[0] == 0:
+            continue
+        # runs of faces along v, then rectangles of runs along u
+        runs, width = _runs(faces[:, [normal, u, v]])
+        rects, height = _runs(torch.stack((runs[:, 0], runs[:, 2], width,
+                                           runs[:, 1]), dim=1))
+
+        start = torch.zeros_like(faces[:len(rects)])
+        start[:, normal] = rects[:, 0]
+        start[:, v] = rects[:, 1]
+        start[:, u] = rects[:, 3]
+        extent = torch.ones_like(start)
+        extent[:, v] = rects[:, 2]
+        extent[:, u] = height
+        corners.append(start.unsqueeze(1) + face_corners * extent.unsqueeze(1))
+    if len(corners) == 0:
+        return coords.new_zeros((0, 3)), coords.new_zeros((0, 4))
+    return _weld_quads(torch.cat(corners).view(-1, 3))
+
+
+def _runs(rows: torch.Tensor):
+    r""" Joins rows equal but for their last column, which is consecutive.
+
+    Args:
+        rows (torch.LongTensor): integer rows (shape: N x K)
+
+    Returns:
+        (torch.LongTensor, torch.LongTensor): first row of every run, in
+        lexicographic order, and the length of the run
+    """
+    order = torch.arange(rows.shape[0], device=rows.device)
+    for column in reversed(range(rows.shape[1])):
+        order = order[rows[order, column].argsort(stable=True)]
+    rows = rows[order]
+    start = torch.ones_like(rows[:, 0], dtype=torch.bool)
+    start[1:] = (rows[1:, :-1] != rows[:-1, :-1]).any(dim=1) | \
+        (rows[1:, -1] != rows[:-1, -1] + 1)
+    lengths = torch.bincount(torch.cumsum(start, dim=0) - 1)
+    return rows[start], lengths
+
+
+def _weld_quads(corners: torch.Tensor):
+    r""" Shared vertices of quads given by their corners (shape: 4N x 3),
+    numbered in order of first appearance.
+    """
+    if corners.shape[0] == 0:
+        return corners, corners.new_zeros((0, 4))
+
+    size = corners.max(dim=0)[0] + 1
+    keys = (corners[:, 0] * size[1] + corners[:, 1]) * size[2] + corners[:, 2]
+    unique, inverse = keys.unique(return_inverse=True)
+    # renumber the vertices by first appearance
+    first = torch.full_like(unique, keys.shape[0])
+    first.scatter_reduce_(0, inverse, torch.arange(keys.shape[0],
+                          device=keys.device), reduce='amin')
+    order = first.argsort()
+    rank = torch.empty_like(order)
+    rank[order] = torch.arange(order.shape[0], device=order.device)
+    verts = corners[first[order]]
+    faces = rank[inverse].view(-1, 4)
+    return verts, faces
 
 
 def voxelgrid_to_sdf(voxel: torch.Tensor, thresh: float = .5,
-                     normalize: bool = True):
+                     normalize: bool = True, mode: str = 'nearest'):
     r""" Converts passed voxel to a signed distance function
 
+    With ``mode='edt'`` the distances are computed once for every voxel
+    center with a linear time Euclidean distance transform, outside and
+    inside the occupied voxels, and queries trilinearly interpolate them.
+
     Args:
         voxel (torch.Tensor): voxel array
         thresh (float): threshold from which to make voxel binary
         normalize (bool): whether to scale the array to (0,1)
+        mode (str):
+            -'nearest': squared distance to the closest occupied voxel
+                center, searched on every query, and 0 in occupied voxels
+            -'edt': distance to the boundary of the occupied voxels,
+                negative inside, from a precomputed distance transform
 
     Returns:
         a signed distance function
@@ -609,9 +852,12 @@ def voxelgrid_to_sdf(voxel: torch.Tensor, thresh: float = .5,
         >>> sdf = voxelgrid_to_sdf(voxel)
         >>> distances = sdf(torch.rand(100,3))
     """
-
+    assert mode in ['nearest', 'edt'], 'mode must be nearest or edt'
     voxel = confirm_def(voxel)
     voxel = threshold(voxel, thresh=thresh)
+    if mode == 'edt':
+        return _edt_sdf(voxel, normalize)
+
     on_points = (voxel > .5).nonzero().float()
 
     if normalize:
@@ -633,3 +879,85 @@ def voxelgrid_to_sdf(voxel: torch.Tensor, thresh: float = .5,
         return distances
 
     return eval_query
+
+
+def _edt_sdf(voxel: torch.Tensor, normalize: bool):
+    r""" Signed distance function of a binary voxel grid, interpolated from
+    a distance transform over its voxel centers.
+    """
+    # empty padding makes the space around the grid outside
+    occupied = np.pad(voxel.cpu().numpy() > .5, 1)
+    if not occupied.any():
+        return lambda query: torch.full(query.shape[:-1], float('inf'),
+                                        device=query.device)
+    distances = ndimage.distance_transform_edt(~occupied) - .5
+    distances[occupied] = .5 - ndimage.distance_transform_edt(
+        occupied)[occupied]
+    grid = torch.from_numpy(distances).to(voxel.device, torch.float)
+    scale = float(voxel.shape[0]) if normalize else 1.
+    last = torch.tensor(grid.shape, dtype=torch.float,
+                        device=voxel.device) - 1
+
+    def eval_query(query):
+        coords = query.to(grid.device, torch.float).view(-1, 3)
+        if normalize:
+            coords = (coords + .5) * scale
+        coords = coords + 1
+        # queries beyond the padding add their distance to it
+        clamped = torch.min(torch.max(coords, torch.zeros_like(last)), last)
+        samples = (clamped / last * 2 - 1).flip(-1).view(1, -1, 1, 1, 3)
+        distances = F.grid_sample(grid[None, None], samples,
+                                  align_corners=True).view(-1)
+        distances = distances + (coords - clamped).norm(dim=-1)
+        return (distances / scale).to(query.device)
+
+    return eval_query
+
+
+def pack_voxelgrid(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
+    r""" Packs the occupancy of a voxel grid in bits, eight voxels per byte,
+    in the order of :func:`numpy.packbits`.
+
+    Args:
+        voxel (torch.Tensor): voxel array, or batch of voxel arrays (shape:
+            :math:`B \times D \times H \times W`)
+        thresh (float): voxels above it are occupied
+
+    Returns:
+        (torch.ByteTensor): packed voxels, of :math:`\lceil DHW / 8 \rceil`
+        bytes for every grid
+
+    Example:
+        >>> voxel = torch.rand([32, 32, 32])
+        >>> packed = pack_voxelgrid(voxel)
+        >>> packed.shape
+        torch.Size([4096])
+        >>> unpacked = unpack_voxelgrid(packed, voxel.shape)
+    """
+    if isinstance(voxel, VoxelGrid):
+        voxel = voxel.voxels
+    helpers._assert_tensor(voxel)
+    assert voxel.dim() in [3, 4], \
+        'Expected a voxel grid or a batch of voxel grids'
+    occupied = (voxel > thresh).reshape(*voxel.shape[:-3], -1)
+    occupied = F.pad(occupied.to(torch.uint8), (0, -occupied.shape[-1] % 8))
+    occupied = occupied.view(*occupied.shape[:-1], -1, 8)
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=voxel.device)
+    return (occupied << shifts).sum(dim=-1, dtype=torch.uint8)
+
+
+def unpack_voxelgrid(packed: torch.Tensor, shape: List[int]):
+    r""" Unpacks voxel grids packed with :func:`pack_voxelgrid`.
+
+    Args:
+        packed (torch.ByteTensor): packed voxels, of one grid or a batch
+        shape (list): shape of a voxel grid
+
+    Returns:
+        (torch.Tensor): voxel array, or batch of voxel arrays
+    """
+    shape = tuple(shape)[-3:]
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=packed.device)
+    voxel = (packed.unsqueeze(-1) >> shifts) & 1
+    voxel = voxel.view(*packed.shape[:-1], -1)[..., :np.prod(shape)]
+    return voxel.view(packed.shape[:-1] + shape).float()
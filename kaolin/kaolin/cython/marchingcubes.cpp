@@ -24,6 +24,8 @@
 
 #include "marchingcubes.h"
 
+#include <unordered_map>
+
 namespace mc
 {
 
@@ -350,4 +352,79 @@ void mc_add_vertex(double x1, double y1, double z1, double c2,
 
 }
 
+// Offset of the 8 corners of a cell in the order used by the tables.
+static const int corner_offsets[8][3] =
+{
+    {0, 0, 0}, {1, 0, 0}, {1, 1, 0}, {0, 1, 0},
+    {0, 0, 1}, {1, 0, 1}, {1, 1, 1}, {0, 1, 1}
+};
+
+// Corners at both ends of the 12 edges of a cell.
+static const int edge_corners[12][2] =
+{
+    {0, 1}, {1, 2}, {3, 2}, {0, 3},
+    {4, 5}, {5, 6}, {7, 6}, {4, 7},
+    {0, 4}, {1, 5}, {2, 6}, {3, 7}
+};
+
+void marching_cubes_sparse(const long* cells, const double* values,
+    size_t num_cells, long resolution, double isovalue,
+    std::vector<double>& vertices, std::vector<size_t>& polygons)
+{
+    using namespace private_;
+
+    // index of the vertex of every edge crossing the isosurface, keyed by
+    // the lower end of the edge and its axis
+    std::unordered_map<long, size_t> edge_vertices;
+
+    for(size_t n=0; n<num_cells; ++n)
+    {
+        const long* cell = cells + 3*n;
+        double v[8];
+        for(int m=0; m<8; ++m)
+        {
+            const int* o = corner_offsets[m];
+            v[m] = values[8*n + 4*o[0] + 2*o[1] + o[2]];
+        }
+
+        unsigned int cubeindex = 0;
+        for(int m=0; m<8; ++m)
+            if(v[m] <= isovalue)
+                cubeindex |= 1<<m;
+
+        int edges = edge_table[cubeindex];
+        if(edges == 0)
+            continue;
+
+        size_t indices[12];
+        for(int e=0; e<12; ++e)
+        {
+            if(!(edges & (1<<e)))
+                continue;
+            const int* lo = corner_offsets[edge_corners[e][0]];
+            const int* hi = corner_offsets[edge_corners[e][1]];
+            int axis = hi[0] != lo[0] ? 0 : (hi[1] != lo[1] ? 1 : 2);
+            long x = cell[0] + lo[0], y = cell[1] + lo[1], z = cell[2] + lo[2];
+            long key = ((x*resolution + y)*resolution + z)*3 + axis;
+
+            std::unordered_map<long, size_t>::iterator it = edge_vertices.find(key);
+            if(it != edge_vertices.end())
+            {
+                indices[e] = it->second;
+                continue;
+            }
+            indices[e] = vertices.size() / 3;
+            edge_vertices[key] = indices[e];
+            double upper = (axis == 0 ? x : (axis == 1 ? y : z)) + 1;
+            mc_add_vertex(x, y, z, upper, axis, v[edge_corners[e][0]],
+                v[edge_corners[e][1]], isovalue, &vertices);
+        }
+
+        int tri;
+        int* triangle_table_ptr = triangle_table[cubeindex];
+        for(int m=0; tri = triangle_table_ptr[m], tri != -1; ++m)
+            polygons.push_back(indices[tri]);
+    }
+}
+
 }
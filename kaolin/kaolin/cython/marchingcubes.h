@@ -558,6 +558,14 @@ void marching_cubes3(const vector3& lower, const vector3& upper,
     delete [] shared_indices;
 }
 
+// Marching cubes on a list of cells given by their lower corner and the
+// values at their 8 corners, corner (dx, dy, dz) at position 4*dx+2*dy+dz.
+// Vertices on the edges shared by several cells are created once; resolution
+// is the number of grid points along each axis, used to key the edges.
+void marching_cubes_sparse(const long* cells, const double* values,
+    size_t num_cells, long resolution, double isovalue,
+    std::vector<double>& vertices, std::vector<size_t>& polygons);
+
 }
 
 #endif // _MARCHING_CUBES_H
@@ -25,7 +25,7 @@
 # distutils: language = c++
 # cython: embedsignature = True
 
-# from libcpp.vector cimport vector
+from libcpp.vector cimport vector
 import numpy as np
 
 # Define PY_ARRAY_UNIQUE_SYMBOL
@@ -41,6 +41,15 @@ cdef extern from "pywrapper.h":
     cdef object c_marching_cubes2 "marching_cubes2"(np.ndarray, double) except +
     cdef object c_marching_cubes3 "marching_cubes3"(np.ndarray, double) except +
     cdef object c_marching_cubes_func "marching_cubes_func"(tuple, tuple, int, int, int, object, double) except +
+    cdef void c_marching_cubes_contiguous "marching_cubes_contiguous"[T](const T*, long, long, long, double, vector[double]&, vector[size_t]&) except + nogil
+
+cdef extern from "marchingcubes.h" namespace "mc":
+    cdef void c_marching_cubes_sparse "mc::marching_cubes_sparse"(const long*, const double*, size_t, long, double, vector[double]&, vector[size_t]&) except + nogil
+
+ctypedef fused volume_t:
+    np.uint8_t
+    float
+    double
 
 def marching_cubes(np.ndarray volume, float isovalue):
     
@@ -69,3 +78,54 @@ def marching_cubes_func(tuple lower, tuple upper, int numx, int numy, int numz,
     verts.shape = (-1, 3)
     faces.shape = (-1, 3)
     return verts, faces
+
+def marching_cubes_contiguous(const volume_t[:, :, ::1] volume, double isovalue):
+    """Marching cubes on a C-contiguous uint8, float32 or float64 array.
+
+    The extraction runs without the GIL, so several volumes can be processed
+    in parallel threads. Vertices lie on the edges between grid points and
+    are shared by all the faces around them.
+    """
+    cdef vector[double] vertices
+    cdef vector[size_t] polygons
+    if volume.shape[0] > 1 and volume.shape[1] > 1 and volume.shape[2] > 1:
+        with nogil:
+            c_marching_cubes_contiguous(&volume[0, 0, 0], volume.shape[0],
+                                        volume.shape[1], volume.shape[2],
+                                        isovalue, vertices, polygons)
+    return _to_arrays(vertices, polygons)
+
+def marching_cubes_sparse(const long[:, ::1] cells, const double[:, ::1] values,
+                          long resolution, double isovalue):
+    """Marching cubes on the cells of a grid with resolution points per axis.
+
+    cells holds the lower corner of every cell (N x 3) and values the values
+    at its corners (N x 8), corner (dx, dy, dz) in column 4*dx + 2*dy + dz.
+    Vertices on the edges shared by neighboring cells are created once, so
+    passing all the cells crossing the isosurface gives the same mesh as
+    marching_cubes on the whole grid, in time and memory proportional to
+    its area.
+    """
+    assert cells.shape[0] == values.shape[0]
+    assert cells.shape[1] == 3 and values.shape[1] == 8
+    cdef vector[double] vertices
+    cdef vector[size_t] polygons
+    if cells.shape[0] > 0:
+        with nogil:
+            c_marching_cubes_sparse(&cells[0, 0], &values[0, 0], cells.shape[0],
+                                    resolution, isovalue, vertices, polygons)
+    return _to_arrays(vertices, polygons)
+
+cdef _to_arrays(vector[double]& vertices, vector[size_t]& polygons):
+    verts = np.empty(vertices.size(), dtype=np.float64)
+    faces = np.empty(polygons.size(), dtype=np.int64)
+    cdef double[::1] verts_view = verts
+    cdef np.int64_t[::1] faces_view = faces
+    cdef Py_ssize_t i
+    for i in range(<Py_ssize_t>vertices.size()):
+        verts_view[i] = vertices[i]
+    for i in range(<Py_ssize_t>polygons.size()):
+        faces_view[i] = polygons[i]
+    verts.shape = (-1, 3)
+    faces.shape = (-1, 3)
+    return verts, faces
@@ -1,8 +1,7 @@
 # distutils: language = c++
 cimport cython
-from cython.operator cimport dereference as dref
 from libcpp.vector cimport vector
-from libcpp.map cimport map
+from libcpp.algorithm cimport sort
 from libc.math cimport isnan, NAN
 import numpy as np
 
@@ -15,6 +14,8 @@ cdef struct Voxel:
     Vector3D loc
     unsigned int level
     bint is_leaf
+    bint next_to_positive
+    bint next_to_negative
     unsigned long children[2][2][2]
 
 
@@ -24,16 +25,43 @@ cdef struct GridPoint:
     bint known
 
 
+cdef struct HashEntry:
+    long key
+    long idx
+
+
 cdef inline unsigned long vec_to_idx(Vector3D coord, long resolution):
     cdef unsigned long idx
     idx = resolution * resolution * coord.x + resolution * coord.y + coord.z
     return idx
 
 
+cdef inline Vector3D offset(Vector3D loc, int axis, int delta):
+    if axis == 0:
+        loc.x += delta
+    elif axis == 1:
+        loc.y += delta
+    else:
+        loc.z += delta
+    return loc
+
+
+cdef inline unsigned long hash_key(long key):
+    # Fibonacci hashing, mixing the high bits of the product into the low ones
+    cdef unsigned long h = <unsigned long>key * 11400714819323198485UL
+    return h ^ (h >> 32)
+
+
 cdef class MISE:
     cdef vector[Voxel] voxels
     cdef vector[GridPoint] grid_points
-    cdef map[long, long] grid_point_hash
+    # Open addressing hash table from grid point key to index, key -1 if
+    # empty
+    cdef vector[HashEntry] hash_table
+    cdef long hash_size
+    # Leaf voxels which got known grid points on both sides of the threshold
+    # since the last subdivision
+    cdef vector[long] active_voxels
     cdef readonly int resolution_0
     cdef readonly int depth
     cdef readonly double threshold
@@ -66,6 +94,8 @@ cdef class MISE:
                         loc=loc,
                         level=0,
                         is_leaf=True,
+                        next_to_positive=False,
+                        next_to_negative=False,
                     )
 
                     assert(self.voxels.size() == vec_to_idx(Vector3D(i, j, k), resolution_0))
@@ -73,6 +103,7 @@ cdef class MISE:
 
         # Create initial grid points
         self.grid_points.reserve((resolution_0 + 1) * (resolution_0 + 1) * (resolution_0 + 1))
+        self.rehash(2 * self.grid_points.capacity())
         for i in range(resolution_0 + 1):
             for j in range(resolution_0 + 1):
                 for k in range(resolution_0 + 1):
@@ -100,6 +131,7 @@ cdef class MISE:
                 raise ValueError('Point not in grid!')
             self.grid_points[idx].value = values[i]
             self.grid_points[idx].known = True
+            self.mark_adjacent_voxels(loc, values[i])
         # Subdivide activate voxels and add new points
         self.subdivide_voxels()
 
@@ -163,6 +195,116 @@ cdef class MISE:
                     assert(not isnan(out_view[i, j, k]))
         return out_array
 
+    def to_sparse(self, padding=None):
+        """Output the leaf voxels at highest resolution crossing the threshold.
+
+        Returns the lower corner of every voxel with grid points on both
+        sides of the threshold, and the values at its 8 corners, corner
+        (dx, dy, dz) in column 4 * dx + 2 * dy + dz. These are the only cells
+        in which marching cubes creates faces. If padding is given, the grid
+        is padded by one layer of points with that value, and the cells of
+        the padding crossing the threshold are output too.
+        """
+        cdef vector[long] cells
+        cdef vector[double] values
+        cdef Voxel voxel
+        cdef long resolution = self.resolution
+        cdef int i, j, k, step
+
+        for voxel in self.voxels:
+            if voxel.is_leaf and voxel.level == self.depth:
+                self.add_sparse_cell(voxel.loc, 0., False, cells, values)
+
+        if padding is not None and self.border_crosses(padding):
+            # Cells with a corner in the padding
+            for i in range(-1, resolution + 1):
+                for j in range(-1, resolution + 1):
+                    if i == -1 or i == resolution or j == -1 or j == resolution:
+                        step = 1
+                    else:
+                        step = resolution + 1
+                    for k in range(-1, resolution + 1, step):
+                        self.add_sparse_cell(Vector3D(i, j, k), padding, True,
+                                             cells, values)
+
+        # Convert to numpy
+        cells_np = np.zeros((cells.size() // 3, 3), dtype=np.int64)
+        values_np = np.zeros((values.size() // 8, 8), dtype=np.float64)
+        cdef long[:, :] cells_view = cells_np
+        cdef double[:, :] values_view = values_np
+        for i in range(cells_np.shape[0]):
+            for j in range(3):
+                cells_view[i, j] = cells[3 * i + j]
+            for j in range(8):
+                values_view[i, j] = values[8 * i + j]
+
+        return cells_np, values_np
+
+    cdef void add_sparse_cell(self, Vector3D loc0, double padding, bint padded,
+                              vector[long]& cells, vector[double]& values):
+        """Add the cell with lower corner loc0 if it crosses the threshold."""
+        cdef double corners[8]
+        cdef Vector3D loc
+        cdef bint below = False
+        cdef bint above = False
+        cdef int i, j, k, m
+
+        for i in range(2):
+            for j in range(2):
+                for k in range(2):
+                    loc = Vector3D(loc0.x + i, loc0.y + j, loc0.z + k)
+                    m = 4 * i + 2 * j + k
+                    if padded and not self.in_grid(loc):
+                        corners[m] = padding
+                    else:
+                        corners[m] = self.get_value(loc)
+                    if corners[m] <= self.threshold:
+                        below = True
+                    else:
+                        above = True
+        if below and above:
+            cells.push_back(loc0.x)
+            cells.push_back(loc0.y)
+            cells.push_back(loc0.z)
+            for m in range(8):
+                values.push_back(corners[m])
+
+    cdef bint border_crosses(self, double padding):
+        """Whether a grid point on the border of the grid is on the other
+        side of the threshold than padding. Other points on the border share
+        the side of the grid points of their leaf voxel."""
+        cdef bint padding_below = padding <= self.threshold
+        cdef GridPoint point
+        for point in self.grid_points:
+            if not (point.loc.x == 0 or point.loc.x == self.resolution or
+                    point.loc.y == 0 or point.loc.y == self.resolution or
+                    point.loc.z == 0 or point.loc.z == self.resolution):
+                continue
+            if (point.value <= self.threshold) != padding_below:
+                return True
+        return False
+
+    cdef inline bint in_grid(self, Vector3D loc):
+        return (0 <= loc.x <= self.resolution and 0 <= loc.y <= self.resolution
+                and 0 <= loc.z <= self.resolution)
+
+    cdef double get_value(self, Vector3D loc) except? -1:
+        """Value at a point of the grid at highest resolution. A point which
+        is not a grid point lies in coarser leaf voxels, whose grid points are
+        all on the same side of the threshold."""
+        cdef long idx = self.get_grid_point_idx(loc)
+        if idx != -1:
+            return self.grid_points[idx].value
+
+        idx = self.get_voxel_idx(Vector3D(
+            min(loc.x, self.resolution - 1),
+            min(loc.y, self.resolution - 1),
+            min(loc.z, self.resolution - 1),
+        ))
+        assert(idx != -1)
+        idx = self.get_grid_point_idx(self.voxels[idx].loc)
+        return self.grid_points[idx].value
+
     def get_points(self):
         points_np = np.zeros((self.grid_points.size(), 3), dtype=np.int64)
         values_np = np.zeros((self.grid_points.size()), dtype=np.float64)
@@ -181,57 +323,43 @@ cdef class MISE:
 
         return points_np, values_np
 
-    cdef void subdivide_voxels(self) except +:
-        cdef vector[bint] next_to_positive
-        cdef vector[bint] next_to_negative
+    cdef void mark_adjacent_voxels(self, Vector3D loc, double value):
+        """Mark the leaf voxels around a known grid point as next to a value
+        above or below the threshold, and queue the ones which became active
+        for subdivision."""
         cdef int i, j, k
         cdef long idx
-        cdef Vector3D loc, adj_loc
-
-        # Initialize vectors
-        next_to_positive.resize(self.voxels.size(), False)
-        next_to_negative.resize(self.voxels.size(), False)
-    
-        # Iterate over grid points and mark voxels active
-        # TODO: can move this to update operation and add attibute to voxel
-        for grid_point in self.grid_points:
-            loc = grid_point.loc
-            if not grid_point.known:
-                continue
+        cdef Voxel* voxel
+        cdef bint was_active
+
+        # Iterate over the 8 adjacent voxels
+        for i in range(-1, 1):
+            for j in range(-1, 1):
+                for k in range(-1, 1):
+                    idx = self.get_voxel_idx(Vector3D(loc.x + i, loc.y + j, loc.z + k))
+                    if idx == -1:
+                        continue
+
+                    voxel = &self.voxels[idx]
+                    was_active = voxel.next_to_positive and voxel.next_to_negative
+                    if value >= self.threshold:
+                        voxel.next_to_positive = True
+                    if value <= self.threshold:
+                        voxel.next_to_negative = True
+                    if (not was_active and voxel.next_to_positive and voxel.next_to_negative
+                            and voxel.level < self.depth):
+                        self.active_voxels.push_back(idx)
 
-            # Iterate over the 8 adjacent voxels
-            for i in range(-1, 1):
-                for j in range(-1, 1):
-                    for k in range(-1, 1):
-                        adj_loc = Vector3D(
-                            x=loc.x + i,
-                            y=loc.y + j,
-                            z=loc.z + k,
-                        )
-                        idx = self.get_voxel_idx(adj_loc)
-                        if idx == -1:
-                            continue
-            
-                        if grid_point.value >= self.threshold:
-                            next_to_positive[idx] = True
-                        if grid_point.value <= self.threshold:
-                            next_to_negative[idx] = True
-
-        cdef int n_subdivide = 0
-        
-        for idx in range(self.voxels.size()):
-            if not self.voxels[idx].is_leaf or self.voxels[idx].level == self.depth:
-                continue
-            if next_to_positive[idx] and next_to_negative[idx]:
-                n_subdivide += 1
+    cdef void subdivide_voxels(self) except +:
+        cdef vector[long] active
+        cdef long idx
 
-        self.voxels.reserve(self.voxels.size() + 8 * n_subdivide)
-        self.grid_points.reserve(self.voxels.size() + 19 * n_subdivide)
+        # Voxels activated by the subdivisions are only subdivided next time
+        active.swap(self.active_voxels)
+        sort(active.begin(), active.end())
 
-        for idx in range(self.voxels.size()):
-            if not self.voxels[idx].is_leaf or self.voxels[idx].level == self.depth:
-                continue
-            if next_to_positive[idx] and next_to_negative[idx]:
+        for idx in active:
+            if self.voxels[idx].is_leaf:
                 self.subdivide_voxel(idx)
 
     cdef void subdivide_voxel(self, long idx):
@@ -259,7 +387,9 @@ cdef class MISE:
                     voxel = Voxel(
                         loc=loc, 
                         level=new_level,
-                        is_leaf=True
+                        is_leaf=True,
+                        next_to_positive=False,
+                        next_to_negative=False,
                     )
 
                     self.voxels[idx].children[i][j][k] = self.voxels.size()
@@ -279,6 +409,100 @@ cdef class MISE:
                     if self.get_grid_point_idx(loc) == -1:
                         self.add_grid_point(loc)
 
+        # The known grid points of the new voxels all lie on the border of
+        # the current one: mark the new voxels around them
+        cdef int size = new_size * 2
+        cdef int axis, side_u, side_v
+        cdef Vector3D corner
+        for i in range(2):
+            for j in range(2):
+                for k in range(2):
+                    self.mark_children_at(idx, Vector3D(i * size, j * size, k * size), new_size)
+        for axis in range(3):
+            for side_u in range(2):
+                for side_v in range(2):
+                    # Edge along axis
+                    corner = offset(offset(Vector3D(0, 0, 0), (axis + 1) % 3, side_u * size),
+                                    (axis + 2) % 3, side_v * size)
+                    self.mark_children_on_edge(idx, corner, axis, size, new_size)
+            for side_u in range(2):
+                # Face normal to axis
+                corner = offset(Vector3D(0, 0, 0), axis, side_u * size)
+                self.mark_children_on_face(idx, corner, axis, size, new_size)
+
+    cdef bint mark_children_at(self, long idx, Vector3D loc_rel, int new_size):
+        """Mark the children of a voxel around the grid point at loc_rel
+        relative to it if it is known. Returns whether the grid point exists."""
+        cdef Vector3D loc0 = self.voxels[idx].loc
+        cdef long point_idx = self.get_grid_point_idx(Vector3D(
+            loc0.x + loc_rel.x, loc0.y + loc_rel.y, loc0.z + loc_rel.z))
+        if point_idx == -1:
+            return False
+        if self.grid_points[point_idx].known:
+            self.mark_children(idx, loc_rel, new_size, self.grid_points[point_idx].value)
+        return True
+
+    cdef void mark_children_on_edge(self, long idx, Vector3D start, int axis,
+                                    int length, int new_size):
+        """Mark the children around the grid points inside an edge segment.
+        A grid point inside the segment implies one at its middle."""
+        if length < 2:
+            return
+        cdef Vector3D middle = offset(start, axis, length // 2)
+        if self.mark_children_at(idx, middle, new_size):
+            self.mark_children_on_edge(idx, start, axis, length // 2, new_size)
+            self.mark_children_on_edge(idx, middle, axis, length // 2, new_size)
+
+    cdef void mark_children_on_face(self, long idx, Vector3D start, int axis,
+                                    int length, int new_size):
+        """Mark the children around the grid points inside a square of a face
+        normal to axis. A grid point inside the square implies one at its
+        center, the points on its sides are reached from the neighboring
+        squares or the edges of the voxel."""
+        if length < 2:
+            return
+        cdef int half = length // 2
+        cdef int u = (axis + 1) % 3
+        cdef int v = (axis + 2) % 3
+        if not self.mark_children_at(idx, offset(offset(start, u, half), v, half), new_size):
+            return
+        self.mark_children_at(idx, offset(start, u, half), new_size)
+        self.mark_children_at(idx, offset(offset(start, u, half), v, length), new_size)
+        self.mark_children_at(idx, offset(start, v, half), new_size)
+        self.mark_children_at(idx, offset(offset(start, v, half), u, length), new_size)
+        cdef int i, j
+        for i in range(2):
+            for j in range(2):
+                self.mark_children_on_face(idx, offset(offset(start, u, i * half), v, j * half),
+                                           axis, half, new_size)
+
+    cdef void mark_children(self, long idx, Vector3D loc_rel, int new_size,
+                            double value):
+        """Mark the children of a voxel around a known grid point, given
+        relative to the voxel."""
+        cdef int i, j, k
+        cdef long child
+        cdef Voxel* voxel
+        cdef bint was_active
+        for i in range(2):
+            if not (i * new_size <= loc_rel.x <= (i + 1) * new_size):
+                continue
+            for j in range(2):
+                if not (j * new_size <= loc_rel.y <= (j + 1) * new_size):
+                    continue
+                for k in range(2):
+                    if not (k * new_size <= loc_rel.z <= (k + 1) * new_size):
+                        continue
+                    child = self.voxels[idx].children[i][j][k]
+                    voxel = &self.voxels[child]
+                    was_active = voxel.next_to_positive and voxel.next_to_negative
+                    if value >= self.threshold:
+                        voxel.next_to_positive = True
+                    if value <= self.threshold:
+                        voxel.next_to_negative = True
+                    if (not was_active and voxel.next_to_positive and voxel.next_to_negative
+                            and voxel.level < self.depth):
+                        self.active_voxels.push_back(child)
 
     @cython.cdivision(True) 
     cdef long get_voxel_idx(self, Vector3D loc) except +:
@@ -301,8 +525,8 @@ cdef class MISE:
         )       
 
         # Initial voxels
-        cdef int idx = vec_to_idx(loc0, resolution_0)
-        cdef Voxel voxel = self.voxels[idx]
+        cdef long idx = vec_to_idx(loc0, resolution_0)
+        cdef Voxel* voxel = &self.voxels[idx]
         assert(voxel.loc.x == loc0.x * voxel_size_0)
         assert(voxel.loc.y == loc0.y * voxel_size_0)
         assert(voxel.loc.z == loc0.z * voxel_size_0)
@@ -329,7 +553,7 @@ cdef class MISE:
             )
             # New voxel
             idx = voxel.children[loc_offset.x][loc_offset.y][loc_offset.z]
-            voxel = self.voxels[idx]
+            voxel = &self.voxels[idx]
 
             # New relative coordinates
             loc_rel = Vector3D(
@@ -353,17 +577,45 @@ cdef class MISE:
             value=0.,
             known=False,
         )
-        self.grid_point_hash[vec_to_idx(loc, self.resolution + 1)] = self.grid_points.size()
+        if 2 * (self.hash_size + 1) > <long>self.hash_table.size():
+            self.rehash(2 * self.hash_table.size())
+        cdef long key = vec_to_idx(loc, self.resolution + 1)
+        cdef unsigned long slot = self.find_slot(key)
+        self.hash_table[slot] = HashEntry(key=key, idx=self.grid_points.size())
+        self.hash_size += 1
         self.grid_points.push_back(point)
 
-    cdef inline int get_grid_point_idx(self, Vector3D loc):
-        p_idx = self.grid_point_hash.find(vec_to_idx(loc, self.resolution + 1))
-        if p_idx == self.grid_point_hash.end():
+    cdef inline long get_grid_point_idx(self, Vector3D loc):
+        cdef long key = vec_to_idx(loc, self.resolution + 1)
+        cdef unsigned long slot = self.find_slot(key)
+        if self.hash_table[slot].key == -1:
             return -1
 
-        cdef int idx = dref(p_idx).second
+        cdef long idx = self.hash_table[slot].idx
         assert(self.grid_points[idx].loc.x == loc.x)
         assert(self.grid_points[idx].loc.y == loc.y)
         assert(self.grid_points[idx].loc.z == loc.z)
 
-        return idx
\ No newline at end of file
+        return idx
+
+    cdef inline unsigned long find_slot(self, long key):
+        """Slot holding key, or the empty slot where it would be inserted."""
+        cdef unsigned long mask = self.hash_table.size() - 1
+        cdef unsigned long slot = hash_key(key) & mask
+        while self.hash_table[slot].key != -1 and self.hash_table[slot].key != key:
+            slot = (slot + 1) & mask
+        return slot
+
+    cdef void rehash(self, unsigned long capacity):
+        """Grow the hash table to the next power of two above capacity."""
+        cdef unsigned long size = 16
+        while size < capacity:
+            size <<= 1
+        cdef vector[HashEntry] entries
+        cdef HashEntry entry
+        entries.swap(self.hash_table)
+        self.hash_table.assign(size, HashEntry(key=-1, idx=-1))
+
+        for entry in entries:
+            if entry.key != -1:
+                self.hash_table[self.find_slot(entry.key)] = entry
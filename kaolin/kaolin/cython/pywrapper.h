@@ -26,6 +26,7 @@
 
 #include <Python.h>
 #include "pyarraymodule.h"
+#include "marchingcubes.h"
 
 #include <vector>
 
@@ -35,4 +36,33 @@ PyObject* marching_cubes3(PyArrayObject* arr, double isovalue);
 PyObject* marching_cubes_func(PyObject* lower, PyObject* upper,
     int numx, int numy, int numz, PyObject* f, double isovalue);
 
+template<typename T>
+struct ContiguousArrayToCFunc
+{
+    const T* data;
+    long stride_x, stride_y;
+    ContiguousArrayToCFunc(const T* data, long numy, long numz)
+    {
+        this->data = data;
+        this->stride_x = numy*numz;
+        this->stride_y = numz;
+    }
+    double operator()(int x, int y, int z)
+    {
+        return static_cast<double>(data[x*stride_x + y*stride_y + z]);
+    }
+};
+
+// Marching cubes on a C-contiguous array with vertices on the grid points.
+// It does not touch any Python object, so it can run without the GIL.
+template<typename T>
+void marching_cubes_contiguous(const T* data, long numx, long numy, long numz,
+    double isovalue, std::vector<double>& vertices, std::vector<size_t>& polygons)
+{
+    double lower[3] = {0, 0, 0};
+    double upper[3] = {double(numx-1), double(numy-1), double(numz-1)};
+    mc::marching_cubes2<double>(lower, upper, numx, numy, numz,
+        ContiguousArrayToCFunc<T>(data, numy, numz), isovalue, vertices, polygons);
+}
+
 #endif // _PYWRAPPER_H
@@ -470,6 +470,7 @@ class ShapeNet_Surface_Meshes(data.Dataset):
             'resolution': resolution,
             'smoothing_iterations': smoothing_iterations,
             'mode': mode,
+            'registration': 'icp',
         }
 
         mesh_dataset = ShapeNet_Meshes(**dataset_params)
@@ -497,6 +498,10 @@ class ShapeNet_Surface_Meshes(data.Dataset):
 
             new_mesh = transforms(voxel)
             new_mesh.vertices = pcfunc.realign(new_mesh.vertices, og_mesh.vertices)
+            # refine the bounding box alignment against the original surface
+            surface, _ = og_mesh.sample(10000)
+            new_mesh.vertices = pcfunc.icp(new_mesh.vertices, surface,
+                                           num_samples=2000)[0]
             return {'vertices': new_mesh.vertices, 'faces': new_mesh.faces}
 
         self.cache_convert = helpers.Cache(convert, self.cache_dir,
@@ -691,6 +696,7 @@ class ShapeNet_SDF_Points(data.Dataset):
             'occ': occ,
             'smoothing_iterations': smoothing_iterations,
             'sample_box': sample_box,
+            'sdf': 'mesh_sdf',
         }
 
         surface_mesh_dataset = ShapeNet_Surface_Meshes(root=root,
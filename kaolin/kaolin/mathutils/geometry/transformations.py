@@ -499,7 +499,7 @@ def compose_transforms_3d(tforms):
             raise TypeError('Expected elements of tforms to be of type '
                             'torch.Tensor. Got {0} at index {1}'.format(
                                 type(tform), idx))
-        if tform.shape[-2, :] != (4, 4):
+        if tform.shape[-2:] != (4, 4):
             raise TypeError('Expected elements of tforms to be of shape '
                             '(..., 4, 4). Got {0} at index {1}'.format(
                                 tform.shape, idx))
@@ -202,7 +202,12 @@ def point_to_surface(points: torch.Tensor, mesh: Mesh):
         # sanity check
         # print(distance.mean(), grad_dist)
     else:
-        grad_dist = _point_to_surface_cpu(v1, v2, v3, points)
+        # closest faces are found with the mesh's cached BVH, distances are
+        # then recomputed in torch so that gradients reach the vertices
+        _, indx, bary = mesh.get_bvh().closest_point(points)
+        closest = bary[:, 0:1] * v1[indx] + bary[:, 1:2] * v2[indx] + \
+            bary[:, 2:3] * v3[indx]
+        grad_dist = torch.mean(((points - closest)**2).sum(dim=1))
 
     return grad_dist
 
@@ -268,94 +273,3 @@ def _compute_planar_dist(nor, p):
     dot = _compute_dot(nor, p)
     dot_div = _compute_dot(nor, nor)
     return dot * dot / dot_div
-
-
-def _point_to_surface_cpu(v1, v2, v3, points):
-
-    faces_len = v1.shape[0]
-    v21 = v2 - v1
-    v32 = v3 - v2
-    v13 = v1 - v3
-    nor = torch.cross(v21, v13)
-
-    # make more of them, one set for each sampled point
-    v1 = v1.view(
-        1, -1, 3).expand(points.shape[0], v1.shape[0], 3).contiguous().view(-1, 3)
-    v2 = v2.view(
-        1, -1, 3).expand(points.shape[0], v2.shape[0], 3).contiguous().view(-1, 3)
-    v3 = v3.view(
-        1, -1, 3).expand(points.shape[0], v3.shape[0], 3).contiguous().view(-1, 3)
-    v21 = v21.view(
-        1, -1, 3).expand(points.shape[0], v21.shape[0], 3).contiguous().view(-1, 3)
-    v32 = v32.view(
-        1, -1, 3).expand(points.shape[0], v32.shape[0], 3).contiguous().view(-1, 3)
-    v13 = v13.view(
-        1, -1, 3).expand(points.shape[0], v13.shape[0], 3).contiguous().view(-1, 3)
-    nor = nor.view(
-        1, -1, 3).expand(points.shape[0], nor.shape[0], 3).contiguous().view(-1, 3)
-    p = points.view(-1, 1,
-                    3).expand(points.shape[0], faces_len, 3).contiguous().view(-1, 3)
-
-    p1 = p - v1
-    p2 = p - v2
-    p3 = p - v3
-
-    del(v1)
-    del(v2)
-    del(v3)
-
-    sign1 = _compute_sign(v21, nor, p1)
-    sign2 = _compute_sign(v32, nor, p2)
-    sign3 = _compute_sign(v13, nor, p3)
-
-    outside_triangle = torch.le(torch.abs(sign1 + sign2 + sign3), 2)
-    inside_triangle = torch.gt(torch.abs(sign1 + sign2 + sign3), 2)
-    distances = torch.FloatTensor(np.zeros(sign1.shape))
-
-    del (sign1)
-    del (sign2)
-    del (sign3)
-
-    outside_triangle = np.where(outside_triangle)
-    inside_triangle = np.where(inside_triangle)
-
-    try:
-        dotter1 = _compute_dotter(v21[outside_triangle], p1[outside_triangle])
-        dotter2 = _compute_dotter(v32[outside_triangle], p2[outside_triangle])
-        dotter3 = _compute_dotter(v13[outside_triangle], p3[outside_triangle])
-        dots = torch.cat((dotter1, dotter2, dotter3), dim=1)
-        edge_distance = torch.min(dots, dim=1)[0]
-    except BaseException:
-        edge_distance = 0
-
-    distances[outside_triangle] = edge_distance
-    try:
-        face_distance = _compute_planar_dist(
-            nor[inside_triangle], p1[inside_triangle])
-    except BaseException:
-        face_distance = 0
-    distances[inside_triangle] = face_distance
-
-    distances = distances.view(points.shape[0], faces_len)
-
-    min_distaces = torch.min(distances, dim=1)[0]
-
-    return torch.mean(min_distaces)
-
-
-def _compute_sign(v, nor, p):
-    sign = torch.cross(v, nor)
-    sign = _compute_dot(sign, p)
-    sign = sign.sign()
-    return sign
-
-
-def _compute_dotter(v, p):
-    if v.shape[0] == 0:
-        return v
-    dotter = _compute_dot(v, p)
-    dotter_div = _compute_dot(v, v,)
-    dotter = torch.clamp(dotter / dotter_div, 0.0, 1.0).view(-1, 1)
-    dotter = (v * dotter) - p
-    dotter = _compute_dot(dotter, dotter)
-    return dotter.view(-1, 1)
@@ -214,3 +214,215 @@ def f_score(gt_points: torch.Tensor, pred_points: torch.Tensor,
 
     f_score = 2 * (precision * recall) / (precision + recall + 1e-8)
     return f_score
+
+
+def earth_movers_distance(S1: torch.Tensor, S2: torch.Tensor,
+                          method: str = 'sinkhorn', p: int = 1,
+                          blur: float = 0.01, scaling: float = 0.5,
+                          max_iter: int = 100, chunk_size: int = 256):
+    r"""Computes the earth mover's distance between two point clouds, the
+    mean cost ||x - y||^p of the best one to one matching of their points.
+
+    Two solvers are available. Both evaluate the cost matrix in blocks of
+    chunk_size rows, so memory is linear in the number of points.
+
+    - ``'sinkhorn'``: log-domain Sinkhorn iterations with epsilon scaling,
+      on the entropic problem of temperature blur ** p. The returned value
+      is the cost of the resulting transport plan, which tends to the exact
+      distance as blur goes to 0. The plan is evaluated in the log domain,
+      in the forward and the backward pass, and the gradient is taken with
+      the plan held fixed. Point clouds may differ in size, in which case
+      every point carries a uniform mass.
+    - ``'auction'``: epsilon scaled auction algorithm of Bertsekas. The
+      returned matching is within blur ** p of the optimum, on average per
+      point, and the gradient flows through the matched pairs. Point
+      clouds must have the same size.
+
+    Args:
+            S1 (torch.Tensor): point cloud of shape N x 3, or batch of point
+                clouds of shape B x N x 3
+            S2 (torch.Tensor): point cloud of shape M x 3, or B x M x 3
+            method (str): ``'sinkhorn'`` or ``'auction'``
+            p (int): exponent of the ground cost, 1 for the euclidean
+                distance and 2 for the squared euclidean distance
+            blur (float): accuracy of the solution, in units of distance
+            scaling (float): factor between two successive epsilons
+            max_iter (int): maximum number of Sinkhorn iterations at the
+                final temperature
+            chunk_size (int): number of rows of the cost blocks
+
+    Returns:
+            torch.Tensor: distance between S1 and S2, of shape B for
+            batched inputs
+
+    Example:
+            >>> A = torch.rand(300, 3)
+            >>> B = torch.rand(300, 3)
+            >>> earth_movers_distance(A, B)
+            tensor(0.1493)
+            >>> earth_movers_distance(A, B, method='auction')
+            tensor(0.1467)
+
+    """
+
+    assert (S1.dim() == S2.dim()), 'S1 and S2 must have the same dimesionality'
+    assert S1.dim() in (2, 3), 'the dimensions of the input must be 2 or 3'
+    batched = S1.dim() == 3
+    if not batched:
+        S1, S2 = S1.unsqueeze(0), S2.unsqueeze(0)
+
+    if method == 'sinkhorn':
+        distance = _SinkhornDistance.apply(S1, S2, p, blur, scaling,
+                                           max_iter, chunk_size)
+    elif method == 'auction':
+        assert S1.shape == S2.shape, \
+            'the auction solver requires point clouds of the same size'
+        matches = torch.stack([
+            torch.from_numpy(_auction(s1, s2, p, blur, scaling, chunk_size))
+            for s1, s2 in zip(S1.detach().cpu().double().numpy(),
+                              S2.detach().cpu().double().numpy())]).to(S1.device)
+        matched = S2.gather(1, matches.unsqueeze(2).expand(-1, -1, 3))
+        distance = _ground_cost(S1 - matched, p).mean(dim=1)
+    else:
+        raise ValueError('method must be sinkhorn or auction, got {}'
+                         .format(method))
+
+    if not batched:
+        distance = distance[0]
+    return distance
+
+
+def _ground_cost(diff, p):
+    dist2 = (diff ** 2).sum(dim=-1)
+    if p == 2:
+        return dist2
+    return dist2.clamp(min=1e-20) ** (p / 2.)
+
+
+def _softmin(x, y, h, eps, p, chunk_size):
+    # -eps * log sum_j exp(h_j - C(x_i, y_j) / eps) for every x_i, computed
+    # in blocks of chunk_size rows
+    out = []
+    for lo in range(0, x.shape[1], chunk_size):
+        cost = _ground_cost(x[:, lo:lo + chunk_size, None] - y[:, None], p)
+        out.append(-eps * torch.logsumexp(h[:, None] - cost / eps, dim=2))
+    return torch.cat(out, dim=1)
+
+
+def _transport_blocks(x, y, f, g, log_a, log_b, eps, p, chunk_size):
+    # blocks of the transport plan given by the Sinkhorn potentials,
+    #     pi_ij = exp(log a_i + log b_j + (f_i + g_j - C_ij) / eps)
+    # whose exponent stays bounded, along with the ground cost
+    for lo in range(0, x.shape[1], chunk_size):
+        diff = x[:, lo:lo + chunk_size, None] - y[:, None]
+        dist2 = (diff ** 2).sum(dim=-1).clamp(min=1e-20)
+        cost = dist2 if p == 2 else dist2 ** (p / 2.)
+        plan = torch.exp(
+            (log_a[:, lo:lo + chunk_size, None] + log_b[:, None]) +
+            (f[:, lo:lo + chunk_size, None] + g[:, None] - cost) / eps)
+        yield lo, diff, dist2, cost, plan
+
+
+class _SinkhornDistance(torch.autograd.Function):
+    @staticmethod
+    def forward(ctx, S1, S2, p, blur, scaling, max_iter, chunk_size):
+        x, y = S1.detach(), S2.detach()
+        n, m = x.shape[1], y.shape[1]
+        log_a = torch.full_like(x[..., 0], -np.log(n))
+        log_b = torch.full_like(y[..., 0], -np.log(m))
+
+        # temperatures from the diameter of the clouds down to blur ** p
+        both = torch.cat((x, y), dim=1)
+        diameter = (both.max(dim=1)[0] - both.min(dim=1)[0]).norm(dim=1).max()
+        diameter = max(diameter.item(), blur)
+        epsilons = [diameter ** p]
+        while epsilons[-1] * scaling > blur ** p:
+            epsilons.append(epsilons[-1] * scaling)
+        epsilons += [blur ** p] * max_iter
+
+        f = torch.zeros_like(log_a)
+        g = torch.zeros_like(log_b)
+        for it, eps in enumerate(epsilons):
+            f_new = _softmin(x, y, log_b + g / eps, eps, p, chunk_size)
+            g = _softmin(y, x, log_a + f_new / eps, eps, p, chunk_size)
+            converged = (it >= len(epsilons) - max_iter and
+                         (f_new - f).abs().max() < 1e-3 * blur ** p)
+            f = f_new
+            if converged:
+                break
+        f = _softmin(x, y, log_b + g / eps, eps, p, chunk_size)
+
+        ctx.save_for_backward(x, y, f, g, log_a, log_b)
+        ctx.params = (eps, p, chunk_size)
+        distance = torch.zeros_like(x[:, 0, 0])
+        for lo, diff, dist2, cost, plan in _transport_blocks(
+                x, y, f, g, log_a, log_b, eps, p, chunk_size):
+            distance += (plan * cost).sum(dim=(1, 2))
+        return distance
+
+    @staticmethod
+    def backward(ctx, grad_out):
+        # gradient of the ground cost integrated against the transport plan
+        x, y, f, g, log_a, log_b = ctx.saved_tensors
+        eps, p, chunk_size = ctx.params
+        grad_x = torch.zeros_like(x)
+        grad_y = torch.zeros_like(y)
+        for lo, diff, dist2, cost, plan in _transport_blocks(
+                x, y, f, g, log_a, log_b, eps, p, chunk_size):
+            grad_cost = (plan * p * dist2 ** (p / 2. - 1)).unsqueeze(3) * diff
+            grad_x[:, lo:lo + chunk_size] = grad_cost.sum(dim=2)
+            grad_y -= grad_cost.sum(dim=1)
+        scale = grad_out.view(-1, 1, 1)
+        return grad_x * scale, grad_y * scale, None, None, None, None, None
+
+
+def _auction(x, y, p, blur, scaling, chunk_size):
+    # Jacobi auction: every unassigned point of x bids for its most
+    # profitable point of y, every point of y goes to its highest bidder.
+    n = x.shape[0]
+    price = np.zeros(n)
+    owner = np.full(n, -1)
+    assigned = np.full(n, -1)
+    if n == 1:
+        return np.zeros(1, dtype=np.int64)
+
+    both = np.concatenate((x, y))
+    eps = np.linalg.norm(both.max(axis=0) - both.min(axis=0)) ** p / 4.
+    eps_final = blur ** p
+    while True:
+        eps = max(eps, eps_final)
+        owner[:] = -1
+        assigned[:] = -1
+        bidders = np.arange(n)
+        while len(bidders) > 0:
+            objects = np.empty(len(bidders), dtype=np.int64)
+            bids = np.empty(len(bidders))
+            for lo in range(0, len(bidders), chunk_size):
+                chunk = bidders[lo:lo + chunk_size]
+                diff = x[chunk, None] - y[None]
+                value = -((diff ** 2).sum(axis=-1) ** (p / 2.)) - price
+                top = np.argpartition(-value, 1, axis=1)[:, :2]
+                top_value = np.take_along_axis(value, top, axis=1)
+                first = top_value.argmax(axis=1)
+                rows = np.arange(len(chunk))
+                objects[lo:lo + chunk_size] = top[rows, first]
+                bids[lo:lo + chunk_size] = (
+                    price[top[rows, first]] + top_value[rows, first] -
+                    top_value[rows, 1 - first] + eps)
+
+            # highest bid for every object
+            order = np.lexsort((-bids, objects))
+            won = np.ones(len(order), dtype=bool)
+            won[1:] = objects[order[1:]] != objects[order[:-1]]
+            winners = order[won]
+            obj = objects[winners]
+            previous = owner[obj]
+            assigned[previous[previous >= 0]] = -1
+            owner[obj] = bidders[winners]
+            assigned[bidders[winners]] = obj
+            price[obj] = bids[winners]
+            bidders = np.nonzero(assigned < 0)[0]
+
+        if eps <= eps_final:
+            return assigned
+        eps *= scaling
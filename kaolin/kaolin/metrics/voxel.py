@@ -20,9 +20,12 @@ def iou(pred, gt, thresh=.5, reduction='mean'):
     r""" Computes IoU across two voxel grids
 
     Arguments:
-            pred (torch.Tensor): predicted (binary) voxel grid
+            pred (torch.Tensor): predicted (binary) voxel grid, or batch of
+                voxel grids (shape: :math:`B \times D \times H \times W`)
             gt (torch.Tensor): ground-truth (binary) voxel grid
             thresh (float): value to threshold the prediction with
+            reduction (str): how the IoUs of a batch are combined, 'mean',
+                'sum' or 'none'
 
     Returns:
             iou (torch.Tensor): the intersection over union value
@@ -34,15 +37,72 @@ def iou(pred, gt, thresh=.5, reduction='mean'):
             >>> loss
             tensor(0.3338)
     """
-    pred = pred.clone()
-    pred[pred <= thresh] = 0
-    pred[pred > thresh] = 1
+    assert pred.shape == gt.shape, 'pred and gt must have the same shape'
+    assert reduction in ['mean', 'sum', 'none'], \
+        'reduction must be mean, sum or none'
+    batched = pred.dim() == 4
+    pred = (pred > thresh).reshape(pred.shape[0] if batched else 1, -1)
+    gt = gt.reshape(pred.shape).byte() > 0
+
+    intersection = (pred & gt).sum(dim=1).float()
+    union = (pred | gt).sum(dim=1).float()
+    iou = intersection / union
+
+    if not batched:
+        return iou[0]
+    if reduction == 'mean':
+        return iou.mean()
+    if reduction == 'sum':
+        return iou.sum()
+    return iou
+
+
+def packed_iou(pred, gt, reduction='mean'):
+    r""" Computes IoU across two voxel grids packed with
+    :func:`kaolin.conversions.pack_voxelgrid`, by counting the bits of
+    their 64 bit words.
+
+    Arguments:
+            pred (torch.ByteTensor): packed predicted voxel grid, or batch of
+                packed voxel grids (shape: :math:`B \times N`)
+            gt (torch.ByteTensor): packed ground-truth voxel grid
+            reduction (str): how the IoUs of a batch are combined, 'mean',
+                'sum' or 'none'
 
-    pred = pred.view(-1).byte()
-    gt = gt.view(-1).byte()
+    Returns:
+            iou (torch.Tensor): the intersection over union value
+
+    Example:
+            >>> pred = kal.conversions.pack_voxelgrid(torch.rand(32, 32, 32))
+            >>> gt = kal.conversions.pack_voxelgrid(torch.rand(32, 32, 32))
+            >>> loss = packed_iou(pred, gt)
+    """
     assert pred.shape == gt.shape, 'pred and gt must have the same shape'
+    assert pred.dtype == torch.uint8 and gt.dtype == torch.uint8, \
+        'pred and gt must be packed voxel grids'
+    assert reduction in ['mean', 'sum', 'none'], \
+        'reduction must be mean, sum or none'
 
-    iou = torch.sum(torch.mul(pred, gt).float()) / \
-        torch.sum((pred + gt).clamp(min=0, max=1).float())
+    intersection = _popcount(pred & gt).float()
+    union = _popcount(pred | gt).float()
+    iou = intersection / union
 
+    if pred.dim() == 1:
+        return iou
+    if reduction == 'mean':
+        return iou.mean()
+    if reduction == 'sum':
+        return iou.sum()
     return iou
+
+
+def _popcount(packed):
+    """Number of set bits along the last dimension of a byte tensor, counted
+    in 64 bit words."""
+    packed = torch.nn.functional.pad(packed, (0, -packed.shape[-1] % 8))
+    words = packed.contiguous().view(torch.int64)
+    words = words - ((words >> 1) & 0x5555555555555555)
+    words = (words & 0x3333333333333333) + \
+        ((words >> 2) & 0x3333333333333333)
+    words = (words + (words >> 4)) & 0x0F0F0F0F0F0F0F0F
+    return (((words * 0x0101010101010101) >> 56) & 0xFF).sum(dim=-1)
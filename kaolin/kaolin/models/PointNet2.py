@@ -46,9 +46,96 @@ import torch.nn.functional as F
 from .PointNet import PointNetFeatureExtractor
 
 import kaolin.cuda as ext
-import kaolin.cuda.ball_query
-import kaolin.cuda.furthest_point_sampling
-import kaolin.cuda.three_nn
+try:
+    import kaolin.cuda.ball_query
+    import kaolin.cuda.furthest_point_sampling
+    import kaolin.cuda.three_nn
+except ImportError:
+    # CPU only builds, the functions below fall back to the torch kernels
+    pass
+
+
+# CPU counterparts of the kernels in kaolin/cuda. They follow the CUDA code
+# closely (float32 arithmetic, tie breaking, padding of missing neighbors)
+# so that both devices select the same indices.
+
+def _squared_distances(a, b):
+    # (B, n, 3), (B, m, 3) -> (B, n, m), evaluated in the same order as the
+    # CUDA kernels rather than through a matrix product
+    diff = a.unsqueeze(2) - b.unsqueeze(1)
+    return (diff[..., 0] * diff[..., 0] + diff[..., 1] * diff[..., 1] +
+            diff[..., 2] * diff[..., 2])
+
+
+def _furthest_point_sampling_cpu(xyz, num_points_out):
+    B, N, _ = xyz.shape
+    idx = torch.zeros(B, num_points_out, dtype=torch.int)
+    if num_points_out <= 0:
+        return idx
+    batch = torch.arange(B)
+    # points close to the origin are never selected, as in the CUDA kernel
+    valid = (xyz * xyz).sum(dim=2) > 1e-3
+    temp = torch.full((B, N), 1e10)
+    old = torch.zeros(B, dtype=torch.long)
+    for j in range(1, num_points_out):
+        diff = xyz - xyz[batch, old].unsqueeze(1)
+        d = (diff[..., 0] * diff[..., 0] + diff[..., 1] * diff[..., 1] +
+             diff[..., 2] * diff[..., 2])
+        temp = torch.where(valid, torch.min(d, temp), temp)
+        best = torch.where(valid, temp, torch.full_like(temp, -1.))
+        old = best.argmax(dim=1)
+        old[(best.max(dim=1)[0] < 0)] = 0
+        idx[:, j] = old.int()
+    return idx
+
+
+def _ball_query_cpu(radius, nsample, xyz, new_xyz, use_random=False,
+                    chunk_size=1024):
+    B, N, _ = xyz.shape
+    M = new_xyz.shape[1]
+    idx = torch.zeros(B, M, nsample, dtype=torch.int)
+    arange = torch.arange(N)
+    for lo in range(0, M, chunk_size):
+        d2 = _squared_distances(new_xyz[:, lo:lo + chunk_size], xyz)
+        inside = d2 < radius * radius
+        if use_random:
+            # uniform subset of the neighbors, like the reservoir sampling
+            # of the CUDA kernel, but drawn from torch's generator
+            key = torch.where(inside, torch.rand(inside.shape),
+                              torch.full(inside.shape, 2.))
+        else:
+            # the first neighbors in index order
+            key = torch.where(inside, arange.float().expand_as(d2),
+                              torch.full(inside.shape, float(N)))
+        k = min(nsample, N)
+        key, order = key.topk(k, dim=2, largest=False, sorted=True)
+        found = key < (2. if use_random else N)
+        # slots past the last neighbor repeat the first one
+        first = torch.where(found[..., :1], order[..., :1],
+                            torch.zeros_like(order[..., :1]))
+        chunk = torch.where(found, order, first.expand_as(order))
+        if k < nsample:
+            chunk = torch.cat((chunk, first.expand(-1, -1, nsample - k)),
+                              dim=2)
+        idx[:, lo:lo + chunk_size] = chunk.int()
+    return idx
+
+
+def _three_nn_cpu(unknown, known, chunk_size=1024):
+    B, n, _ = unknown.shape
+    m = known.shape[1]
+    dist2 = torch.full((B, n, 3), float('inf'))
+    idx = torch.zeros(B, n, 3, dtype=torch.int)
+    for lo in range(0, n, chunk_size):
+        d = _squared_distances(unknown[:, lo:lo + chunk_size], known)
+        # argmin keeps the lowest index among equal distances, like the
+        # strict comparisons of the CUDA kernel
+        for k in range(min(3, m)):
+            best, order = d.min(dim=2, keepdim=True)
+            dist2[:, lo:lo + chunk_size, k] = best.squeeze(2)
+            idx[:, lo:lo + chunk_size, k] = order.squeeze(2).int()
+            d.scatter_(2, order, float('inf'))
+    return dist2, idx
 
 
 class FurthestPointSampling(torch.autograd.Function):
@@ -78,7 +165,10 @@ class FurthestPointSampling(torch.autograd.Function):
         Returns:
             (torch.Tensor): (B, num_points_out) tensor containing the set
         """
-        return ext.furthest_point_sampling.furthest_point_sampling(xyz, num_points_out)
+        if xyz.is_cuda:
+            return ext.furthest_point_sampling.furthest_point_sampling(
+                xyz, num_points_out)
+        return _furthest_point_sampling_cpu(xyz, num_points_out)
 
     @staticmethod
     def backward(xyz, a=None):
@@ -119,14 +209,22 @@ class FPSGatherByIndex(torch.autograd.Function):
 
         ctx.for_backwards = (idx, C, N)
 
-        return ext.furthest_point_sampling.gather_by_index(features, idx)
+        if features.is_cuda:
+            return ext.furthest_point_sampling.gather_by_index(features, idx)
+        return features.gather(
+            2, idx.long().unsqueeze(1).expand(-1, C, -1))
 
     @staticmethod
     def backward(ctx, grad_out):
         idx, C, N = ctx.for_backwards
 
-        grad_features = ext.furthest_point_sampling.gather_by_index_grad(
-            grad_out.contiguous(), idx, N)
+        if grad_out.is_cuda:
+            grad_features = ext.furthest_point_sampling.gather_by_index_grad(
+                grad_out.contiguous(), idx, N)
+        else:
+            grad_features = grad_out.new_zeros(grad_out.shape[0], C, N)
+            grad_features.scatter_add_(
+                2, idx.long().unsqueeze(1).expand(-1, C, -1), grad_out)
         return grad_features, None
 
 
@@ -167,7 +265,10 @@ class ThreeNN(torch.autograd.Function):
         idx : torch.Tensor
             (B, n, 3) index of 3 nearest neighbors
         """
-        dist2, idx = ext.three_nn.three_nn(unknown, known)
+        if unknown.is_cuda:
+            dist2, idx = ext.three_nn.three_nn(unknown, known)
+        else:
+            dist2, idx = _three_nn_cpu(unknown, known)
 
         return torch.sqrt(dist2), idx
 
@@ -218,7 +319,11 @@ class ThreeInterpolate(torch.autograd.Function):
 
         ctx.three_interpolate_for_backward = (idx, weight, m)
 
-        return ext.three_nn.three_interpolate(features, idx, weight)
+        if features.is_cuda:
+            return ext.three_nn.three_interpolate(features, idx, weight)
+        idx = idx.long().view(B, 1, n * 3).expand(-1, c, -1)
+        neighbors = features.gather(2, idx).view(B, c, n, 3)
+        return (neighbors * weight.unsqueeze(1)).sum(dim=3)
 
     @staticmethod
     def backward(ctx, grad_out):
@@ -240,9 +345,16 @@ class ThreeInterpolate(torch.autograd.Function):
         """
         idx, weight, m = ctx.three_interpolate_for_backward
 
-        grad_features = ext.three_nn.three_interpolate_grad(
-            grad_out.contiguous(), idx, weight, m
-        )
+        if grad_out.is_cuda:
+            grad_features = ext.three_nn.three_interpolate_grad(
+                grad_out.contiguous(), idx, weight, m
+            )
+        else:
+            B, c, n = grad_out.shape
+            grad_features = grad_out.new_zeros(B, c, m)
+            grad_features.scatter_add_(
+                2, idx.long().view(B, 1, n * 3).expand(-1, c, -1),
+                (grad_out.unsqueeze(3) * weight.unsqueeze(1)).view(B, c, -1))
 
         return grad_features, None, None
 
@@ -287,7 +399,10 @@ class GroupGatherByIndex(torch.autograd.Function):
 
         ctx.for_backwards = (idx, N)
 
-        return ext.ball_query.gather_by_index(features, idx)
+        if features.is_cuda:
+            return ext.ball_query.gather_by_index(features, idx)
+        flat_idx = idx.long().view(B, 1, -1).expand(-1, C, -1)
+        return features.gather(2, flat_idx).view(B, C, nfeatures, nsample)
 
     @staticmethod
     def backward(ctx, grad_out):
@@ -307,8 +422,15 @@ class GroupGatherByIndex(torch.autograd.Function):
         """
         idx, N = ctx.for_backwards
 
-        grad_features = ext.ball_query.gather_by_index_grad(
-            grad_out.contiguous(), idx, N)
+        if grad_out.is_cuda:
+            grad_features = ext.ball_query.gather_by_index_grad(
+                grad_out.contiguous(), idx, N)
+        else:
+            B, C = grad_out.shape[:2]
+            grad_features = grad_out.new_zeros(B, C, N)
+            grad_features.scatter_add_(
+                2, idx.long().view(B, 1, -1).expand(-1, C, -1),
+                grad_out.reshape(B, C, -1))
 
         return grad_features, None
 
@@ -354,6 +476,9 @@ class BallQuery(torch.autograd.Function):
         torch.Tensor
             (B, npoint, nsample) tensor with the indicies of the features that form the query balls
         """
+        if not xyz.is_cuda:
+            return _ball_query_cpu(radius, nsample, xyz, new_xyz, use_random)
+
         if use_random:
             return ext.ball_query.ball_random_query(
                 torch.randint(int(1e9), ()).item(), new_xyz, xyz, radius,
@@ -45,13 +45,126 @@ import torch.nn as nn
 import torch.nn.functional as F
 
 
-def knn(x, k):
-    inner = -2 * torch.matmul(x.transpose(2, 1), x)
+def _negative_distance(x, y):
+    # (B, C, n), (B, C, m) -> (B, n, m) negative squared distances
+    inner = -2 * torch.matmul(x.transpose(2, 1), y)
     xx = torch.sum(x**2, dim=1, keepdim=True)
-    pairwise_distance = -xx - inner - xx.transpose(2, 1)
+    yy = torch.sum(y**2, dim=1, keepdim=True)
+    return -xx.transpose(2, 1) - inner - yy
 
-    idx = pairwise_distance.topk(k=k, dim=-1)[1]  # (batch_size, num_points, k)
-    return idx
+
+def knn(x, k, chunk_size=None):
+    """Indices of the k nearest neighbors of every point, itself included.
+
+    Args:
+        x (torch.Tensor): points of shape [B, C, N]
+        k (int): number of neighbors
+        chunk_size (int): if given, the [B, N, N] distance matrix is never
+            formed: it is evaluated in tiles of chunk_size x chunk_size and
+            merged into a running top-k, so memory is O(B * N * chunk_size).
+
+    Returns:
+        (torch.LongTensor): indices of shape [B, N, k]
+    """
+    num_points = x.size(2)
+    if chunk_size is None or chunk_size >= num_points:
+        pairwise_distance = _negative_distance(x, x)
+        idx = pairwise_distance.topk(k=k, dim=-1)[1]  # (batch_size, num_points, k)
+        return idx
+
+    idx = []
+    for lo in range(0, num_points, chunk_size):
+        query = x[:, :, lo:lo + chunk_size]
+        best_val = best_idx = None
+        for key_lo in range(0, num_points, chunk_size):
+            val = _negative_distance(query, x[:, :, key_lo:key_lo + chunk_size])
+            key_idx = torch.arange(key_lo, key_lo + val.size(2),
+                                   device=x.device).expand_as(val)
+            if best_val is not None:
+                val = torch.cat((best_val, val), dim=2)
+                key_idx = torch.cat((best_idx, key_idx), dim=2)
+            best_val, order = val.topk(k=min(k, val.size(2)), dim=-1)
+            best_idx = key_idx.gather(2, order)
+        idx.append(best_idx)
+    return torch.cat(idx, dim=1)
+
+
+def approximate_knn(xyz, k, voxel_size=None, max_per_cell=None,
+                    chunk_size=4096):
+    """Approximate k nearest neighbors of 3D points through a voxel hash.
+
+    Points are bucketed into cubic cells of side voxel_size and the
+    neighbors of a point are searched among the points of the 27 cells
+    around it, keeping at most max_per_cell points per cell. The result is
+    exact for every point whose k-th neighbor is closer than voxel_size and
+    whose cells are not truncated. Points that end up with fewer than k
+    candidates fall back to :func:`knn`.
+
+    Args:
+        xyz (torch.Tensor): points of shape [B, 3, N]
+        k (int): number of neighbors
+        voxel_size (float): side of the hash cells. By default the median
+            distance to the k-th neighbor of a random subset of the points.
+        max_per_cell (int): number of candidates taken from every cell.
+            Default: ``2 * k``.
+        chunk_size (int): number of query points processed at once
+
+    Returns:
+        (torch.LongTensor): indices of shape [B, N, k]
+    """
+    batch_size, _, num_points = xyz.shape
+    if num_points <= k:
+        return knn(xyz, k)
+    if max_per_cell is None:
+        max_per_cell = 2 * k
+    idx = []
+    for b in range(batch_size):
+        points = xyz[b].t().contiguous()
+        cell_size = voxel_size
+        if cell_size is None:
+            sample = points[torch.randperm(num_points, device=xyz.device)[:256]]
+            dist = -_negative_distance(sample.t()[None], points.t()[None])[0]
+            cell_size = dist.topk(k, dim=1, largest=False)[0][:, -1]
+            cell_size = cell_size.clamp(min=0).sqrt().median().item()
+            cell_size = max(cell_size, 1e-8)
+
+        # sort the points by cell, the hash of a cell is its linear index
+        cells = torch.floor(
+            (points - points.min(dim=0)[0]) / cell_size).long() + 1
+        dims = cells.max(dim=0)[0] + 2
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        keys, order = keys.sort()
+
+        offsets = torch.stack(torch.meshgrid(
+            *[torch.arange(-1, 2, device=xyz.device)] * 3, indexing='ij'),
+            dim=-1).view(-1, 3)
+        offsets = (offsets[:, 0] * dims[1] + offsets[:, 1]) * dims[2] + offsets[:, 2]
+        slots = torch.arange(max_per_cell, device=xyz.device)
+
+        neighbors = torch.empty(num_points, k, dtype=torch.long,
+                                device=xyz.device)
+        for lo in range(0, num_points, chunk_size):
+            query = order[lo:lo + chunk_size]
+            near = keys[lo:lo + chunk_size, None] + offsets
+            first = torch.searchsorted(keys, near)
+            last = torch.searchsorted(keys, near, right=True)
+            candidate = (first[..., None] + slots).view(len(query), -1)
+            valid = candidate < last.repeat_interleave(max_per_cell, dim=1)
+            candidate = order[candidate.clamp(max=num_points - 1)]
+            dist = ((points[candidate] - points[query, None]) ** 2).sum(-1)
+            dist[~valid] = float('inf')
+            dist, nearest = dist.topk(k, dim=1, largest=False)
+            neighbors[query] = candidate.gather(1, nearest)
+
+            # too few candidates, search the whole cloud
+            missing = torch.isinf(dist[:, -1])
+            if missing.any():
+                query = query[missing]
+                exact = -_negative_distance(points[query].t()[None],
+                                            points.t()[None])[0]
+                neighbors[query] = exact.topk(k, dim=1, largest=False)[1]
+        idx.append(neighbors)
+    return torch.stack(idx)
 
 
 class DGCNN(nn.Module):
@@ -66,6 +179,12 @@ class DGCNN(nn.Module):
         dropout (float): dropout probability (applied to fully connected layers only). Default: ``0.5``.
         k (int): number of nearest neighbors.
         use_cuda (bool): if ``True`` will move the model to GPU
+        knn_chunk_size (int): if given, the k-NN graphs are built in tiles of
+            this many points instead of from the full [B, N, N] distance
+            matrix. Use it for clouds of many thousand points. Default: ``None``.
+        approximate_knn (bool): if ``True``, the graph of the first layer is
+            built with :func:`approximate_knn` on the xyz coordinates (the
+            first three input features). Default: ``False``.
 
     .. note::
 
@@ -91,10 +210,14 @@ class DGCNN(nn.Module):
             dropout=0.5,  # dropout probability
             k=20,  # number of nearest neighbors
             use_cuda=True,  # use CUDA or not
+            knn_chunk_size=None,  # tile size of the k-NN search
+            approximate_knn=False,  # voxel hash k-NN for the first layer
     ):
         super(DGCNN, self).__init__()
         self.k = k
         self.use_cuda = use_cuda
+        self.knn_chunk_size = knn_chunk_size
+        self.approximate_knn = approximate_knn
 
         emb_input_dim = sum(conv_dims)
         self.conv_dims = [input_dim] + conv_dims
@@ -154,7 +277,7 @@ class DGCNN(nn.Module):
         num_points = x.size(2)
         x = x.view(batch_size, -1, num_points)
         if idx is None:
-            idx = knn(x, k=k)  # (batch_size, num_points, k)
+            idx = knn(x, k=k, chunk_size=self.knn_chunk_size)  # (batch_size, num_points, k)
         if self.use_cuda:
             device = torch.device('cuda')
         else:
@@ -188,7 +311,11 @@ class DGCNN(nn.Module):
 
         # convolutional layers
         for it in range(len(self.conv_dims) - 1):
-            x = self.get_graph_feature(x, k=self.k)
+            idx = None
+            if it == 0 and self.approximate_knn:
+                idx = approximate_knn(x[:, :3], self.k,
+                                      chunk_size=self.knn_chunk_size or 4096)
+            x = self.get_graph_feature(x, k=self.k, idx=idx)
             x = self.__getattr__(f'conv_layers_{it}')(x)
             x = x.max(dim=-1, keepdim=False)[0]
             x_list.append(x)
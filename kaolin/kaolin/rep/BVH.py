@@ -0,0 +1,598 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+
+
+class BVH(object):
+    r"""Bounding volume hierarchy over the triangles of a mesh.
+
+    Nodes are stored in flat arrays (``bbox_min``, ``bbox_max``, ``left``,
+    ``right``, ``start``, ``count``), where leaves have ``left == -1`` and
+    reference the contiguous range ``face_index[start:start + count]``.
+    Queries are vectorized over batches of points and split into chunks
+    which are processed by a pool of threads.
+
+    Args:
+        vertices (torch.Tensor or np.ndarray): mesh vertices (shape: V x 3).
+        faces (torch.Tensor or np.ndarray): triangle indices (shape: F x 3).
+        leaf_size (int): maximum number of triangles stored in a leaf.
+        split (str):
+            -'sah': split along the cheapest position under the surface
+                area heuristic.
+            -'median': split at the median centroid of the longest axis.
+        num_workers (int): number of threads used for queries
+            (default: number of cpus).
+
+    Example:
+        >>> mesh = TriangleMesh.from_obj('model.obj')
+        >>> bvh = BVH(mesh.vertices, mesh.faces)
+        >>> distances, face_idx, barycentric = bvh.closest_point(
+        ...     torch.rand(100, 3))
+    """
+
+    def __init__(self, vertices, faces, leaf_size: int = 8,
+                 split: str = 'sah', num_workers: int = None):
+        assert split in ['sah', 'median'], 'split must be sah or median'
+        assert leaf_size >= 1, 'leaf_size must be at least 1'
+        if torch.is_tensor(vertices):
+            vertices = vertices.data.cpu().numpy()
+        if torch.is_tensor(faces):
+            faces = faces.data.cpu().numpy()
+        faces = np.asarray(faces, dtype=np.int64)
+        assert faces.ndim == 2 and faces.shape[1] == 3, \
+            'BVH expects triangle faces'
+
+        self.leaf_size = leaf_size
+        self.split = split
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self.num_faces = faces.shape[0]
+
+        triangles = np.asarray(vertices, dtype=np.float64)[faces]
+        self._build(triangles)
+        # triangles stored in leaf order so that leaves read contiguous memory
+        self.triangles = np.ascontiguousarray(triangles[self.face_index])
+
+    @classmethod
+    def from_mesh(cls, mesh, **kwargs):
+        r"""Builds a BVH over the faces of a mesh. Quad faces are split
+        into two triangles (:math:`abc` followed by :math:`adc`), matching
+        the ordering used in :func:`kaolin.metrics.mesh.point_to_surface`.
+        """
+        faces = mesh.faces
+        if faces.shape[-1] == 4:
+            faces = torch.cat((faces[:, [0, 1, 2]], faces[:, [0, 3, 2]]))
+        return cls(mesh.vertices, faces, **kwargs)
+
+    @property
+    def num_nodes(self):
+        return self.left.shape[0]
+
+    def _build(self, triangles):
+        num_faces = triangles.shape[0]
+        tri_min = triangles.min(axis=1)
+        tri_max = triangles.max(axis=1)
+        centroids = triangles.mean(axis=1)
+
+        face_index = np.arange(num_faces)
+        bbox_min, bbox_max, left, right, start, count = \
+            [], [], [], [], [], []
+
+        def new_node(lo, hi):
+            ids = face_index[lo:hi]
+            bbox_min.append(tri_min[ids].min(axis=0) if hi > lo
+                            else np.zeros(3))
+            bbox_max.append(tri_max[ids].max(axis=0) if hi > lo
+                            else np.zeros(3))
+            left.append(-1)
+            right.append(-1)
+            start.append(lo)
+            count.append(hi - lo)
+            return len(left) - 1
+
+        stack = [new_node(0, num_faces)]
+        while stack:
+            node = stack.pop()
+            lo, n = start[node], count[node]
+            if n <= self.leaf_size:
+                continue
+            ids = face_index[lo:lo + n]
+            if self.split == 'sah':
+                order, mid = self._split_sah(ids, tri_min, tri_max, centroids)
+            else:
+                order, mid = self._split_median(ids, centroids)
+            if order is None:
+                continue
+            face_index[lo:lo + n] = ids[order]
+            left[node] = new_node(lo, lo + mid)
+            right[node] = new_node(lo + mid, lo + n)
+            stack.append(left[node])
+            stack.append(right[node])
+
+        self.face_index = face_index
+        self.bbox_min = np.array(bbox_min, dtype=np.float64).reshape(-1, 3)
+        self.bbox_max = np.array(bbox_max, dtype=np.float64).reshape(-1, 3)
+        self.left = np.array(left, dtype=np.int64)
+        self.right = np.array(right, dtype=np.int64)
+        self.start = np.array(start, dtype=np.int64)
+        self.count = np.array(count, dtype=np.int64)
+
+    @staticmethod
+    def _split_median(ids, centroids):
+        cent = centroids[ids]
+        extent = cent.max(axis=0) - cent.min(axis=0)
+        axis = int(np.argmax(extent))
+        mid = ids.shape[0] // 2
+        order = np.argpartition(cent[:, axis], mid)
+        return order, mid
+
+    @staticmethod
+    def _split_sah(ids, tri_min, tri_max, centroids):
+        # exact sweep along every axis: sort the centroids, accumulate
+        # the bounding boxes from both ends and pick the split with the
+        # smallest area weighted triangle count
+        n = ids.shape[0]
+        cent = centroids[ids]
+        if np.all(cent.max(axis=0) - cent.min(axis=0) == 0):
+            return BVH._split_median(ids, centroids)
+        lo, hi = tri_min[ids], tri_max[ids]
+        best_cost, best_order, best_mid = np.inf, None, None
+        counts = np.arange(1, n)
+        for axis in range(3):
+            order = np.argsort(cent[:, axis], kind='stable')
+            s_lo, s_hi = lo[order], hi[order]
+            prefix = _half_area(np.minimum.accumulate(s_lo, axis=0),
+                                np.maximum.accumulate(s_hi, axis=0))
+            suffix = _half_area(
+                np.minimum.accumulate(s_lo[::-1], axis=0)[::-1],
+                np.maximum.accumulate(s_hi[::-1], axis=0)[::-1])
+            cost = prefix[:-1] * counts + suffix[1:] * counts[::-1]
+            mid = int(np.argmin(cost))
+            if cost[mid] < best_cost:
+                best_cost, best_order, best_mid = cost[mid], order, mid + 1
+        return best_order, best_mid
+
+    def _map(self, fn, num_items, chunk_size):
+        chunks = [(i, min(i + chunk_size, num_items))
+                  for i in range(0, num_items, chunk_size)]
+        if self.num_workers == 1 or len(chunks) <= 1:
+            return [fn(lo, hi) for lo, hi in chunks]
+        with ThreadPoolExecutor(self.num_workers) as pool:
+            return list(pool.map(lambda c: fn(*c), chunks))
+
+    def closest_point(self, points, chunk_size: int = 4096):
+        r"""Finds the closest point on the mesh for each query point.
+
+        Args:
+            points (torch.Tensor): query points (shape: N x 3).
+            chunk_size (int): number of points handled by a thread at a time.
+
+        Returns:
+            (torch.Tensor, torch.LongTensor, torch.Tensor): unsigned
+            distance to the surface, index of the closest face and the
+            barycentric coordinates of the closest point on that face.
+        """
+        device = points.device if torch.is_tensor(points) else 'cpu'
+        query = _to_numpy(points)
+        num_points = query.shape[0]
+        dist = np.full(num_points, np.inf)
+        face = np.full(num_points, -1, dtype=np.int64)
+        bary = np.zeros((num_points, 3))
+
+        def run(lo, hi):
+            d, f, b = self._closest_point(query[lo:hi])
+            dist[lo:hi], face[lo:hi], bary[lo:hi] = d, f, b
+
+        if self.num_faces > 0:
+            self._map(run, num_points, chunk_size)
+        face = np.where(face >= 0, self.face_index[np.maximum(face, 0)], -1)
+        return (torch.from_numpy(np.sqrt(dist)).float().to(device),
+                torch.from_numpy(face).to(device),
+                torch.from_numpy(bary).float().to(device))
+
+    def _closest_point(self, query):
+        num_points = query.shape[0]
+        best = np.full(num_points, np.inf)
+        best_face = np.full(num_points, -1, dtype=np.int64)
+        best_bary = np.zeros((num_points, 3))
+
+        # seed the upper bounds with the leaf reached by greedy descent
+        node = np.zeros(num_points, dtype=np.int64)
+        internal = self.left[node] >= 0
+        while internal.any():
+            idx = np.where(internal)[0]
+            l, r = self.left[node[idx]], self.right[node[idx]]
+            dl = _aabb_distance(query[idx], self.bbox_min[l], self.bbox_max[l])
+            dr = _aabb_distance(query[idx], self.bbox_min[r], self.bbox_max[r])
+            node[idx] = np.where(dl <= dr, l, r)
+            internal[idx] = self.left[node[idx]] >= 0
+        self._update_leaves(query, np.arange(num_points), node,
+                            best, best_face, best_bary)
+
+        # breadth first traversal over (point, node) pairs
+        bound = best.copy()
+        pts = np.arange(num_points)
+        nodes = np.zeros(num_points, dtype=np.int64)
+        while pts.shape[0] > 0:
+            lower = _aabb_distance(query[pts], self.bbox_min[nodes],
+                                   self.bbox_max[nodes])
+            keep = lower <= np.minimum(best[pts], bound[pts])
+            pts, nodes = pts[keep], nodes[keep]
+            # every face of a tight box touches a triangle, which bounds
+            # the distance from above and tightens pruning of the siblings
+            upper = _aabb_minmax_distance(query[pts], self.bbox_min[nodes],
+                                          self.bbox_max[nodes])
+            np.minimum.at(bound, pts, upper)
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                self._update_leaves(query, pts[leaf], nodes[leaf],
+                                    best, best_face, best_bary)
+            pts, nodes = pts[~leaf], nodes[~leaf]
+            pts = np.concatenate((pts, pts))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+
+        return best, best_face, best_bary
+
+    def _leaf_pairs(self, pts, nodes):
+        # expands (point, leaf) pairs into (point, triangle) pairs
+        counts = self.count[nodes]
+        offsets = np.cumsum(counts) - counts
+        total = int(counts.sum())
+        tri = np.repeat(self.start[nodes] - offsets, counts) + np.arange(total)
+        return np.repeat(pts, counts), tri
+
+    def _update_leaves(self, query, pts, nodes, best, best_face, best_bary):
+        pts, tri = self._leaf_pairs(pts, nodes)
+        if pts.shape[0] == 0:
+            return
+        t = self.triangles[tri]
+        bary = _closest_barycentric(query[pts], t[:, 0], t[:, 1], t[:, 2])
+        closest = (bary[:, :, None] * t).sum(axis=1)
+        d = ((query[pts] - closest) ** 2).sum(axis=1)
+        # keep the smallest distance for every point
+        sel = _argmin_per_group(d, pts, best)
+        best[pts[sel]] = d[sel]
+        best_face[pts[sel]] = tri[sel]
+        best_bary[pts[sel]] = bary[sel]
+
+    def intersect_ray(self, origins, directions, chunk_size: int = 4096):
+        r"""Finds the first intersection of each ray with the mesh.
+
+        Args:
+            origins (torch.Tensor): ray origins (shape: N x 3).
+            directions (torch.Tensor): ray directions (shape: N x 3).
+            chunk_size (int): number of rays handled by a thread at a time.
+
+        Returns:
+            (torch.Tensor, torch.LongTensor, torch.Tensor): ray parameter
+            of the hit (``inf`` when missed), index of the hit face (-1 when
+            missed) and barycentric coordinates of the hit.
+        """
+        device = origins.device if torch.is_tensor(origins) else 'cpu'
+        orig = _to_numpy(origins)
+        dirs = _to_numpy(directions)
+        num_rays = orig.shape[0]
+        hit_t = np.full(num_rays, np.inf)
+        face = np.full(num_rays, -1, dtype=np.int64)
+        bary = np.zeros((num_rays, 3))
+
+        def run(lo, hi):
+            t, f, b = self._intersect_ray(orig[lo:hi], dirs[lo:hi])
+            hit_t[lo:hi], face[lo:hi], bary[lo:hi] = t, f, b
+
+        if self.num_faces > 0:
+            self._map(run, num_rays, chunk_size)
+        face = np.where(face >= 0, self.face_index[np.maximum(face, 0)], -1)
+        return (torch.from_numpy(hit_t).float().to(device),
+                torch.from_numpy(face).to(device),
+                torch.from_numpy(bary).float().to(device))
+
+    def count_intersections(self, origins, directions,
+                            chunk_size: int = 4096):
+        r"""Counts every intersection of each ray with the mesh, which is
+        used for ray parity inside/outside tests.
+
+        Args:
+            origins (torch.Tensor): ray origins (shape: N x 3).
+            directions (torch.Tensor): ray directions (shape: N x 3).
+            chunk_size (int): number of rays handled by a thread at a time.
+
+        Returns:
+            (torch.LongTensor): number of faces hit by each ray.
+        """
+        device = origins.device if torch.is_tensor(origins) else 'cpu'
+        orig = _to_numpy(origins)
+        dirs = _to_numpy(directions)
+        num_rays = orig.shape[0]
+        hits = np.zeros(num_rays, dtype=np.int64)
+
+        def run(lo, hi):
+            hits[lo:hi] = self._count_intersections(orig[lo:hi], dirs[lo:hi])
+
+        if self.num_faces > 0:
+            self._map(run, num_rays, chunk_size)
+        return torch.from_numpy(hits).to(device)
+
+    def _count_intersections(self, orig, dirs):
+        num_rays = orig.shape[0]
+        with np.errstate(divide='ignore'):
+            inv_dirs = 1. / dirs
+        hits = np.zeros(num_rays, dtype=np.int64)
+
+        rays = np.arange(num_rays)
+        nodes = np.zeros(num_rays, dtype=np.int64)
+        while rays.shape[0] > 0:
+            enter = _ray_aabb(orig[rays], inv_dirs[rays],
+                              self.bbox_min[nodes], self.bbox_max[nodes])
+            keep = np.isfinite(enter)
+            rays, nodes = rays[keep], nodes[keep]
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                r, tri = self._leaf_pairs(rays[leaf], nodes[leaf])
+                t, _, _ = _ray_triangle(orig[r], dirs[r], self.triangles[tri])
+                hits += np.bincount(r[np.isfinite(t)], minlength=num_rays)
+            rays, nodes = rays[~leaf], nodes[~leaf]
+            rays = np.concatenate((rays, rays))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+
+        return hits
+
+    def winding_number(self, points, beta: float = 2.,
+                       chunk_size: int = 4096):
+        r"""Evaluates the generalized winding number of the mesh at each
+        point. Nodes far from a point, relative to their size, are replaced
+        by the dipole of their area weighted normals (Barill et al., Fast
+        Winding Numbers for Soups and Clouds, 2018), while close leaves are
+        summed exactly from triangle solid angles.
+
+        Args:
+            points (torch.Tensor): query points (shape: N x 3).
+            beta (float): a node is approximated when the point is further
+                than ``beta`` times the node radius from its center. Larger
+                values are more accurate and slower.
+            chunk_size (int): number of points handled by a thread at a time.
+
+        Returns:
+            (torch.Tensor): winding numbers, close to 1 inside and 0 outside
+            a closed mesh with outward facing normals.
+        """
+        device = points.device if torch.is_tensor(points) else 'cpu'
+        query = _to_numpy(points)
+        num_points = query.shape[0]
+        winding = np.zeros(num_points)
+        if self.num_faces > 0:
+            if getattr(self, '_dipoles', None) is None:
+                self._dipoles = self._compute_dipoles()
+
+            def run(lo, hi):
+                winding[lo:hi] = self._winding_number(query[lo:hi], beta)
+
+            self._map(run, num_points, chunk_size)
+        return torch.from_numpy(winding).float().to(device)
+
+    def _compute_dipoles(self):
+        # every node covers a contiguous range of leaf ordered triangles, so
+        # node sums are differences of prefix sums
+        t = self.triangles
+        area_normals = np.cross(t[:, 1] - t[:, 0], t[:, 2] - t[:, 0]) / 2.
+        areas = np.linalg.norm(area_normals, axis=1)
+        weighted = t.mean(axis=1) * areas[:, None]
+
+        def range_sum(values):
+            prefix = np.concatenate((np.zeros((1,) + values.shape[1:]),
+                                     np.cumsum(values, axis=0)))
+            return prefix[self.start + self.count] - prefix[self.start]
+
+        normal = range_sum(area_normals)
+        area = range_sum(areas)
+        center = np.where(area[:, None] > 0,
+                          range_sum(weighted) / np.maximum(area, 1e-300)[:, None],
+                          (self.bbox_min + self.bbox_max) / 2.)
+        # the node's triangles lie in its box, bounded by the farthest corner
+        radius = np.linalg.norm(np.maximum(np.abs(self.bbox_min - center),
+                                           np.abs(self.bbox_max - center)),
+                                axis=1)
+        return center, normal, radius
+
+    def _winding_number(self, query, beta):
+        center, normal, radius = self._dipoles
+        num_points = query.shape[0]
+        winding = np.zeros(num_points)
+
+        pts = np.arange(num_points)
+        nodes = np.zeros(num_points, dtype=np.int64)
+        while pts.shape[0] > 0:
+            offset = center[nodes] - query[pts]
+            dist = np.linalg.norm(offset, axis=1)
+            far = dist > beta * radius[nodes]
+            if far.any():
+                d = dist[far]
+                dipole = (offset[far] * normal[nodes[far]]).sum(axis=1) / d ** 3
+                winding += np.bincount(pts[far], dipole / (4 * np.pi),
+                                       minlength=num_points)
+            pts, nodes = pts[~far], nodes[~far]
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                p, tri = self._leaf_pairs(pts[leaf], nodes[leaf])
+                omega = _solid_angle(query[p], self.triangles[tri])
+                winding += np.bincount(p, omega / (4 * np.pi),
+                                       minlength=num_points)
+            pts, nodes = pts[~leaf], nodes[~leaf]
+            pts = np.concatenate((pts, pts))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+
+        return winding
+
+    def _intersect_ray(self, orig, dirs):
+        num_rays = orig.shape[0]
+        with np.errstate(divide='ignore'):
+            inv_dirs = 1. / dirs
+        best = np.full(num_rays, np.inf)
+        best_face = np.full(num_rays, -1, dtype=np.int64)
+        best_bary = np.zeros((num_rays, 3))
+
+        rays = np.arange(num_rays)
+        nodes = np.zeros(num_rays, dtype=np.int64)
+        while rays.shape[0] > 0:
+            enter = _ray_aabb(orig[rays], inv_dirs[rays],
+                              self.bbox_min[nodes], self.bbox_max[nodes])
+            keep = np.isfinite(enter) & (enter <= best[rays])
+            rays, nodes = rays[keep], nodes[keep]
+            leaf = self.left[nodes] < 0
+            if leaf.any():
+                r, tri = self._leaf_pairs(rays[leaf], nodes[leaf])
+                t, u, v = _ray_triangle(orig[r], dirs[r], self.triangles[tri])
+                sel = _argmin_per_group(t, r, best)
+                best[r[sel]] = t[sel]
+                best_face[r[sel]] = tri[sel]
+                best_bary[r[sel]] = np.stack(
+                    (1. - u[sel] - v[sel], u[sel], v[sel]), axis=1)
+            rays, nodes = rays[~leaf], nodes[~leaf]
+            rays = np.concatenate((rays, rays))
+            nodes = np.concatenate((self.left[nodes], self.right[nodes]))
+
+        return best, best_face, best_bary
+
+
+def _to_numpy(tensor):
+    if torch.is_tensor(tensor):
+        tensor = tensor.data.cpu().numpy()
+    return np.asarray(tensor, dtype=np.float64).reshape(-1, 3)
+
+
+def _argmin_per_group(values, groups, current):
+    # indices of the smallest value of each group, restricted to the groups
+    # where it improves on `current`
+    lowest = current.copy()
+    np.minimum.at(lowest, groups, values)
+    sel = np.where((values == lowest[groups]) & (values < current[groups]))[0]
+    _, first = np.unique(groups[sel], return_index=True)
+    return sel[first]
+
+
+def _half_area(bmin, bmax):
+    ext = bmax - bmin
+    return ext[:, 0] * ext[:, 1] + ext[:, 1] * ext[:, 2] + \
+        ext[:, 2] * ext[:, 0]
+
+
+def _aabb_distance(points, bmin, bmax):
+    # squared distance from each point to its paired box
+    d = np.maximum(bmin - points, 0) + np.maximum(points - bmax, 0)
+    return (d ** 2).sum(axis=1)
+
+
+def _aabb_minmax_distance(points, bmin, bmax):
+    # squared upper bound on the distance from each point to the closest
+    # triangle inside its paired (tight) box
+    center = (bmin + bmax) / 2.
+    near = np.where(points <= center, bmin, bmax)
+    far = np.where(points >= center, bmin, bmax)
+    d_near = (points - near) ** 2
+    d_far = (points - far) ** 2
+    return (d_far.sum(axis=1, keepdims=True) - d_far + d_near).min(axis=1)
+
+
+def _ray_aabb(orig, inv_dirs, bmin, bmax):
+    # slab test, returns the entry parameter or inf when the box is missed
+    with np.errstate(invalid='ignore'):
+        t0 = (bmin - orig) * inv_dirs
+        t1 = (bmax - orig) * inv_dirs
+    t0 = np.where(np.isnan(t0), -np.inf, t0)
+    t1 = np.where(np.isnan(t1), np.inf, t1)
+    t_near = np.minimum(t0, t1).max(axis=1)
+    t_far = np.maximum(t0, t1).min(axis=1)
+    t_near = np.maximum(t_near, 0.)
+    return np.where(t_near <= t_far, t_near, np.inf)
+
+
+def _ray_triangle(orig, dirs, triangles, eps=1e-12):
+    # Moller-Trumbore intersection, returns t = inf when there is no hit
+    e1 = triangles[:, 1] - triangles[:, 0]
+    e2 = triangles[:, 2] - triangles[:, 0]
+    p = np.cross(dirs, e2)
+    det = (e1 * p).sum(axis=1)
+    valid = np.abs(det) > eps
+    inv_det = 1. / np.where(valid, det, 1.)
+    s = orig - triangles[:, 0]
+    u = (s * p).sum(axis=1) * inv_det
+    q = np.cross(s, e1)
+    v = (dirs * q).sum(axis=1) * inv_det
+    t = (e2 * q).sum(axis=1) * inv_det
+    valid &= (u >= 0) & (v >= 0) & (u + v <= 1) & (t >= 0)
+    return np.where(valid, t, np.inf), u, v
+
+
+def _solid_angle(points, triangles):
+    # signed solid angle of each triangle seen from its paired point
+    # (Van Oosterom and Strackee, 1983)
+    a = triangles[:, 0] - points
+    b = triangles[:, 1] - points
+    c = triangles[:, 2] - points
+    la, lb, lc = (np.linalg.norm(x, axis=1) for x in (a, b, c))
+    numer = (a * np.cross(b, c)).sum(axis=1)
+    denom = la * lb * lc + (a * b).sum(axis=1) * lc + \
+        (b * c).sum(axis=1) * la + (c * a).sum(axis=1) * lb
+    return 2. * np.arctan2(numer, denom)
+
+
+def _closest_barycentric(p, a, b, c):
+    r"""Barycentric coordinates of the closest point to ``p`` on each
+    triangle ``abc``, following the region tests of Ericson, Real-Time
+    Collision Detection, section 5.1.5.
+    """
+    ab, ac = b - a, c - a
+    ap, bp, cp = p - a, p - b, p - c
+    d1, d2 = (ab * ap).sum(1), (ac * ap).sum(1)
+    d3, d4 = (ab * bp).sum(1), (ac * bp).sum(1)
+    d5, d6 = (ab * cp).sum(1), (ac * cp).sum(1)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    def safe_div(x, y):
+        return x / np.where(y == 0, 1., y)
+
+    bary = np.zeros((p.shape[0], 3))
+    done = np.zeros(p.shape[0], dtype=bool)
+
+    def assign(mask, u, v, w):
+        mask = mask & ~done
+        bary[mask, 0] = u[mask] if np.ndim(u) else u
+        bary[mask, 1] = v[mask] if np.ndim(v) else v
+        bary[mask, 2] = w[mask] if np.ndim(w) else w
+        done[mask] = True
+
+    # vertex regions
+    assign((d1 <= 0) & (d2 <= 0), 1., 0., 0.)
+    assign((d3 >= 0) & (d4 <= d3), 0., 1., 0.)
+    # edge ab
+    t = safe_div(d1, d1 - d3)
+    assign((vc <= 0) & (d1 >= 0) & (d3 <= 0), 1. - t, t, 0.)
+    assign((d6 >= 0) & (d5 <= d6), 0., 0., 1.)
+    # edge ac
+    t = safe_div(d2, d2 - d6)
+    assign((vb <= 0) & (d2 >= 0) & (d6 <= 0), 1. - t, 0., t)
+    # edge bc
+    t = safe_div(d4 - d3, (d4 - d3) + (d5 - d6))
+    assign((va <= 0) & ((d4 - d3) >= 0) & ((d5 - d6) >= 0), 0., 1. - t, t)
+    # face interior
+    denom = safe_div(1., va + vb + vc)
+    v, w = vb * denom, vc * denom
+    assign(np.ones(p.shape[0], dtype=bool), 1. - v - w, v, w)
+    return bary
@@ -80,6 +80,8 @@ class Mesh():
         self.ee_count = ee_count
         # adjacency matrix for verts
         self.adj = None
+        # bounding volume hierarchy over the faces, built on demand
+        self.bvh = None
 
         # Initialize device on which tensors reside.
         self.device = self.vertices.device
@@ -916,6 +918,32 @@ class Mesh():
         lap = self.vertices - neighbor_sum
         return lap
 
+    def get_bvh(self, **kwargs):
+        r"""Returns a bounding volume hierarchy over the faces of the mesh.
+        The hierarchy is cached on the mesh and rebuilt only when the
+        vertices or faces change.
+
+            Args:
+                **kwargs: options passed to :class:`kaolin.rep.BVH`.
+
+            Returns:
+                (kaolin.rep.BVH): the acceleration structure.
+
+            Example:
+                >>> mesh = TriangleMesh.from_obj('model.obj')
+                >>> bvh = mesh.get_bvh()
+                >>> distances, face_idx, barycentric = bvh.closest_point(
+                ...     torch.rand(100, 3))
+
+        """
+        key = (self.vertices.data_ptr(), self.vertices._version,
+               self.faces.data_ptr(), self.faces._version,
+               tuple(sorted(kwargs.items())))
+        if getattr(self, 'bvh', None) is None or self._bvh_key != key:
+            self.bvh = kal.rep.BVH.from_mesh(self, **kwargs)
+            self._bvh_key = key
+        return self.bvh
+
     def show(self):
         r""" Visuailizes the mesh.
 
@@ -0,0 +1,456 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import math
+from typing import Optional, Union, Sequence, Callable
+
+import numpy as np
+import torch
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+import kaolin as kal
+from kaolin.rep.VoxelGrid import VoxelGrid
+from kaolin.rep.SparseVoxelGrid import SparseVoxelGrid
+
+
+class OctreeVoxelGrid(object):
+    r"""Voxel grid stored as an octree, so that large empty or occupied
+    regions take a single node.
+
+    The cube spanned by the grid is split recursively in eight octants down
+    to ``depth`` levels, which gives an effective resolution of
+    :math:`2^{depth}`. Every node is ``EMPTY``, ``FULL`` or ``MIXED``, and
+    only mixed nodes have children. The nodes are stored level by level in
+    breadth-first order as one byte each: the eight children of the
+    :math:`i`-th mixed node of a level are the nodes :math:`8i` to
+    :math:`8i + 7` of the next level, in the order of their octant
+    :math:`4 x + 2 y + z`. The tree therefore has no pointers, and a point
+    is located by descending it in :math:`O(depth)`.
+
+    Args:
+        states (sequence of torch.Tensor): state of the nodes of every level,
+            starting with the root (uint8).
+        origin (float or sequence of float): minimum corner of the cube
+            spanned by the grid.
+        size (float): side of the cube.
+
+    Example:
+        >>> mesh = kal.rep.TriangleMesh.from_obj('model.obj')
+        >>> octree = OctreeVoxelGrid.from_mesh(mesh, depth=10)
+        >>> len(octree)
+        10307233
+        >>> inside = octree.query(torch.rand(1000, 3) - .5)
+        >>> octree.save('model.npz')
+    """
+
+    EMPTY = 0
+    FULL = 1
+    MIXED = 2
+
+    def __init__(self, states: Sequence[torch.Tensor],
+                 origin: Union[float, Sequence[float]] = 0.,
+                 size: float = 1.):
+        assert len(states) > 0 and states[0].shape[0] == 1, \
+            'the first level must hold the root only'
+        self.states = [s.to(torch.uint8) for s in states]
+        self.depth = len(self.states) - 1
+        self.origin = torch.as_tensor(origin, dtype=torch.float,
+                                      device=self.device).expand(3).clone()
+        self.size = float(size)
+
+        # first child of every node, from the number of mixed nodes before
+        # it on its level
+        self._first_child = []
+        for level, s in enumerate(self.states[:-1]):
+            mixed = s == self.MIXED
+            assert self.states[level + 1].shape[0] == 8 * int(mixed.sum()), \
+                'level {} does not match the mixed nodes above it'.format(
+                    level + 1)
+            self._first_child.append(8 * (torch.cumsum(mixed, 0) - 1))
+        assert not (self.states[-1] == self.MIXED).any(), \
+            'the last level cannot have mixed nodes'
+
+    @property
+    def resolution(self):
+        return 2 ** self.depth
+
+    @property
+    def device(self):
+        return self.states[0].device
+
+    def __len__(self):
+        return sum(s.shape[0] for s in self.states)
+
+    @property
+    def nbytes(self):
+        r"""Memory taken by the nodes."""
+        return len(self)
+
+    def to(self, device):
+        r"""Returns a copy of the octree on the given device."""
+        return OctreeVoxelGrid([s.to(device) for s in self.states],
+                               self.origin.tolist(), self.size)
+
+    @classmethod
+    def from_sparse(cls, grid: SparseVoxelGrid,
+                    origin: Union[float, Sequence[float]] = 0.,
+                    size: Optional[float] = None):
+        r"""Builds an octree from the occupied voxels of a sparse grid.
+
+        Args:
+            grid (SparseVoxelGrid): occupied voxels
+            origin (float or sequence of float): minimum corner of the cube
+            size (float): side of the cube (default: one unit per voxel)
+
+        Returns:
+            (OctreeVoxelGrid): the octree, whose resolution is the power of
+            two above the largest side of the grid
+        """
+        depth = max(int(math.ceil(math.log2(max(grid.resolution)))), 0)
+        full = [grid.coords.new_zeros(0, 3)] * depth + [grid.coords]
+        if size is None:
+            size = 2 ** depth
+        return cls._build(full, origin, size)
+
+    @classmethod
+    def from_dense(cls, voxels: Union[torch.Tensor, VoxelGrid],
+                   thresh: float = .5):
+        r"""Builds an octree from the voxels of a dense array above a
+        threshold, with one unit per voxel.
+
+        Args:
+            voxels (torch.Tensor or VoxelGrid): dense voxel array
+            thresh (float): voxels with a value above it are occupied
+
+        Returns:
+            (OctreeVoxelGrid): the octree
+        """
+        return cls.from_sparse(SparseVoxelGrid.from_dense(voxels, thresh))
+
+    @classmethod
+    def from_mesh(cls, mesh: 'kal.rep.Mesh', depth: int,
+                  solid: bool = False, conservative: bool = False):
+        r"""Voxelizes a mesh into an octree, with the voxels of
+        :func:`kaolin.conversions.trianglemesh_to_sparsevoxelgrid` at
+        resolution :math:`2^{depth}`. The octree keeps the coordinates of
+        the mesh.
+
+        Args:
+            mesh (kaolin.rep.Mesh): mesh to voxelize
+            depth (int): number of levels below the root
+            solid (bool): whether to also fill the inside of the mesh, which
+                must then be watertight. The inside is decided with
+                :func:`kaolin.rep.SDF.check_sign` once per group of touching
+                empty nodes, and adds few nodes.
+            conservative (bool): whether voxels touched by the surface on
+                their boundary are occupied
+
+        Returns:
+            (OctreeVoxelGrid): the octree
+        """
+        resolution = 2 ** depth
+        surface = kal.conversions.trianglemesh_to_sparsevoxelgrid(
+            mesh, resolution, conservative=conservative)
+        verts_min = mesh.vertices.min().item()
+        verts_max = mesh.vertices.max().item()
+        size = resolution * (verts_max - verts_min) / (resolution - 1)
+        full = [surface.coords.new_zeros(0, 3)] * depth + [surface.coords]
+        octree = cls._build(full, verts_min, size)
+        if not solid:
+            return octree
+
+        # empty nodes do not meet the surface, so they are either entirely
+        # inside or outside, and so are the empty nodes they touch: the
+        # sign is checked once per group of connected empty nodes
+        coords, levels, labels = octree._empty_components()
+        _, first, inverse = np.unique(labels, return_index=True,
+                                      return_inverse=True)
+        first = torch.from_numpy(first).to(coords.device)
+        side = octree.size / 2. ** levels[first].unsqueeze(1)
+        centers = octree.origin + (coords[first].float() + .5) * side
+        inside = kal.rep.SDF.check_sign(mesh,
+                                        centers.to(mesh.vertices.device))
+        inside = torch.as_tensor(inside).view(-1).cpu().numpy()[inverse]
+        inside = torch.from_numpy(inside).to(coords.device)
+        for level in range(depth + 1):
+            filled = coords[inside & (levels == level)]
+            full[level] = torch.cat((full[level], filled))
+        return cls._build(full, verts_min, size)
+
+    @classmethod
+    def from_sdf(cls, sdf: Callable, depth: int, bbox_center: float = 0.,
+                 bbox_dim: float = 1., init_depth: int = 4,
+                 chunk_size: int = 2 ** 18):
+        r"""Builds an octree from a signed distance function, negative
+        inside, by refining only the nodes the surface may cross.
+
+        A node is split when the distance at its center is smaller than
+        half its diagonal; otherwise it is full or empty depending on the
+        sign. On the last level, a voxel is full when the distance at its
+        center is not positive, as in
+        :func:`kaolin.conversions.sdf_to_voxelgrid`. This is exact for
+        distance functions, such as :class:`kaolin.rep.MeshSDF`, and only
+        approximate for functions which overestimate the distance.
+
+        Args:
+            sdf (callable): signed distance of a set of points
+                (shape: :math:`N \times 3`)
+            depth (int): number of levels below the root
+            bbox_center (float): center of the cube spanned by the octree
+            bbox_dim (float): side of the cube
+            init_depth (int): level from which nodes start being pruned
+            chunk_size (int): number of points evaluated at once
+
+        Returns:
+            (OctreeVoxelGrid): the octree
+
+        Example:
+            >>> sdf = kal.rep.SDF.sphere()
+            >>> octree = OctreeVoxelGrid.from_sdf(sdf, 8, bbox_dim=2.)
+        """
+        origin = bbox_center - bbox_dim / 2.
+        init_depth = min(init_depth, depth)
+        grid = torch.arange(2 ** init_depth)
+        coords = torch.stack(torch.meshgrid(grid, grid, grid, indexing='ij'),
+                             dim=-1).view(-1, 3)
+        octants = _octants(coords.device)
+        full = [coords.new_zeros(0, 3)] * (depth + 1)
+        for level in range(init_depth, depth + 1):
+            side = bbox_dim / 2 ** level
+            centers = origin + (coords.float() + .5) * side
+            distances = torch.cat([
+                torch.as_tensor(sdf(chunk)).view(-1).float().cpu()
+                for chunk in centers.split(chunk_size)]) \
+                if coords.shape[0] > 0 else centers.new_zeros(0)
+            if level == depth:
+                full[level] = coords[distances <= 0]
+                break
+            half_diagonal = side * math.sqrt(3) / 2
+            full[level] = coords[distances < -half_diagonal]
+            coords = coords[distances.abs() <= half_diagonal]
+            coords = (2 * coords.unsqueeze(1) + octants).view(-1, 3)
+        return cls._build(full, origin, bbox_dim)
+
+    @classmethod
+    def _build(cls, full, origin, size):
+        # full[level] holds the coordinates of the nodes known to be full on
+        # every level. Going up, a node is full when its eight children are
+        # and mixed when some of its descendants are occupied.
+        depth = len(full) - 1
+        full_keys = [None] * (depth + 1)
+        mixed_keys = [None] * (depth + 1)
+        device = full[-1].device
+        full_keys[depth] = _unique(_key(full[depth].long(), depth))
+        mixed_keys[depth] = full_keys[depth].new_zeros(0)
+        for level in range(depth, 0, -1):
+            parents = (_coords(full_keys[level], level) // 2)
+            parents, counts = _key(parents, level - 1).unique(
+                return_counts=True)
+            given = _unique(_key(full[level - 1].long().to(device), level - 1))
+            full_keys[level - 1] = _unique(torch.cat((given,
+                                                      parents[counts == 8])))
+            occupied = _unique(torch.cat((
+                _key(_coords(mixed_keys[level], level) // 2, level - 1),
+                parents)))
+            mixed_keys[level - 1] = occupied[
+                ~_isin(occupied, full_keys[level - 1])]
+
+        # lay the nodes out breadth first
+        coords = torch.zeros(1, 3, dtype=torch.long, device=device)
+        octants = _octants(device)
+        states = []
+        for level in range(depth + 1):
+            keys = _key(coords, level)
+            s = torch.zeros(keys.shape[0], dtype=torch.uint8, device=device)
+            s[_isin(keys, full_keys[level])] = cls.FULL
+            s[_isin(keys, mixed_keys[level])] = cls.MIXED
+            states.append(s)
+            coords = (2 * coords[s == cls.MIXED].unsqueeze(1) +
+                      octants).view(-1, 3)
+        return cls(states, origin, size)
+
+    def levels(self):
+        r"""Iterates over the levels of the octree, from the root down, which
+        gives coarser to finer approximations of the shape.
+
+        Yields:
+            (torch.LongTensor, torch.ByteTensor): integer coordinates of the
+            nodes of a level, on a grid of resolution :math:`2^{level}`, and
+            their states
+        """
+        coords = torch.zeros(1, 3, dtype=torch.long, device=self.device)
+        octants = _octants(self.device)
+        for states in self.states:
+            yield coords, states
+            coords = (2 * coords[states == self.MIXED].unsqueeze(1) +
+                      octants).view(-1, 3)
+
+    def to_sparse(self, level: Optional[int] = None):
+        r"""Voxels occupied at a level of detail. Mixed nodes count as
+        occupied, so coarser levels contain the finer ones.
+
+        Args:
+            level (int): level of detail, at resolution :math:`2^{level}`
+                (default: ``depth``)
+
+        Returns:
+            (SparseVoxelGrid): the occupied voxels
+        """
+        if level is None:
+            level = self.depth
+        assert 0 <= level <= self.depth, 'level must be in [0, depth]'
+        occupied = []
+        for l, (coords, states) in enumerate(self.levels()):
+            if l == level:
+                occupied.append(coords[states != self.EMPTY])
+                break
+            # full nodes above the level cover a block of voxels
+            coords = coords[states == self.FULL]
+            side = 2 ** (level - l)
+            block = torch.arange(side, device=self.device)
+            block = torch.stack(torch.meshgrid(block, block, block,
+                                               indexing='ij'),
+                                dim=-1).view(-1, 3)
+            occupied.append((side * coords.unsqueeze(1) + block).view(-1, 3))
+        return SparseVoxelGrid(torch.cat(occupied), resolution=2 ** level)
+
+    def to_dense(self, level: Optional[int] = None):
+        r"""Converts to a dense voxel array at a level of detail, see
+        :meth:`to_sparse`.
+
+        Returns:
+            (torch.Tensor): voxel array of resolution :math:`2^{level}`
+        """
+        return self.to_sparse(level).to_dense()
+
+    def query(self, points: torch.Tensor, level: Optional[int] = None):
+        r"""Occupancy of a set of points.
+
+        Args:
+            points (torch.Tensor): points in the coordinates of the octree
+                (shape: :math:`\dots \times 3`)
+            level (int): level of detail at which to stop, where mixed nodes
+                count as occupied (default: ``depth``)
+
+        Returns:
+            (torch.BoolTensor): whether every point is in an occupied node
+        """
+        if level is None:
+            level = self.depth
+        points = points.to(self.device)
+        shape = points.shape[:-1]
+        points = (points.reshape(-1, 3) - self.origin) / self.size
+        inside = ((points >= 0) & (points < 1)).all(dim=1)
+        coords = (points[inside] * self.resolution).long().clamp(
+            0, self.resolution - 1)
+
+        _, _, states = self._locate(coords >> (self.depth - level), level)
+        occupied = torch.zeros(points.shape[0], dtype=torch.bool,
+                               device=self.device)
+        occupied[inside] = states != self.EMPTY
+        return occupied.view(shape)
+
+    def _locate(self, coords, level):
+        # node containing the voxels of a level, or the leaf above them
+        node = torch.zeros(coords.shape[0], dtype=torch.long,
+                           device=self.device)
+        levels = torch.zeros_like(node)
+        states = self.states[0][node]
+        for l in range(level):
+            mixed = states == self.MIXED
+            if not mixed.any():
+                break
+            bits = (coords[mixed] >> (level - l - 1)) & 1
+            node[mixed] = self._first_child[l][node[mixed]] + \
+                4 * bits[:, 0] + 2 * bits[:, 1] + bits[:, 2]
+            states[mixed] = self.states[l + 1][node[mixed]]
+            levels[mixed] += 1
+        return node, levels, states
+
+    def _empty_components(self):
+        # connected components of the empty nodes, linked when their
+        # faces touch
+        offsets = np.cumsum([0] + [s.shape[0] for s in self.states])
+        coords, levels, rows, cols = [], [], [], []
+        faces = torch.cat((torch.eye(3, dtype=torch.long),
+                           -torch.eye(3, dtype=torch.long))).to(self.device)
+        for level, (c, states) in enumerate(self.levels()):
+            empty = (states == self.EMPTY).nonzero().view(-1)
+            coords.append(c[empty])
+            levels.append(torch.full_like(empty, level))
+            rows.append(offsets[level] + empty)
+            for face in faces:
+                neighbors = c[empty] + face
+                valid = ((neighbors >= 0) &
+                         (neighbors < 2 ** level)).all(dim=1)
+                node, l, states = self._locate(neighbors[valid], level)
+                touching = states == self.EMPTY
+                cols.append(torch.stack((
+                    offsets[level] + empty[valid][touching],
+                    torch.from_numpy(offsets).to(self.device)[l[touching]] +
+                    node[touching])))
+        cols = torch.cat(cols, dim=1).cpu().numpy()
+        graph = coo_matrix((np.ones(cols.shape[1], dtype=bool),
+                            (cols[0], cols[1])),
+                           shape=(offsets[-1], offsets[-1]))
+        _, labels = connected_components(graph, directed=False)
+        rows = torch.cat(rows).cpu().numpy()
+        return torch.cat(coords), torch.cat(levels), labels[rows]
+
+    def save(self, filename: str):
+        r"""Saves the octree to a compressed ``.npz`` file."""
+        np.savez_compressed(
+            filename,
+            states=torch.cat(self.states).cpu().numpy(),
+            counts=np.array([s.shape[0] for s in self.states]),
+            origin=self.origin.cpu().numpy(),
+            size=np.array(self.size))
+
+    @classmethod
+    def load(cls, filename: str, device: str = 'cpu'):
+        r"""Loads an octree saved with :meth:`save`."""
+        data = np.load(filename)
+        states = torch.from_numpy(data['states']).to(device)
+        states = states.split(data['counts'].tolist())
+        return cls(states, data['origin'].tolist(), float(data['size']))
+
+
+def _key(coords, level):
+    resolution = 2 ** level
+    return (coords[:, 0] * resolution + coords[:, 1]) * resolution + \
+        coords[:, 2]
+
+
+def _coords(keys, level):
+    resolution = 2 ** level
+    return torch.stack((keys // resolution ** 2, keys // resolution %
+                        resolution, keys % resolution), dim=1)
+
+
+def _unique(keys):
+    return torch.unique(keys, sorted=True)
+
+
+def _isin(keys, sorted_keys):
+    if sorted_keys.shape[0] == 0:
+        return torch.zeros_like(keys, dtype=torch.bool)
+    index = torch.searchsorted(sorted_keys, keys).clamp(
+        max=sorted_keys.shape[0] - 1)
+    return sorted_keys[index] == keys
+
+
+def _octants(device):
+    octants = torch.arange(8, device=device)
+    return torch.stack((octants // 4, octants // 2 % 2, octants % 2), dim=1)
@@ -12,10 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
+import os
 from typing import Optional
 
 import numpy as np
 import torch
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import (breadth_first_order, connected_components,
+                                  minimum_spanning_tree)
+from scipy.spatial import cKDTree
 
 from kaolin import helpers
 
@@ -59,6 +65,44 @@ class PointCloud(object):
             self.normals = normals.clone() if copy else normals
             self.normals = self.normals.to(device)
 
+    def downsample(self, method: str = 'random',
+                   num_points: Optional[int] = None,
+                   voxel_size: Optional[float] = None,
+                   radius: Optional[float] = None):
+        r"""Downsamples the pointcloud, see :func:`downsample_points`.
+
+        Returns:
+            (PointCloud): the downsampled pointcloud, with the normals of the
+            sampled points.
+            (torch.LongTensor): indices of the sampled points, to gather their
+            features.
+
+        Example:
+            >>> cloud = PointCloud(torch.rand(100000, 3))
+            >>> sparse, idx = cloud.downsample('voxel', voxel_size=.05)
+        """
+        points, idx = downsample_points(self.points, method, num_points,
+                                        voxel_size, radius)
+        normals = None
+        if self.normals is not None:
+            normals = _gather_points(self.normals, idx)
+        return PointCloud(points, normals, device=points.device), idx
+
+    def estimate_normals(self, k: int = 16, orient: Optional[str] = None,
+                         viewpoint: Optional[torch.Tensor] = None):
+        r"""Estimates the normals of the pointcloud and stores them, see
+        :func:`estimate_normals`.
+
+        Returns:
+            (torch.Tensor): the estimated normals.
+
+        Example:
+            >>> cloud = PointCloud(torch.rand(100000, 3))
+            >>> normals = cloud.estimate_normals(orient='mst')
+        """
+        self.normals = estimate_normals(self.points, k, orient, viewpoint)
+        return self.normals
+
 
 def bounding_points(points: torch.Tensor, bbox: list, padding: float = .05):
     r"""Returns the indices of a set of points which lies within a supplied
@@ -140,3 +184,417 @@ def random_input_dropout(points: torch.Tensor,
         points = points.squeeze(0)
 
     return points
+
+
+def downsample_points(points: torch.Tensor, method: str = 'random',
+                      num_points: Optional[int] = None,
+                      voxel_size: Optional[float] = None,
+                      radius: Optional[float] = None):
+    r"""Downsamples a pointcloud, or a batch of pointclouds.
+
+    Args:
+        points (torch.Tensor): Input pointcloud (shape: :math:`N \times D`,
+            or :math:`B \times N \times D` for a batch).
+        method (str):
+            -'random': num_points points drawn uniformly without replacement.
+            -'furthest': num_points points by furthest point sampling,
+                starting from the first point.
+            -'voxel': centroid of the points in every occupied cell of a grid
+                of voxel_size, the sampled point being the one closest to it.
+            -'poisson': maximal subset of points at least radius apart,
+                accepted in random order with a spatial hash of the samples.
+        num_points (int): number of points sampled by random and furthest.
+        voxel_size (float): size of the cells pooled by voxel.
+        radius (float): minimal distance between the points sampled by
+            poisson.
+
+    Returns:
+        (torch.Tensor): sampled points, or voxel centroids.
+        (torch.LongTensor): indices of the sampled points. As the voxel and
+        poisson methods keep a different number of points in every cloud of
+        a batch, shorter rows are padded by repeating their first sample.
+
+    Example:
+        >>> points = torch.rand(2, 100000, 3)
+        >>> samples, idx = downsample_points(points, 'poisson', radius=.05)
+        >>> features = torch.rand(2, 100000, 16)
+        >>> features = torch.gather(features, 1,
+        ...     idx.unsqueeze(-1).expand(-1, -1, 16))
+    """
+    assert method in ['random', 'furthest', 'voxel', 'poisson'], \
+        'method must be random, furthest, voxel or poisson'
+    helpers._assert_tensor(points)
+    assert points.dim() in [2, 3], \
+        'Expected a pointcloud or a batch of pointclouds'
+    batched = points.dim() == 3
+    if not batched:
+        points = points.unsqueeze(0)
+
+    if method in ['random', 'furthest']:
+        assert num_points is not None, 'num_points is needed by ' + method
+        assert num_points <= points.shape[1], \
+            'Cannot sample more points than the pointcloud holds'
+        if method == 'random':
+            idx = torch.rand(points.shape[:2], device=points.device).argsort(
+                dim=1)[:, :num_points].sort(dim=1)[0]
+        else:
+            idx = _furthest_point_sample(points, num_points)
+        samples = _gather_points(points, idx)
+    elif method == 'voxel':
+        assert voxel_size is not None, 'voxel_size is needed by voxel'
+        samples, idx = _voxel_downsample(points, voxel_size)
+    else:
+        assert radius is not None, 'radius is needed by poisson'
+        idx = _poisson_disk_sample(points, radius)
+        samples = _gather_points(points, idx)
+
+    if not batched:
+        return samples[0], idx[0]
+    return samples, idx
+
+
+def _gather_points(points: torch.Tensor, idx: torch.Tensor):
+    r"""Points of every cloud in the batch at the indices of its row. """
+    return torch.gather(points, -2, idx.unsqueeze(-1).expand(
+        *idx.shape, points.shape[-1]))
+
+
+def _pad_rows(rows: list):
+    r"""Stacks rows of different lengths, repeating the first entry of the
+    shorter ones.
+    """
+    length = max(row.shape[0] for row in rows)
+    padded = rows[0].new_empty((len(rows), length, *rows[0].shape[1:]))
+    for i, row in enumerate(rows):
+        padded[i] = row[0]
+        padded[i, :row.shape[0]] = row
+    return padded
+
+
+def _furthest_point_sample(points: torch.Tensor, num_points: int):
+    r"""Batched furthest point sampling, one pass over the points per
+    sample.
+    """
+    batch_size, N, _ = points.shape
+    batch = torch.arange(batch_size, device=points.device)
+    idx = torch.zeros(batch_size, num_points, dtype=torch.long,
+                      device=points.device)
+    distances = torch.full((batch_size, N), float('inf'),
+                           device=points.device)
+    norms = (points ** 2).sum(dim=-1)
+    for i in range(1, num_points):
+        last = points[batch, idx[:, i - 1]]
+        # |p - q|^2 = |p|^2 - 2 p.q + |q|^2 in one pass over the points
+        squared = torch.baddbmm(norms.unsqueeze(-1), points,
+                                last.unsqueeze(-1), alpha=-2).squeeze(-1)
+        squared += norms[batch, idx[:, i - 1]].unsqueeze(-1)
+        torch.min(distances, squared, out=distances)
+        idx[:, i] = distances.argmax(dim=1)
+    return idx
+
+
+def _cell_keys(cells: torch.Tensor, extent: torch.Tensor):
+    r"""Linear keys of the cells of a batch (shape: :math:`B \times N \times
+    D`) in grids of the given extent, distinct across the batch.
+    """
+    keys = torch.arange(cells.shape[0], device=cells.device).view(-1, 1)
+    keys = keys.expand(cells.shape[:2])
+    for d in range(cells.shape[-1]):
+        keys = keys * extent[d] + cells[..., d]
+    return keys
+
+
+def _voxel_downsample(points: torch.Tensor, voxel_size: float):
+    r"""Centroids of the points in every occupied cell, and the index of the
+    point closest to each.
+    """
+    batch_size, N, _ = points.shape
+    cells = (points / voxel_size).floor().long()
+    cells = cells - cells.min(dim=1, keepdim=True)[0]
+    keys = _cell_keys(cells, cells.max(dim=0)[0].max(dim=0)[0] + 1)
+    keys, inverse, counts = keys.view(-1).unique(return_inverse=True,
+                                                 return_counts=True)
+    flat = points.reshape(-1, points.shape[-1])
+    centroids = torch.zeros(keys.shape[0], flat.shape[-1], dtype=flat.dtype,
+                            device=flat.device).index_add_(0, inverse, flat)
+    centroids /= counts.unsqueeze(-1).to(flat.dtype)
+
+    # point closest to the centroid of its cell: sort by distance, then
+    # stably by cell
+    distances = ((flat - centroids[inverse]) ** 2).sum(dim=-1)
+    order = distances.argsort()
+    order = order[inverse[order].argsort(stable=True)]
+    first = torch.cumsum(counts, dim=0) - counts
+    closest = order[first]
+
+    # cells are sorted by batch, as the batch is their leading key
+    per_cloud = (closest // N).bincount(minlength=batch_size).tolist()
+    idx = _pad_rows([row - i * N for i, row in
+                     enumerate(closest.split(per_cloud))])
+    return _pad_rows(centroids.split(per_cloud)), idx
+
+
+def _poisson_disk_sample(points: torch.Tensor, radius: float,
+                         chunk_size: int = 65536):
+    r"""Dart throwing over the points in random order.
+
+    Cells of size radius / sqrt(D) hold at most one sample, and only the
+    samples of cells less than sqrt(D) cells away can be within radius.
+    Cells whose coordinates agree modulo that reach plus one are thus
+    independent: each such phase tests all of its candidates at once
+    against the samples already in their neighborhood, and keeps the first
+    candidate of every cell that passes.
+    """
+    batch_size, N, D = points.shape
+    device = points.device
+    reach = int(np.ceil(D ** .5))
+    # margins keep the neighbors of every cell within the grid of its cloud
+    cells = (points / (radius / D ** .5)).floor().long()
+    cells = cells - cells.min(dim=1, keepdim=True)[0] + reach
+    extent = cells.max(dim=0)[0].max(dim=0)[0] + reach + 1
+    keys = _cell_keys(cells, extent).view(-1)
+    cells = cells.view(-1, D)
+    flat = points.reshape(-1, D)
+
+    # candidates grouped by cell, in random order within a cell
+    order = torch.randperm(batch_size * N, device=device)
+    order = order[keys[order].argsort(stable=True)]
+    cell_keys, counts = keys[order].unique_consecutive(return_counts=True)
+    candidate_cell = torch.arange(cell_keys.shape[0], device=device)
+    candidate_cell = candidate_cell.repeat_interleave(counts)
+    first = torch.cumsum(counts, dim=0) - counts
+    phases = torch.zeros_like(cell_keys)
+    for d in range(D):
+        phases = phases * (reach + 1) + cells[order[first], d] % (reach + 1)
+
+    steps = torch.arange(-reach, reach + 1, device=device)
+    offsets = torch.cartesian_prod(*[steps] * D).view(-1, D)
+    strides = torch.ones(D, dtype=torch.long, device=device)
+    for d in range(D - 2, -1, -1):
+        strides[d] = strides[d + 1] * extent[d + 1]
+    offsets = (offsets * strides).sum(dim=-1)
+
+    # samples of the cells, in a dense table of the grids unless they are
+    # much larger than the clouds
+    num_keys = batch_size * int(torch.prod(extent))
+    dense = num_keys <= max(8 * batch_size * N, 1 << 22)
+    table = torch.full((num_keys if dense else cell_keys.shape[0],), -1,
+                       dtype=torch.long, device=device)
+
+    def lookup(keys):
+        if dense:
+            return table[keys]
+        slot = torch.searchsorted(cell_keys, keys).clamp(
+            max=cell_keys.shape[0] - 1)
+        return torch.where(cell_keys[slot] == keys, table[slot],
+                           torch.full_like(slot, -1))
+
+    sampled = torch.zeros_like(cell_keys, dtype=torch.bool)
+    for phase in range(int(reach + 1) ** D):
+        candidates = (phases[candidate_cell] == phase).nonzero().view(-1)
+        for lo in range(0, candidates.shape[0], chunk_size):
+            chunk = candidates[lo:lo + chunk_size]
+            # a cell split across chunks keeps its first sample
+            chunk = chunk[~sampled[candidate_cell[chunk]]]
+            chunk_cells, inverse = candidate_cell[chunk].unique_consecutive(
+                return_inverse=True)
+            # pairs of candidates and the samples around their cell
+            neighbors = lookup(cell_keys[chunk_cells].unsqueeze(-1) + offsets)
+            pair_cell, pair_sample = (neighbors >= 0).nonzero(as_tuple=True)
+            pair_sample = neighbors[pair_cell, pair_sample]
+            per_cell = torch.zeros_like(chunk_cells).index_add_(
+                0, pair_cell, torch.ones_like(pair_cell))
+            per_candidate = per_cell[inverse]
+            pair_candidate = torch.arange(
+                chunk.shape[0], device=device).repeat_interleave(per_candidate)
+            # the pairs of a cell are contiguous, as nonzero is row-major
+            pair = torch.arange(pair_candidate.shape[0], device=device) - \
+                (torch.cumsum(per_candidate, dim=0) -
+                 per_candidate)[pair_candidate] + \
+                (torch.cumsum(per_cell, dim=0) - per_cell)[
+                    inverse[pair_candidate]]
+            distances = ((flat[pair_sample[pair]] -
+                          flat[order[chunk[pair_candidate]]]) ** 2).sum(dim=-1)
+            close = pair_candidate[distances < radius ** 2]
+            free = torch.ones_like(chunk, dtype=torch.bool)
+            free[close] = False
+
+            accepted = chunk[free]
+            accepted_cells, accepted_counts = \
+                candidate_cell[accepted].unique_consecutive(
+                    return_counts=True)
+            accepted = order[accepted[
+                torch.cumsum(accepted_counts, dim=0) - accepted_counts]]
+            sampled[accepted_cells] = True
+            if dense:
+                table[cell_keys[accepted_cells]] = accepted
+            else:
+                table[accepted_cells] = accepted
+
+    samples = table[table >= 0].sort()[0]
+    per_cloud = (samples // N).bincount(minlength=batch_size).tolist()
+    return _pad_rows([row - i * N for i, row in
+                      enumerate(samples.split(per_cloud))])
+
+
+def estimate_normals(points: torch.Tensor, k: int = 16,
+                     orient: Optional[str] = None,
+                     viewpoint: Optional[torch.Tensor] = None,
+                     num_workers: Optional[int] = None,
+                     chunk_size: int = 262144):
+    r"""Estimates the normals of a pointcloud, or of a batch of pointclouds,
+    as the direction of least variance of the k nearest neighbors of every
+    point.
+
+    Neighbors are found with a k-d tree, and the covariances of all the
+    neighborhoods are formed in batches, whose smallest eigenvectors are
+    found in closed form.
+
+    Args:
+        points (torch.Tensor): Input pointcloud (shape: :math:`N \times 3`,
+            or :math:`B \times N \times 3` for a batch).
+        k (int): number of neighbors, the point itself included.
+        orient (str, optional): normals are only defined up to their sign.
+            -'viewpoint': normals face the viewpoint.
+            -'mst': signs are propagated along a minimum spanning tree of
+                the k-NN graph, weighted by how far neighboring normals are
+                from parallel, from the highest point of every connected
+                part, whose normal faces up.
+        viewpoint (torch.Tensor, optional): viewpoint for orient='viewpoint'
+            (default: origin).
+        num_workers (int): number of threads querying the k-d tree
+            (default: number of CPUs).
+        chunk_size (int): number of neighborhoods processed at once.
+
+    Returns:
+        (torch.Tensor): unit normals, of the shape of points.
+
+    Example:
+        >>> points = torch.rand(100000, 3)
+        >>> normals = estimate_normals(points, k=16, orient='mst')
+    """
+    assert orient in [None, 'viewpoint', 'mst'], \
+        'orient must be None, viewpoint or mst'
+    helpers._assert_tensor(points)
+    assert points.dim() in [2, 3] and points.shape[-1] == 3, \
+        'Expected a 3D pointcloud or a batch of 3D pointclouds'
+    num_workers = num_workers or os.cpu_count() or 1
+
+    normals = []
+    for cloud in points.detach().view(-1, *points.shape[-2:]).cpu():
+        tree = cKDTree(cloud.numpy())
+        # queries in the order of the tree's leaves hit the same nodes in a
+        # row, which is several times faster than in the input order
+        order = torch.from_numpy(tree.indices)
+        neighbors = torch.empty(cloud.shape[0], min(k, cloud.shape[0]),
+                                dtype=torch.long)
+        neighbors[order] = torch.from_numpy(tree.query(
+            cloud[order].numpy(), neighbors.shape[1],
+            workers=num_workers)[1]).view(cloud.shape[0], -1)
+        normal = torch.cat([
+            _smallest_eigenvectors(_covariances(cloud, neighbors[lo:lo +
+                                                                 chunk_size]))
+            for lo in range(0, cloud.shape[0], chunk_size)])
+        if orient == 'mst':
+            normal = _orient_mst(cloud, normal, neighbors)
+        elif orient == 'viewpoint':
+            origin = torch.zeros(3) if viewpoint is None else viewpoint.cpu()
+            facing = ((origin.to(normal) - cloud.to(normal)) * normal).sum(-1)
+            normal[facing < 0] *= -1
+        normals.append(normal)
+
+    return torch.stack(normals).view(points.shape).to(points.device,
+                                                      points.dtype)
+
+
+def _covariances(cloud: torch.Tensor, neighbors: torch.Tensor):
+    r"""Unique entries a00, a11, a22, a01, a02, a12 of the covariance of the
+    neighbors of every point.
+    """
+    # offsets from the nearest neighbor keep the sums small for float32
+    offsets = cloud[neighbors]
+    offsets = offsets - offsets[:, :1]
+    means = offsets.mean(dim=1).double()
+    return [(offsets[..., i] * offsets[..., j]).mean(dim=1).double() -
+            means[:, i] * means[:, j]
+            for i, j in [(0, 0), (1, 1), (2, 2), (0, 1), (0, 2), (1, 2)]]
+
+
+def _smallest_eigenvectors(covariances: list):
+    r"""Unit eigenvectors of the smallest eigenvalues of symmetric 3 x 3
+    matrices, from the trigonometric solution of their characteristic
+    polynomial.
+    """
+    a00, a11, a22, a01, a02, a12 = covariances
+    q = (a00 + a11 + a22) / 3
+    b00, b11, b22 = a00 - q, a11 - q, a22 - q
+    p = ((b00 ** 2 + b11 ** 2 + b22 ** 2 +
+          2 * (a01 ** 2 + a02 ** 2 + a12 ** 2)) / 6).sqrt()
+    det = b00 * (b11 * b22 - a12 ** 2) - a01 * (a01 * b22 - a12 * a02) + \
+        a02 * (a01 * a12 - b11 * a02)
+    # p is 0 for multiples of the identity, any vector is then an eigenvector
+    r = torch.where(p > 0, det / (2 * p.clamp(min=1e-300) ** 3),
+                    torch.zeros_like(p)).clamp(-1, 1)
+    smallest = q + 2 * p * torch.cos(torch.acos(r) / 3 + 2 * math.pi / 3)
+
+    # the eigenvector is orthogonal to the rows of A - smallest * I, take
+    # the largest cross product of two of them
+    rows = torch.stack([torch.stack([a00 - smallest, a01, a02], dim=-1),
+                        torch.stack([a01, a11 - smallest, a12], dim=-1),
+                        torch.stack([a02, a12, a22 - smallest], dim=-1)])
+    crosses = torch.stack([torch.cross(rows[0], rows[1], dim=-1),
+                           torch.cross(rows[0], rows[2], dim=-1),
+                           torch.cross(rows[1], rows[2], dim=-1)])
+    norms = crosses.norm(dim=-1)
+    best = norms.argmax(dim=0)
+    arange = torch.arange(best.shape[0])
+    vectors = crosses[best, arange]
+    norms = norms[best, arange].unsqueeze(-1)
+    up = torch.tensor([0., 0., 1.], dtype=vectors.dtype).expand_as(vectors)
+    return torch.where(norms > 0, vectors / norms.clamp(min=1e-300),
+                       up).float()
+
+
+def _orient_mst(cloud: torch.Tensor, normals: torch.Tensor,
+                neighbors: torch.Tensor):
+    r"""Flips normals to agree along a minimum spanning tree of the k-NN
+    graph, rooted at the highest point of every connected part.
+    """
+    N = cloud.shape[0]
+    rows = torch.arange(N).repeat_interleave(neighbors.shape[1])
+    cols = neighbors.reshape(-1)
+    keys = torch.min(rows, cols) * N + torch.max(rows, cols)
+    keys = keys[rows != cols].unique()
+    edges = torch.stack([keys // N, keys % N])
+    # weights must be positive to be kept by the sparse graph
+    weights = 1 + 1e-6 - (normals[edges[0]] * normals[edges[1]]).sum(
+        -1).abs()
+    tree = minimum_spanning_tree(coo_matrix(
+        (weights.double().numpy(), (edges[0].numpy(), edges[1].numpy())),
+        shape=(N, N)))
+
+    # a virtual node N links the highest points of the connected parts
+    _, labels = connected_components(tree, directed=False)
+    order = np.lexsort((cloud[:, 2].numpy(), labels))
+    last = np.append(labels[order][1:] != labels[order][:-1], True)
+    roots = order[last]
+    tree = tree.tocoo()
+    tree = coo_matrix((np.append(tree.data, np.ones(len(roots))),
+                       (np.append(tree.row, np.full(len(roots), N)),
+                        np.append(tree.col, roots))), shape=(N + 1, N + 1))
+    _, parents = breadth_first_order(tree, N, directed=False,
+                                     return_predecessors=True)
+    parents = torch.from_numpy(parents[:N]).long()
+
+    # sign of every normal relative to its parent, then to the root by
+    # pointer jumping
+    signs = torch.ones(N + 1, dtype=normals.dtype)
+    children = parents < N
+    aligned = (normals[children] * normals[parents[children]]).sum(-1)
+    signs[:N][children] = torch.where(aligned < 0, -1., 1.).to(normals)
+    signs[roots] = torch.where(normals[roots, 2] < 0, -1., 1.).to(normals)
+    parents = torch.cat([parents, torch.tensor([N])])
+    while (parents[parents] != parents).any():
+        signs = signs * signs[parents]
+        parents = parents[parents]
+    return normals * signs[:N].unsqueeze(-1)
@@ -73,6 +73,8 @@ class QuadMesh(Mesh):
         self.ee_count = ee_count
         # adjacency matrix for verts
         self.adj = None
+        # bounding volume hierarchy over the faces, built on demand
+        self.bvh = None
 
         # Initialize device on which tensors reside.
         self.device = self.vertices.device
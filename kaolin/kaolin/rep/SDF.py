@@ -39,7 +39,6 @@ import numpy as np
 import torch
 
 import kaolin as kal
-from kaolin.triangle_hash import TriangleHash as _TriangleHash
 import kaolin.cuda.mesh_intersection as mint
 
 
@@ -89,16 +88,23 @@ def check_sign_fast(mesh, points):
 def check_sign(mesh, points, hash_resolution=512):
     r""" Checks if a set of points is contained within a mesh
 
+    On CPU, rays are cast from every point along a few fixed directions
+    through the mesh's cached :class:`kaolin.rep.BVH`, and a point is
+    inside when the majority of rays cross the surface an odd number of
+    times.
+
     Args:
         mesh (kal.rep.Mesh): mesh to check against
         points (torch.Tensor): points to check
-        hash_resolution: resolution used to check the points sign
+        hash_resolution: unused, kept for backwards compatibility
 
     Returns:
         bool value for every point inciating if point is inside object
 
     Example:
-
+        >>> mesh = TriangleMesh.from_obj('model.obj')
+        >>> points = torch.rand(1000, 3) - .5
+        >>> inside = check_sign(mesh, points)
 
     """
     assert mesh.device == points.device
@@ -106,9 +112,212 @@ def check_sign(mesh, points, hash_resolution=512):
     if mesh.device.type == 'cuda':
         return check_sign_fast(mesh, points)
     else:
-        intersector = _MeshIntersector(mesh, hash_resolution)
-        contains = intersector.query(points.data.cpu().numpy())
+        return _ray_parity(mesh.get_bvh(), points.data.cpu().numpy())
+
+
+# non axis aligned directions, so that rays do not slide along the faces
+# of axis aligned (and often thin) geometry
+_RAY_DIRECTIONS = np.array([[0.5773, 0.5917, 0.5627],
+                            [-0.6013, 0.4102, -0.6857],
+                            [0.3269, -0.8663, -0.3776]])
+
+
+def _ray_parity(bvh, points):
+    contains = np.zeros(points.shape[0], dtype=bool)
+    if bvh.num_faces == 0:
+        return contains
+
+    # rays from points outside the bounding box can never be odd
+    inside_aabb = np.all((bvh.bbox_min[0] <= points)
+                         & (points <= bvh.bbox_max[0]), axis=1)
+    if not inside_aabb.any():
         return contains
+    points = points[inside_aabb]
+
+    votes = np.zeros(points.shape[0], dtype=np.int64)
+    for direction in _RAY_DIRECTIONS:
+        directions = np.broadcast_to(direction, points.shape)
+        hits = bvh.count_intersections(points, directions).numpy()
+        votes += hits % 2
+    contains[inside_aabb] = votes * 2 > len(_RAY_DIRECTIONS)
+    return contains
+
+
+def winding_number(mesh, points, beta=2.):
+    r""" Computes a soft occupancy for a set of points from the generalized
+    winding number of a mesh. Unlike ray parity, it degrades gracefully on
+    meshes which are not watertight, such as raw ShapeNet models.
+
+    Args:
+        mesh (kal.rep.Mesh): mesh to check against
+        points (torch.Tensor): points to check
+        beta (float): accuracy of the far field approximation, larger
+            values are more accurate and slower
+
+    Returns:
+        (torch.Tensor): winding number for every point, close to 1 inside
+        and 0 outside the object. Values are negated when the faces of the
+        mesh are oriented inwards.
+
+    Example:
+        >>> mesh = TriangleMesh.from_obj('model.obj')
+        >>> points = torch.rand(1000, 3) - .5
+        >>> occupancy = winding_number(mesh, points) > .5
+
+    """
+    return mesh.get_bvh().winding_number(points, beta=beta)
+
+
+class MeshSDF(object):
+    r"""Signed distance function of a triangle mesh, answering exact
+    point-to-triangle distance queries in batches.
+
+    The mesh's BVH is built once and reused by every query. Optionally a
+    narrow band of grid nodes around the surface is precomputed, and queries
+    whose eight surrounding nodes all lie in the band are answered by
+    trilinear interpolation instead of tree traversal.
+
+    Args:
+        mesh (kal.rep.Mesh): mesh to compute distances to.
+        sign_mode (str):
+            -'parity': inside/outside from ray parity (:func:`check_sign`).
+            -'winding': inside/outside from the generalized winding number,
+                which is robust to meshes with holes.
+        resolution (int, optional): resolution of the narrow band grid over
+            the mesh's bounding box. No grid is built when None.
+        band (float, optional): half width of the band, in grid cells
+            (default: 2).
+
+    Example:
+        >>> mesh = TriangleMesh.from_obj('model.obj')
+        >>> sdf = MeshSDF(mesh, resolution=128)
+        >>> distances = sdf(torch.rand(100000, 3) - .5)
+    """
+
+    def __init__(self, mesh, sign_mode: str = 'parity',
+                 resolution: int = None, band: float = 2.):
+        assert sign_mode in ['parity', 'winding'], \
+            'sign_mode must be parity or winding'
+        self.mesh = mesh
+        self.sign_mode = sign_mode
+        self.bvh = mesh.get_bvh()
+        self.grid_keys = None
+        if resolution is not None:
+            self.build_grid(resolution, band)
+
+    def distance(self, points: torch.Tensor):
+        r"""Unsigned distance from each point to the surface. """
+        return self.bvh.closest_point(points)[0]
+
+    def sign(self, points: torch.Tensor):
+        r"""Boolean tensor, True for points inside the mesh. """
+        if self.sign_mode == 'winding':
+            return self.bvh.winding_number(points).abs() > .5
+        contains = check_sign(self.mesh, points.to(self.mesh.device))
+        if torch.is_tensor(contains):
+            return contains.view(-1).cpu()
+        return torch.from_numpy(contains)
+
+    def exact(self, points: torch.Tensor):
+        r"""Signed distance evaluated on the mesh, ignoring the grid. """
+        device = points.device
+        distances = self.distance(points.cpu())
+        inside = self.sign(points)
+        distances[inside] *= -1
+        return distances.to(device)
+
+    def __call__(self, points: torch.Tensor):
+        if self.grid_keys is None:
+            return self.exact(points)
+        device = points.device
+        points = points.cpu()
+        distances, found = self._grid_lookup(points)
+        if not found.all():
+            distances[~found] = self.exact(points[~found])
+        return distances.to(device)
+
+    def build_grid(self, resolution: int, band: float = 2.):
+        r"""Precomputes exact signed distances on the grid nodes within
+        ``band`` cells of the surface, over the mesh's bounding box.
+
+        Args:
+            resolution (int): number of cells along the longest side.
+            band (float): half width of the band, in grid cells.
+        """
+        bbox_min = torch.from_numpy(self.bvh.bbox_min[0]).float()
+        bbox_max = torch.from_numpy(self.bvh.bbox_max[0]).float()
+        cell = float((bbox_max - bbox_min).max()) / resolution
+        padding = cell * (band + 1)
+        self.grid_origin = bbox_min - padding
+        self.grid_cell = cell
+        self.grid_shape = (((bbox_max - bbox_min) + 2 * padding) /
+                           cell).ceil().long() + 1
+
+        # nodes close to a dense sampling of the surface
+        vertices = self.mesh.vertices.detach().cpu()
+        faces = self.mesh.faces.cpu()
+        if faces.shape[-1] == 4:
+            faces = torch.cat((faces[:, [0, 1, 2]], faces[:, [0, 3, 2]]))
+        tri = vertices[faces]
+        areas = torch.cross(tri[:, 1] - tri[:, 0], tri[:, 2] - tri[:, 0],
+                            dim=1).norm(dim=1) / 2
+        num_samples = int(4 * areas.sum() / cell ** 2) + faces.shape[0]
+        u = torch.rand(num_samples, 1).sqrt()
+        v = torch.rand(num_samples, 1)
+        choice = torch.multinomial(areas + 1e-12, num_samples,
+                                   replacement=True)
+        tri = tri[choice]
+        samples = torch.cat((tri.view(-1, 3), (1 - u) * tri[:, 0] +
+                             u * (1 - v) * tri[:, 1] + u * v * tri[:, 2]))
+        base = ((samples - self.grid_origin) / cell).round().long()
+        reach = int(np.ceil(band)) + 1
+        offsets = torch.arange(-reach, reach + 1)
+        offsets = torch.stack(torch.meshgrid(offsets, offsets, offsets,
+                                             indexing='ij'), dim=-1)
+        keys = self._linear_index(base.unique(dim=0).unsqueeze(1) +
+                                  offsets.view(1, -1, 3))
+        keys = keys[keys >= 0].unique()
+
+        # signs are only needed for the nodes which end up in the band
+        nodes = self._node_position(keys)
+        values = self.distance(nodes)
+        keep = values <= band * cell
+        keys, nodes, values = keys[keep], nodes[keep], values[keep]
+        values[self.sign(nodes)] *= -1
+        self.grid_keys = keys
+        self.grid_values = values
+
+    def _linear_index(self, index):
+        shape = self.grid_shape
+        valid = ((index >= 0) & (index < shape)).all(dim=-1)
+        linear = (index[..., 0] * shape[1] + index[..., 1]) * shape[2] + \
+            index[..., 2]
+        return torch.where(valid, linear, torch.full_like(linear, -1))
+
+    def _node_position(self, keys):
+        shape = self.grid_shape
+        index = torch.stack((keys // (shape[1] * shape[2]),
+                             (keys // shape[2]) % shape[1],
+                             keys % shape[2]), dim=-1)
+        return self.grid_origin + index.float() * self.grid_cell
+
+    def _grid_lookup(self, points):
+        coords = (points - self.grid_origin) / self.grid_cell
+        base = coords.floor().long()
+        frac = coords - base.float()
+        distances = torch.zeros(points.shape[0])
+        found = torch.ones(points.shape[0], dtype=torch.bool)
+        for corner in range(8):
+            offset = torch.tensor([corner >> 2, (corner >> 1) & 1,
+                                   corner & 1])
+            keys = self._linear_index(base + offset)
+            slot = torch.searchsorted(self.grid_keys, keys).clamp(
+                max=self.grid_keys.shape[0] - 1)
+            hit = (self.grid_keys[slot] == keys) & (keys >= 0)
+            weight = torch.where(offset.bool(), frac, 1 - frac).prod(dim=1)
+            distances += weight * self.grid_values[slot]
+            found &= hit
+        return distances, found
 
 
 def _length(points):
@@ -138,151 +347,3 @@ def box(h=.2, w=.4, l=.5):
 
         return positive_len
     return eval_sdf
-
-
-class _MeshIntersector:
-    r"""Class to determine if a point in space lies within our outside a mesh.
-    """
-
-    def __init__(self, mesh, resolution=512):
-        triangles = mesh.vertices.data.cpu().numpy(
-        )[mesh.faces.data.cpu().numpy()].astype(np.float64)
-        n_tri = triangles.shape[0]
-
-        self.resolution = resolution
-        self.bbox_min = triangles.reshape(3 * n_tri, 3).min(axis=0)
-        self.bbox_max = triangles.reshape(3 * n_tri, 3).max(axis=0)
-        # Tranlate and scale it to [0.5, self.resolution - 0.5]^3
-        self.scale = (resolution - 1) / (self.bbox_max - self.bbox_min)
-        self.translate = 0.5 - self.scale * self.bbox_min
-
-        self._triangles = triangles = self.rescale(triangles)
-
-        triangles2d = triangles[:, :, :2]
-        self._tri_intersector2d = _TriangleIntersector2d(
-            triangles2d, resolution)
-
-    def query(self, points):
-        # Rescale points
-        points = self.rescale(points)
-
-        # placeholder result with no hits we'll fill in later
-        contains = np.zeros(len(points), dtype=np.bool)
-
-        # cull points outside of the axis aligned bounding box
-        # this avoids running ray tests unless points are close
-        inside_aabb = np.all(
-            (0 <= points) & (points <= self.resolution), axis=1)
-        if not inside_aabb.any():
-            return contains
-
-        # Only consider points inside bounding box
-        mask = inside_aabb
-        points = points[mask]
-
-        # Compute intersection depth and check order
-        points_indices, tri_indices = self._tri_intersector2d.query(
-            points[:, :2])
-
-        triangles_intersect = self._triangles[tri_indices]
-        points_intersect = points[points_indices]
-
-        depth_intersect, abs_n_2 = self.compute_intersection_depth(
-            points_intersect, triangles_intersect)
-
-        # Count number of intersections in both directions
-        smaller_depth = depth_intersect >= points_intersect[:, 2] * abs_n_2
-        bigger_depth = depth_intersect < points_intersect[:, 2] * abs_n_2
-        points_indices_0 = points_indices[smaller_depth]
-        points_indices_1 = points_indices[bigger_depth]
-
-        nintersect0 = np.bincount(points_indices_0, minlength=points.shape[0])
-        nintersect1 = np.bincount(points_indices_1, minlength=points.shape[0])
-
-        # Check if point contained in mesh
-        contains1 = (np.mod(nintersect0, 2) == 1)
-        contains2 = (np.mod(nintersect1, 2) == 1)
-        # if (contains1 != contains2).any():
-        #     print('Warning: contains1 != contains2 for some points.')
-        contains[mask] = (contains1 & contains2)
-        return contains
-
-    def compute_intersection_depth(self, points, triangles):
-        t1 = triangles[:, 0, :]
-        t2 = triangles[:, 1, :]
-        t3 = triangles[:, 2, :]
-
-        v1 = t3 - t1
-        v2 = t2 - t1
-        # v1 = v1 / np.linalg.norm(v1, axis=-1, keepdims=True)
-        # v2 = v2 / np.linalg.norm(v2, axis=-1, keepdims=True)
-
-        normals = np.cross(v1, v2)
-        alpha = np.sum(normals[:, :2] * (t1[:, :2] - points[:, :2]), axis=1)
-
-        n_2 = normals[:, 2]
-        t1_2 = t1[:, 2]
-        s_n_2 = np.sign(n_2)
-        abs_n_2 = np.abs(n_2)
-
-        mask = (abs_n_2 != 0)
-
-        depth_intersect = np.full(points.shape[0], np.nan)
-        depth_intersect[mask] = \
-            t1_2[mask] * abs_n_2[mask] + alpha[mask] * s_n_2[mask]
-
-        # Test the depth:
-        # TODO: remove and put into tests
-        # points_new = np.concatenate([points[:, :2], depth_intersect[:, None]], axis=1)
-        # alpha = (normals * t1).sum(-1)
-        # mask = (depth_intersect == depth_intersect)
-        # assert(np.allclose((points_new[mask] * normals[mask]).sum(-1),
-        #                    alpha[mask]))
-        return depth_intersect, abs_n_2
-
-    def rescale(self, array):
-        array = self.scale * array + self.translate
-        return array
-
-
-class _TriangleIntersector2d:
-    def __init__(self, triangles, resolution=128):
-        self.triangles = triangles
-        self.tri_hash = _TriangleHash(triangles, resolution)
-
-    def query(self, points):
-        point_indices, tri_indices = self.tri_hash.query(points)
-        point_indices = np.array(point_indices, dtype=np.int64)
-        tri_indices = np.array(tri_indices, dtype=np.int64)
-        points = points[point_indices]
-        triangles = self.triangles[tri_indices]
-        mask = self.check_triangles(points, triangles)
-        point_indices = point_indices[mask]
-        tri_indices = tri_indices[mask]
-        return point_indices, tri_indices
-
-    def check_triangles(self, points, triangles):
-        contains = np.zeros(points.shape[0], dtype=np.bool)
-        A = triangles[:, :2] - triangles[:, 2:]
-        A = A.transpose([0, 2, 1])
-        y = points - triangles[:, 2]
-
-        detA = A[:, 0, 0] * A[:, 1, 1] - A[:, 0, 1] * A[:, 1, 0]
-
-        mask = (np.abs(detA) != 0.)
-        A = A[mask]
-        y = y[mask]
-        detA = detA[mask]
-
-        s_detA = np.sign(detA)
-        abs_detA = np.abs(detA)
-
-        u = (A[:, 1, 1] * y[:, 0] - A[:, 0, 1] * y[:, 1]) * s_detA
-        v = (-A[:, 1, 0] * y[:, 0] + A[:, 0, 0] * y[:, 1]) * s_detA
-
-        sum_uv = u + v
-        contains[mask] = (
-            (0 < u) & (u < abs_detA) & (0 < v) & (v < abs_detA)
-            & (0 < sum_uv) & (sum_uv < abs_detA)
-        )
-        return contains
@@ -0,0 +1,231 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Optional, Union, Sequence
+
+import torch
+
+from kaolin import helpers
+from kaolin.rep.VoxelGrid import VoxelGrid
+
+
+class SparseVoxelGrid(object):
+    r"""Voxel grid storing only its occupied voxels.
+
+    The integer coordinates of the occupied voxels are kept sorted by their
+    linear index :math:`(x \cdot H + y) \cdot W + z` in ``keys``, which
+    serves as the coordinate index: a voxel is looked up by binary search,
+    so memory scales with the number of occupied voxels and not with the
+    resolution.
+
+    Args:
+        coords (torch.Tensor): integer coordinates of the occupied voxels
+            (shape: :math:`N \times 3`). Duplicates are merged.
+        features (torch.Tensor, optional): features of the occupied voxels
+            (shape: :math:`N \times \dots`).
+        resolution (int or sequence of int, optional): size of the grid
+            along each axis (default: smallest grid containing coords).
+
+    Note:
+        The coordinates and features are reordered, so the grid always
+        stores copies of the input tensors.
+
+    Example:
+        >>> voxels = torch.zeros(512, 512, 512)
+        >>> voxels[100:200, 100:200, 100:200] = 1
+        >>> grid = SparseVoxelGrid.from_dense(voxels)
+        >>> surface = grid.extract_surface()
+        >>> len(surface)
+        58808
+    """
+
+    def __init__(self, coords: torch.Tensor,
+                 features: Optional[torch.Tensor] = None,
+                 resolution: Optional[Union[int, Sequence[int]]] = None):
+        helpers._assert_tensor(coords)
+        helpers._assert_dim_eq(coords, 2)
+        assert coords.shape[1] == 3, 'coords must be of shape N x 3'
+        if resolution is None:
+            resolution = (coords.max(dim=0)[0] + 1).tolist() \
+                if coords.shape[0] > 0 else [1, 1, 1]
+        elif isinstance(resolution, int):
+            resolution = [resolution] * 3
+        self.resolution = tuple(int(r) for r in resolution)
+
+        coords = coords.long()
+        keys = self._linear_index(coords)
+        assert (keys >= 0).all(), 'coords must lie inside the grid'
+        keys, order = keys.sort()
+        unique = torch.ones_like(keys, dtype=torch.bool)
+        unique[1:] = keys[1:] != keys[:-1]
+        order = order[unique]
+
+        self.keys = keys[unique]
+        self.coords = coords[order]
+        if features is not None:
+            helpers._assert_tensor(features)
+            features = features[order]
+        self.features = features
+
+    @classmethod
+    def from_dense(cls, voxels: Union[torch.Tensor, VoxelGrid],
+                   thresh: float = .5, keep_features: bool = False):
+        r"""Builds a sparse grid from the voxels of a dense array above a
+        threshold.
+
+        Args:
+            voxels (torch.Tensor or VoxelGrid): dense voxel array
+            thresh (float): voxels with a value above it are occupied
+            keep_features (bool): whether to store the values of the
+                occupied voxels as features
+
+        Returns:
+            (SparseVoxelGrid): the occupied voxels
+        """
+        if isinstance(voxels, VoxelGrid):
+            voxels = voxels.voxels
+        helpers._assert_dim_eq(voxels, 3)
+        occupied = voxels > thresh
+        features = voxels[occupied] if keep_features else None
+        return cls(occupied.nonzero(), features, voxels.shape)
+
+    def to_dense(self):
+        r"""Converts to a dense voxel array, with the features of the
+        occupied voxels if there are any and ones otherwise.
+
+        Returns:
+            (torch.Tensor): dense array of shape ``resolution`` followed by
+            the shape of a feature
+        """
+        if self.features is None:
+            dense = torch.zeros(self.resolution, device=self.coords.device)
+            values = 1
+        else:
+            dense = self.features.new_zeros(self.resolution +
+                                            self.features.shape[1:])
+            values = self.features
+        dense[self.coords[:, 0], self.coords[:, 1], self.coords[:, 2]] = values
+        return dense
+
+    def __len__(self):
+        return self.coords.shape[0]
+
+    @property
+    def device(self):
+        return self.coords.device
+
+    def to(self, device):
+        r"""Returns a copy of the grid on the given device."""
+        features = None if self.features is None else self.features.to(device)
+        return SparseVoxelGrid(self.coords.to(device), features,
+                               self.resolution)
+
+    def _linear_index(self, coords):
+        # -1 outside the grid
+        res = coords.new_tensor(self.resolution)
+        inside = ((coords >= 0) & (coords < res)).all(dim=-1)
+        keys = (coords[..., 0] * res[1] + coords[..., 1]) * res[2] + \
+            coords[..., 2]
+        return torch.where(inside, keys, torch.full_like(keys, -1))
+
+    def lookup(self, coords: torch.Tensor):
+        r"""Position of voxels in ``coords``.
+
+        Args:
+            coords (torch.Tensor): integer coordinates (shape: :math:`\dots
+                \times 3`)
+
+        Returns:
+            (torch.LongTensor): index of every voxel in ``self.coords``, or
+            -1 for empty voxels and coordinates outside the grid
+        """
+        keys = self._linear_index(coords.long().to(self.device))
+        if len(self) == 0:
+            return torch.full_like(keys, -1)
+        index = torch.searchsorted(self.keys, keys).clamp(max=len(self) - 1)
+        found = (self.keys[index] == keys) & (keys >= 0)
+        return torch.where(found, index, torch.full_like(index, -1))
+
+    def contains(self, coords: torch.Tensor):
+        r"""Whether the voxels in ``coords`` are occupied."""
+        return self.lookup(coords) >= 0
+
+    def neighbors(self, connectivity: int = 6):
+        r"""Indices of the neighbors of every occupied voxel.
+
+        Args:
+            connectivity (int): 6 (faces), 18 (faces and edges) or 26
+                (faces, edges and corners)
+
+        Returns:
+            (torch.LongTensor): index of the neighbors in ``self.coords``, or
+            -1 for empty neighbors (shape: :math:`N \times` connectivity)
+        """
+        offsets = neighbor_offsets(connectivity, self.device)
+        return self.lookup(self.coords.unsqueeze(1) + offsets)
+
+    def extract_surface(self, connectivity: int = 26):
+        r"""Removes the internal voxels, the ones whose neighbors are all
+        occupied. The default matches
+        :func:`kaolin.conversions.voxelgridconversions.extract_surface`.
+
+        Args:
+            connectivity (int): neighborhood considered, 6, 18 or 26
+
+        Returns:
+            (SparseVoxelGrid): the surface voxels
+        """
+        surface = (self.neighbors(connectivity) < 0).any(dim=1)
+        features = None if self.features is None else self.features[surface]
+        return SparseVoxelGrid(self.coords[surface], features,
+                               self.resolution)
+
+    def dilate(self, iterations: int = 1, connectivity: int = 26):
+        r"""Adds the neighbors of the occupied voxels. Features are not
+        carried over.
+
+        Args:
+            iterations (int): number of dilations
+            connectivity (int): neighborhood added, 6, 18 or 26
+
+        Returns:
+            (SparseVoxelGrid): the dilated grid
+        """
+        offsets = torch.cat((torch.zeros_like(self.coords[:1]),
+                             neighbor_offsets(connectivity, self.device)))
+        grid = self
+        for _ in range(iterations):
+            coords = (grid.coords.unsqueeze(1) + offsets).view(-1, 3)
+            coords = coords[grid._linear_index(coords) >= 0]
+            grid = SparseVoxelGrid(coords, resolution=self.resolution)
+        return grid
+
+
+def neighbor_offsets(connectivity: int = 6, device='cpu'):
+    r"""Offsets of the neighbors of a voxel.
+
+    Args:
+        connectivity (int): 6 (faces), 18 (faces and edges) or 26 (faces,
+            edges and corners)
+
+    Returns:
+        (torch.LongTensor): offsets (shape: connectivity x 3)
+    """
+    assert connectivity in [6, 18, 26], 'connectivity must be 6, 18 or 26'
+    offsets = torch.arange(-1, 2, device=device)
+    offsets = torch.stack(torch.meshgrid(offsets, offsets, offsets,
+                                         indexing='ij'), dim=-1).view(-1, 3)
+    order = offsets.abs().sum(dim=1)
+    keep = (order > 0) & (order <= {6: 1, 18: 2, 26: 3}[connectivity])
+    return offsets[keep]
@@ -77,6 +77,8 @@ class TriangleMesh(Mesh):
         self.ee_count = ee_count
         # adjacency matrix for verts
         self.adj = None
+        # bounding volume hierarchy over the faces, built on demand
+        self.bvh = None
 
         # Initialize device on which tensors reside.
         self.device = self.vertices.device
@@ -3,4 +3,7 @@ from .TriangleMesh import *
 from .QuadMesh import *
 from .PointCloud import *
 from .VoxelGrid import *
+from .SparseVoxelGrid import *
+from .OctreeVoxelGrid import *
 from .SDF import *
+from .BVH import *
@@ -12,12 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
 from typing import Optional, Union
 
 import numpy as np
 import torch
+from scipy.spatial import cKDTree
 
 from kaolin.rep import PointCloud
+from kaolin.rep.PointCloud import estimate_normals
 from kaolin import helpers
 
 
@@ -215,6 +218,205 @@ def normalize(cloud: Union[torch.Tensor, PointCloud],
 
 
 
+def build_icp_index(tgt: Union[torch.Tensor, PointCloud]):
+    r"""Builds the nearest neighbor index of the target pointclouds of
+    :func:`icp`, to reuse it when registering several sources to them.
+
+    Args:
+        tgt (torch.Tensor or PointCloud): Target pointcloud (shape:
+            :math:`N \times 3`, or :math:`B \times N \times 3` for a batch).
+
+    Returns:
+        (list): a k-d tree for every target pointcloud.
+    """
+    if isinstance(tgt, PointCloud):
+        tgt = tgt.points
+    helpers._assert_tensor(tgt)
+    return [cKDTree(cloud.numpy())
+            for cloud in tgt.detach().cpu().view(-1, *tgt.shape[-2:])]
+
+
+def icp(src: Union[torch.Tensor, PointCloud],
+        tgt: Union[torch.Tensor, PointCloud],
+        mode: str = 'point_to_point',
+        tgt_normals: Optional[torch.Tensor] = None,
+        max_iterations: int = 50, tolerance: float = 1e-6,
+        num_samples: Optional[int] = None, index: Optional[list] = None,
+        num_workers: Optional[int] = None):
+    r"""Rigidly registers pointcloud `src` to pointcloud `tgt` with the
+    iterative closest point algorithm.
+
+    Every iteration matches the source points to their nearest target points
+    and solves for the rigid motion best aligning the matches: in closed
+    form through an SVD of their cross-covariance for point_to_point, and
+    through the linearized 6 x 6 normal equations for point_to_plane. A
+    batch of clouds is updated at once, and every cloud stops when its mean
+    squared distance changes by less than `tolerance` relative to it.
+
+    Args:
+        src (torch.Tensor or PointCloud): Source pointcloud (shape:
+            :math:`N \times 3`, or :math:`B \times N \times 3` for a batch).
+        tgt (torch.Tensor or PointCloud): Target pointcloud (shape:
+            :math:`M \times 3`, or :math:`B \times M \times 3` for a batch).
+            A single target is shared by a batch of sources.
+        mode (str): 'point_to_point' or 'point_to_plane'.
+        tgt_normals (torch.Tensor, optional): normals of the target for
+            point_to_plane, estimated with
+            :func:`kaolin.rep.estimate_normals` by default.
+        max_iterations (int): maximal number of iterations.
+        tolerance (float): convergence threshold on the relative change of
+            the mean squared distance between matches.
+        num_samples (int, optional): number of source points drawn at random
+            to be matched in every iteration (default: all of them).
+        index (list, optional): index of tgt from :func:`build_icp_index`.
+        num_workers (int): number of threads matching the points (default:
+            number of CPUs).
+
+    Returns:
+        (torch.Tensor): registered source pointcloud.
+        (torch.Tensor): rotation (shape: :math:`3 \times 3`, or
+        :math:`B \times 3 \times 3`).
+        (torch.Tensor): translation (shape: :math:`3`, or
+        :math:`B \times 3`), such that the registered pointcloud is
+        ``src @ rotation.T + translation``.
+
+    Example:
+        >>> tgt = torch.rand(1000, 3)
+        >>> src = tgt + .1
+        >>> registered, rotation, translation = icp(src, tgt)
+    """
+    assert mode in ['point_to_point', 'point_to_plane'], \
+        'mode must be point_to_point or point_to_plane'
+    if isinstance(src, PointCloud):
+        src = src.points
+    if isinstance(tgt, PointCloud):
+        if tgt_normals is None:
+            tgt_normals = tgt.normals
+        tgt = tgt.points
+    helpers._assert_tensor(src)
+    helpers._assert_tensor(tgt)
+    assert src.shape[-1] == 3 and tgt.shape[-1] == 3, \
+        'icp registers 3D pointclouds'
+    batched = src.dim() == 3
+    num_workers = num_workers or os.cpu_count() or 1
+    if index is None:
+        index = build_icp_index(tgt)
+    sources = src.detach().view(-1, *src.shape[-2:]).double()
+    targets = tgt.detach().view(-1, *tgt.shape[-2:]).to(sources)
+    batch_size, num_points = sources.shape[:2]
+    assert len(targets) in [1, batch_size], \
+        'expected a single target or one target per source, got {0} ' \
+        'targets for {1} sources'.format(len(targets), batch_size)
+    assert len(index) == len(targets), \
+        'index was built for {0} targets, got {1}'.format(len(index),
+                                                         len(targets))
+    if mode == 'point_to_plane':
+        if tgt_normals is None:
+            tgt_normals = estimate_normals(targets.float())
+        tgt_normals = tgt_normals.detach().view(targets.shape).to(sources)
+        tgt_normals = tgt_normals.expand(batch_size, -1, -1)
+    targets = targets.expand(batch_size, -1, -1)
+
+    batch = torch.arange(batch_size, device=sources.device)
+    # sources in the order of the leaves of their own k-d trees make
+    # consecutive queries visit the same target nodes
+    order = torch.stack([torch.from_numpy(cKDTree(cloud.cpu().numpy()).indices)
+                         for cloud in sources]).to(sources.device)
+    sources = sources[batch.unsqueeze(1), order]
+    rotation = torch.eye(3).to(sources).repeat(batch_size, 1, 1)
+    translation = torch.zeros(batch_size, 3).to(sources)
+    error = torch.full((batch_size,), float('inf')).to(sources)
+    active = torch.ones(batch_size, dtype=torch.bool)
+    for _ in range(max_iterations):
+        if num_samples is not None and num_samples < num_points:
+            samples = torch.rand(batch_size, num_points).argsort(
+                dim=1)[:, :num_samples].to(sources.device)
+            points = sources[batch.unsqueeze(1), samples]
+        else:
+            points = sources
+        points = points @ rotation.transpose(1, 2) + translation.unsqueeze(1)
+        # nearest neighbors of the active clouds only
+        matches = torch.zeros(points.shape[:2], dtype=torch.long)
+        for b in active.nonzero().view(-1).tolist():
+            tree = index[0] if len(index) == 1 else index[b]
+            matches[b] = torch.from_numpy(
+                tree.query(points[b].cpu().numpy(), workers=num_workers)[1])
+        matches = matches.to(sources.device)
+        matched = targets[batch.unsqueeze(1), matches]
+
+        if mode == 'point_to_point':
+            step_rotation, step_translation = _rigid_fit(points, matched)
+            new_error = ((points - matched) ** 2).sum(-1).mean(-1)
+        else:
+            normals = tgt_normals[batch.unsqueeze(1), matches]
+            step_rotation, step_translation = _plane_fit(points, matched,
+                                                         normals)
+            new_error = (((points - matched) * normals).sum(-1) ** 2).mean(-1)
+
+        update = active.to(sources.device)
+        rotation = torch.where(update.view(-1, 1, 1),
+                               step_rotation @ rotation, rotation)
+        translation = torch.where(
+            update.view(-1, 1), (step_rotation @ translation.unsqueeze(-1))
+            .squeeze(-1) + step_translation, translation)
+        active &= ((error - new_error).abs() > tolerance * new_error).cpu()
+        error = new_error
+        if not active.any():
+            break
+
+    rotation = rotation.to(src.dtype)
+    translation = translation.to(src.dtype)
+    registered = src @ rotation.transpose(-1, -2).view(
+        *src.shape[:-2], 3, 3) + translation.view(*src.shape[:-2], 1, 3)
+    if not batched:
+        return registered, rotation[0], translation[0]
+    return registered, rotation, translation
+
+
+def _rigid_fit(points: torch.Tensor, matched: torch.Tensor):
+    r"""Rotations and translations minimizing the squared distances between
+    batches of matched points (Kabsch).
+    """
+    points_mean = points.mean(1, keepdim=True)
+    matched_mean = matched.mean(1, keepdim=True)
+    covariance = (points - points_mean).transpose(1, 2) @ \
+        (matched - matched_mean)
+    u, _, v = torch.svd(covariance)
+    # reflections are turned into rotations
+    signs = torch.ones_like(points_mean[:, 0])
+    signs[:, 2] = torch.det(v @ u.transpose(1, 2)).sign()
+    rotation = (v * signs.unsqueeze(1)) @ u.transpose(1, 2)
+    translation = matched_mean[:, 0] - \
+        (rotation @ points_mean.transpose(1, 2))[..., 0]
+    return rotation, translation
+
+
+def _plane_fit(points: torch.Tensor, matched: torch.Tensor,
+               normals: torch.Tensor):
+    r"""Rotations and translations minimizing the squared distances between
+    batches of points and the tangent planes of their matches, linearized
+    around the identity.
+    """
+    rows = torch.cat([torch.cross(points, normals, dim=-1), normals], dim=-1)
+    residuals = ((matched - points) * normals).sum(-1, keepdim=True)
+    # Tikhonov damping keeps degenerate (e.g. planar) systems solvable
+    system = rows.transpose(1, 2) @ rows + \
+        1e-9 * torch.eye(6).to(rows).unsqueeze(0)
+    motion = torch.linalg.solve(system, rows.transpose(1, 2) @ residuals)
+    angles = motion[:, :3, 0]
+    # exact rotation of the solved angular velocity (Rodrigues)
+    theta = angles.norm(dim=-1, keepdim=True).unsqueeze(-1)
+    axis = angles.unsqueeze(-1) / theta.clamp(min=1e-12)
+    zero = torch.zeros_like(axis[:, 0, 0])
+    cross = torch.stack([
+        torch.stack([zero, -axis[:, 2, 0], axis[:, 1, 0]], dim=-1),
+        torch.stack([axis[:, 2, 0], zero, -axis[:, 0, 0]], dim=-1),
+        torch.stack([-axis[:, 1, 0], axis[:, 0, 0], zero], dim=-1)], dim=1)
+    rotation = torch.eye(3).to(rows) + torch.sin(theta) * cross + \
+        (1 - torch.cos(theta)) * (cross @ cross)
+    return rotation, motion[:, 3:, 0]
+
+
 if __name__ == '__main__':
 
     device = 'cpu'
@@ -19,13 +19,14 @@ import hashlib
 import numpy as np
 import torch
 
-from kaolin.rep.PointCloud import PointCloud
+from kaolin.rep.PointCloud import PointCloud, estimate_normals
 from kaolin.rep.VoxelGrid import VoxelGrid
 from kaolin.rep.Mesh import Mesh
 from kaolin.rep.TriangleMesh import TriangleMesh
 from kaolin.rep.QuadMesh import QuadMesh
 
 import kaolin.conversions as cvt
+from kaolin.mathutils.geometry.transformations import compose_transforms_3d
 
 # from kaolin.conversion import mesh as cvt_mesh
 # from kaolin.conversion import SDF as cvt_SDF
@@ -39,18 +40,30 @@ class Compose(object):
     """Composes (chains) multiple transforms sequentially. Identical to
     `torchvision.transforms.Compose`.
 
+    Consecutive scalings, rotations and translations of meshes
+    (`ScaleMesh`, `RotateMesh`, `TranslateMesh`) or of pointclouds
+    (`ScalePointCloud`, `RotatePointCloud`) are folded into a single affine
+    matrix when the composition is built, and applied in one pass over the
+    points. Their parameters are read at that time. A folded mesh
+    transform is applied to a copy of the mesh if any of its stages is not
+    in-place.
+
     Args:
         tforms (list): List of transforms to compose.
 
-    TODO: Example.
+    Example:
+        >>> transform = Compose([ScaleMesh(2.), RotateMesh(rotmat),
+        ...                      TranslateMesh([0., 0., 1.])])
+        >>> mesh = transform(mesh)
 
     """
 
     def __init__(self, transforms: Iterable):
         self.tforms = transforms
+        self.stages = _fuse_affine_transforms(list(transforms))
 
     def __call__(self, inp: torch.Tensor):
-        for t in self.tforms:
+        for t in self.stages:
             inp = t(inp)
         return inp
 
@@ -63,6 +76,113 @@ class Compose(object):
         return fstr
 
 
+def _fuse_affine_transforms(tforms: List):
+    r"""Replaces the runs of consecutive affine transforms of the same kind
+    of input by :class:`_AffineTransforms`.
+    """
+    stages, run = [], []
+    for t in tforms + [None]:
+        matrix = None if t is None else _affine_matrix(t)
+        if run and (matrix is None or
+                    _is_mesh_transform(t) != _is_mesh_transform(run[0][0])):
+            if len(run) > 1:
+                stages.append(_AffineTransforms(*zip(*run)))
+            else:
+                stages.append(run[0][0])
+            run = []
+        if matrix is not None:
+            run.append((t, matrix))
+        elif t is not None:
+            stages.append(t)
+    return stages
+
+
+def _is_mesh_transform(tform):
+    return isinstance(tform, (ScaleMesh, RotateMesh, TranslateMesh))
+
+
+def _affine_matrix(tform):
+    r"""4 x 4 matrix of a transform that is a fixed affine map of 3D points,
+    or None. Invalid parameters also give None, the transform then raises
+    when applied.
+    """
+    matrix = torch.eye(4, dtype=torch.double)
+    if isinstance(tform, ScalePointCloud):
+        if not isinstance(tform.scf, (int, float, torch.Tensor, np.ndarray)):
+            return None
+        scf = torch.as_tensor(tform.scf, dtype=torch.double).cpu()
+        if scf.numel() != 1 or not scf.item() > 0:
+            return None
+        matrix[:3, :3] *= scf.item()
+    elif isinstance(tform, ScaleMesh):
+        scf = tform.scf
+        if isinstance(scf, (int, float)):
+            scf = [scf]
+        if not isinstance(scf, (list, tuple)) or len(scf) not in [1, 3]:
+            return None
+        matrix[:3, :3] = torch.diag(torch.tensor(
+            list(scf) * (3 // len(scf)), dtype=torch.double))
+    elif isinstance(tform, TranslateMesh):
+        trans = tform.trans
+        if not (torch.is_tensor(trans) or isinstance(trans, (list, tuple))):
+            return None
+        trans = torch.as_tensor(trans, dtype=torch.double).cpu()
+        if trans.numel() != 3:
+            return None
+        matrix[:3, 3] = trans.view(3)
+    elif isinstance(tform, (RotatePointCloud, RotateMesh)):
+        rotmat = tform.rotmat
+        if isinstance(rotmat, np.ndarray) and \
+                isinstance(tform, RotatePointCloud):
+            rotmat = torch.from_numpy(rotmat)
+        if not torch.is_tensor(rotmat) or rotmat.shape != (3, 3):
+            return None
+        matrix[:3, :3] = rotmat.detach().cpu().double()
+    else:
+        return None
+    return matrix
+
+
+class _AffineTransforms(object):
+    r"""Consecutive affine transforms of meshes or of pointclouds, applied as
+    a single matrix. Inputs the matrix does not apply to, such as 2D
+    pointclouds, go through the original transforms.
+    """
+
+    def __init__(self, tforms: Iterable, matrices: Iterable):
+        self.tforms = tforms
+        # the matrix of the last transform applies last
+        self.matrix = compose_transforms_3d(list(matrices)[::-1])
+        self.mesh = _is_mesh_transform(tforms[0])
+        self.inplace = all(t.inplace for t in tforms)
+
+    def __call__(self, inp):
+        if self.mesh and isinstance(inp, Mesh) and self._applies(inp.vertices):
+            if not self.inplace:
+                inp = inp.clone()
+            inp.vertices = self._apply(inp.vertices)
+            return inp
+        points = inp.points if isinstance(inp, PointCloud) else inp
+        if not self.mesh and self._applies(points):
+            return self._apply(points)
+        for t in self.tforms:
+            inp = t(inp)
+        return inp
+
+    @staticmethod
+    def _applies(points):
+        return torch.is_tensor(points) and points.dim() >= 2 and \
+            points.shape[-1] == 3 and points.is_floating_point()
+
+    def _apply(self, points: torch.Tensor):
+        matrix = self.matrix.to(points)
+        return torch.addmm(matrix[:3, 3], points.reshape(-1, 3),
+                           matrix[:3, :3].t()).view(points.shape)
+
+    def __repr__(self):
+        return ', '.join(str(t) for t in self.tforms)
+
+
 class CacheCompose(object):
     """Caches the results of the provided compose pipeline to disk.
     If the pipeline is already cached, data is returned from disk,
@@ -107,6 +227,12 @@ class CacheCompose(object):
         if isinstance(x, Mesh):
             np.savez(fpath, vertices=x.vertices.data.cpu().numpy(),
                      faces=x.faces.data.cpu().numpy())
+        elif x.dim() == 3 and x.is_floating_point() and \
+                ((x == 0) | (x == 1)).all():
+            # binary voxel grids are stored with one bit per voxel
+            np.savez(fpath, packed=cvt.pack_voxelgrid(x).cpu().numpy(),
+                     shape=np.array(x.shape),
+                     dtype=np.array(str(x.dtype).split('.')[-1]))
         else:
             np.savez(fpath, x.data.cpu().numpy())
 
@@ -119,6 +245,10 @@ class CacheCompose(object):
                 data = QuadMesh.from_tensors(verts, faces)
             else:
                 data = TriangleMesh.from_tensors(verts, faces)
+        elif 'packed' in data:
+            voxel = cvt.unpack_voxelgrid(torch.from_numpy(data['packed']),
+                                         data['shape'].tolist())
+            data = voxel.to(getattr(torch, str(data['dtype'])))
         else:
             data = torch.from_numpy(data['arr_0'])
 
@@ -247,6 +377,62 @@ class RealignPointCloud(object):
         return self.__class__.__name__ + '(realign)'
 
 
+class RegisterPointCloud(object):
+    r"""Rigidly registers a `src` pointcloud to the `tgt` pointcloud with
+    iterative closest points (see
+    :func:`kaolin.transforms.pointcloudfunc.icp`). The nearest neighbor
+    index of the target, and its normals for point to plane registration,
+    are computed once and reused by every call.
+
+    Args:
+        tgt (torch.Tensor or PointCloud): Target pointcloud.
+        mode (str): 'point_to_point' or 'point_to_plane'.
+        max_iterations (int): maximal number of iterations.
+        tolerance (float): convergence threshold on the relative change of
+            the mean squared distance between matches.
+        num_samples (int, optional): number of source points matched in
+            every iteration (default: all of them).
+
+    Example:
+        >>> register = RegisterPointCloud(tgt, num_samples=2000)
+        >>> src = register(src)
+
+    """
+
+    def __init__(self, tgt: Union[torch.Tensor, PointCloud],
+                 mode: str = 'point_to_point', max_iterations: int = 50,
+                 tolerance: float = 1e-6, num_samples: Optional[int] = None):
+        self.tgt_normals = None
+        if isinstance(tgt, PointCloud):
+            self.tgt_normals = tgt.normals
+            tgt = tgt.points
+        if mode == 'point_to_plane' and self.tgt_normals is None:
+            self.tgt_normals = estimate_normals(tgt)
+        self.tgt = tgt
+        self.mode = mode
+        self.max_iterations = max_iterations
+        self.tolerance = tolerance
+        self.num_samples = num_samples
+        self.index = pcfunc.build_icp_index(tgt)
+
+    def __call__(self, src: Union[torch.Tensor, PointCloud]):
+        """
+        Args:
+            src (torch.Tensor or PointCloud): Source pointcloud, or batch of
+                pointclouds, to register to the target pointcloud.
+
+        Returns:
+            (torch.Tensor): Registered source pointcloud.
+        """
+        return pcfunc.icp(src, self.tgt, self.mode, self.tgt_normals,
+                          self.max_iterations, self.tolerance,
+                          self.num_samples, self.index)[0]
+
+    def __repr__(self):
+        return self.__class__.__name__ + '(mode={0}, num_samples={1})'.format(
+            self.mode, self.num_samples)
+
+
 class NormalizePointCloud(object):
     r"""Normalize a pointcloud such that it is centered at the orgin and has
     unit standard deviation.
@@ -1017,13 +1203,17 @@ class VoxelGridToSDF(object):
         voxel (torch.Tensor): Voxel grid
         thresh (float): threshold from which to make voxel binary
         normalize (bool): whether to scale the array to (0,1)
+        mode (str): 'nearest' or 'edt', see
+            :func:`kaolin.conversions.voxelgrid_to_sdf`
 
     Returns:
         a signed distance fucntion
     """
-    def __init__(self, threshold: float, normalize: bool):
+    def __init__(self, threshold: float, normalize: bool,
+                 mode: str = 'nearest'):
         self.thresh = threshold
         self.normalize = normalize
+        self.mode = mode
 
     def __call__(self, voxel: Type[VoxelGrid]):
         """
@@ -1033,8 +1223,10 @@ class VoxelGridToSDF(object):
         Returns:
             (SDF): A signed distance function.
         """
-        return cvt.voxelgrid_to_sdf(voxel, self.thresh, self.normalize)
+        return cvt.voxelgrid_to_sdf(voxel, self.thresh, self.normalize,
+                                    self.mode)
 
     def __repr__(self):
-        return self.__class__.__name__ + '(threshold={0}, normalize={1})'.\
-            format(self.thresh, self.normalize)
+        return self.__class__.__name__ + \
+            '(threshold={0}, normalize={1}, mode={2})'.format(
+                self.thresh, self.normalize, self.mode)
@@ -41,8 +41,9 @@ import numpy as np
 import torch
 import torch.nn.functional as F
 from scipy import ndimage
+from scipy.sparse import coo_matrix, csgraph
 
-from kaolin.rep import VoxelGrid
+from kaolin.rep import VoxelGrid, SparseVoxelGrid
 from kaolin.conversions.voxelgridconversions import confirm_def
 from kaolin.conversions.voxelgridconversions import threshold
 from kaolin.conversions.voxelgridconversions import extract_surface
@@ -363,59 +364,108 @@ EPS = 1e-6
 #     return voxel
 
 
-def max_connected(voxel: Union[torch.Tensor, VoxelGrid], thresh: float = .5):
+def connected_components(voxel: Union[torch.Tensor, VoxelGrid,
+                                       SparseVoxelGrid],
+                         thresh: float = .5, connectivity: int = 6):
+    r"""Labels the connected components of the occupied voxels.
+
+    Components are numbered from 1 in the order of their first voxel, with
+    :math:`x` the slowest axis, and 0 marks empty voxels. Dense grids are
+    labeled with :func:`scipy.ndimage.label`, sparse grids through the
+    connected components of their neighbor graph.
+
+    Args:
+        voxel (torch.Tensor or VoxelGrid or SparseVoxelGrid): voxel array,
+            batch of voxel arrays (shape: :math:`B \times D \times D \times
+            D`), whose components are labeled separately, or sparse grid
+        thresh (float): threshold with which to binarize dense arrays
+        connectivity (int): voxels sharing a face (6), an edge (18) or a
+            corner (26) are connected
+
+    Returns:
+        (torch.LongTensor, torch.LongTensor): label of every voxel, or of
+        every voxel of a sparse grid in the order of its coords, and the
+        number of voxels of every component
+
+    Example:
+        >>> voxel = torch.zeros([32, 32, 32])
+        >>> voxel[:4, :4, :4] = 1
+        >>> voxel[8:16, 8:16, 8:16] = 1
+        >>> labels, sizes = connected_components(voxel)
+        >>> sizes
+        tensor([ 64, 512])
+    """
+    assert connectivity in [6, 18, 26], 'connectivity must be 6, 18 or 26'
+    if isinstance(voxel, SparseVoxelGrid):
+        neighbors = voxel.neighbors(connectivity)
+        rows, cols = (neighbors >= 0).nonzero(as_tuple=True)
+        cols = neighbors[rows, cols]
+        graph = coo_matrix((np.ones(rows.shape[0], dtype=bool),
+                            (rows.cpu().numpy(), cols.cpu().numpy())),
+                           shape=(len(voxel), len(voxel)))
+        _, labels = csgraph.connected_components(graph, directed=False)
+        labels = torch.from_numpy(labels).long().to(voxel.device) + 1
+        return labels, torch.bincount(labels)[1:]
+
+    if isinstance(voxel, VoxelGrid):
+        voxel = voxel.voxels
+    helpers._assert_tensor(voxel)
+    assert voxel.dim() in [3, 4], \
+        'Expected a voxel grid or a batch of voxel grids'
+    occupied = (voxel > thresh).cpu().numpy()
+    structure = ndimage.generate_binary_structure(
+        3, {6: 1, 18: 2, 26: 3}[connectivity])
+    if voxel.dim() == 4:
+        # no connection across the batch
+        structure = np.stack((np.zeros_like(structure), structure,
+                              np.zeros_like(structure)))
+    labels, _ = ndimage.label(occupied, structure)
+    labels = torch.from_numpy(labels).long().to(voxel.device)
+    return labels, torch.bincount(labels.view(-1))[1:]
+
+
+def max_connected(voxel: Union[torch.Tensor, VoxelGrid, SparseVoxelGrid],
+                  thresh: float = .5, connectivity: int = 6):
     r"""Removes unconnecred voxels.
 
     .. Note::
-        Largest maximum connected voxel is maintained.
+        Largest maximum connected voxel is maintained, the first one in
+        scan order if several have the same size.
 
     Args:
-        voxel = voxel array
+        voxel (torch.Tensor or VoxelGrid or SparseVoxelGrid): voxel array,
+            batch of voxel arrays (shape: :math:`B \times D \times D \times
+            D`), which are processed separately, or sparse grid
         thresh (float): threshold with which to binarize
+        connectivity (int): voxels sharing a face (6), an edge (18) or a
+            corner (26) are connected
 
     Returns:
-        torch.Torch: updated voxel array
+        torch.Torch: updated voxel array, or sparse grid of the largest
+        component
 
     Example:
-        >>> voxel = torch.rand 
+        >>> voxel = torch.zeros([32, 32, 32])
+        >>> voxel[:4, :4, :4] = 1
+        >>> voxel[8:16, 8:16, 8:16] = 1
+        >>> max_connected(voxel).sum()
+        tensor(512.)
     """
-    
-    voxel = voxel.clone()
-    voxel = threshold(voxel, thresh)
-    max_component = np.zeros(voxel.shape, dtype=bool)
-    for startx in range(voxel.shape[0]):
-        for starty in range(voxel.shape[1]):
-            for startz in range(voxel.shape[2]):
-                if not voxel[startx,starty,startz]:
-                    continue
-                # start a new component
-                component = np.zeros(voxel.shape, dtype=bool)
-                stack = [[startx,starty,startz]]
-                component[startx,starty,startz] = True
-                voxel[startx,starty,startz] = False
-                while len(stack) > 0:
-                    x,y,z = stack.pop()
-                    for i in range(x-1, x+1 + 1):
-                        for j in range(y-1, y+1 + 1):
-                            for k in range(z-1, z+1 + 1):
-                                if (i-x)**2+(j-y)**2+(k-z)**2 > 1:
-                                    continue
-                                if _voxel_exist(voxel, i,j,k):
-                                    voxel[i,j,k] = False
-                                    component[i,j,k] = True
-                                    stack.append([i,j,k])
-                if component.sum() > max_component.sum():
-                    max_component = component
-    
-    return torch.FloatTensor(max_component).to(voxel.device)
-
-
-def _voxel_exist(voxels, x,y,z):
-    if x < 0 or y < 0 or z < 0 or x >= voxels.shape[0]\
-        or y >= voxels.shape[1] or z >= voxels.shape[2]:
-        return False
-    else :
-        return voxels[x,y,z] == 1 
+    labels, sizes = connected_components(voxel, thresh, connectivity)
+    if isinstance(voxel, SparseVoxelGrid):
+        keep = labels == sizes.argmax() + 1 if sizes.shape[0] > 0 \
+            else torch.zeros_like(labels, dtype=torch.bool)
+        features = None if voxel.features is None else voxel.features[keep]
+        return SparseVoxelGrid(voxel.coords[keep], features,
+                               voxel.resolution)
+
+    largest = []
+    for grid_labels in labels.view(-1, *labels.shape[-3:]):
+        counts = torch.bincount(grid_labels.view(-1))
+        counts[0] = 0
+        largest.append(grid_labels == counts.argmax() if counts.sum() > 0
+                       else torch.zeros_like(grid_labels, dtype=torch.bool))
+    return torch.stack(largest).view(labels.shape).float()
 
 
 if __name__ == '__main__':
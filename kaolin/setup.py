@@ -102,15 +102,6 @@ if __name__ == '__main__':
     from Cython.Build import cythonize
     import numpy as np
 
-    triangle_hash_module = Extension(
-        'kaolin.triangle_hash',
-        sources=[
-            'kaolin/cython/triangle_hash.pyx'
-        ],
-        include_dirs=[np.get_include()],
-        # libraries=['m']
-    )
-
     mise_module = Extension(
         'kaolin.mise',
         sources=[
@@ -171,7 +162,6 @@ if __name__ == '__main__':
             'kaolin/graphics/nmr/cuda/rasterize_cuda.cpp',
             'kaolin/graphics/nmr/cuda/rasterize_cuda_kernel.cu',
         ]),
-        triangle_hash_module,
         mise_module,
         mcubes_module,
         nnsearch_module,
@@ -16,6 +16,7 @@ import pytest
 
 import torch
 import sys
+import time
 
 import kaolin as kal
 from kaolin.rep import TriangleMesh
@@ -46,6 +47,84 @@ def test_trianglemesh_to_voxelgrid(device):
 	assert (set(voxels.shape) == set([64, 64, 64]))
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_trianglemesh_to_voxelgrid_modes(device):
+	mesh = TriangleMesh.from_obj('tests/model.obj')
+	if device == 'cuda':
+		mesh.cuda()
+	surface = kal.conversions.trianglemesh_to_voxelgrid(mesh, 32)
+	conservative = kal.conversions.trianglemesh_to_voxelgrid(mesh, 32,
+		conservative=True)
+	solid = kal.conversions.trianglemesh_to_voxelgrid(mesh, 32, solid=True)
+	assert (surface <= conservative).all()
+	assert (surface <= solid).all()
+	assert solid.sum() > surface.sum()
+
+	# every vertex lies in an occupied voxel
+	vertices = mesh.vertices
+	vertices = (vertices - vertices.min()) / (vertices.max() - vertices.min())
+	index = (vertices * 31).long()
+	assert (surface[index[:, 0], index[:, 1], index[:, 2]] == 1).all()
+
+
+def test_trianglemesh_to_voxelgrid_face_on_boundary():
+	# triangles lying on the lower face of a voxel layer occupy the same
+	# voxels as when moved a quarter voxel up into the layer
+	triangles = torch.rand(50, 3, 3) * .8 + .1
+	triangles[..., 2] = .5
+	faces = torch.arange(150).view(50, 3)
+	on_face = TriangleMesh.from_tensors(triangles.view(-1, 3).clone(), faces)
+	triangles[..., 2] += .25 / 8
+	inside = TriangleMesh.from_tensors(triangles.view(-1, 3), faces)
+	voxels = kal.conversions.trianglemesh_to_voxelgrid(on_face, 9,
+		normalize=False)
+	expected = kal.conversions.trianglemesh_to_voxelgrid(inside, 9,
+		normalize=False)
+	assert torch.equal(voxels, expected)
+	assert voxels[:, :, 4].sum() == voxels.sum()
+
+
+def _subdivision_voxelgrid(mesh, resolution):
+	# the sampling voxelizer trianglemesh_to_voxelgrid used to be: split
+	# triangles until their sides are shorter than a voxel and mark the
+	# voxels of all their vertices
+	vertices = mesh.vertices
+	vertices = (vertices - vertices.min()) / (vertices.max() - vertices.min())
+	triangles = vertices[mesh.faces]
+	points = [vertices]
+	while True:
+		sides = (triangles - triangles.roll(1, dims=1)).pow(2).sum(dim=2)
+		triangles = triangles[sides.max(dim=1)[0] > resolution ** -2]
+		if len(triangles) == 0:
+			break
+		v1, v2, v3 = triangles.unbind(1)
+		v4, v5, v6 = (v1 + v3) / 2, (v1 + v2) / 2, (v2 + v3) / 2
+		points += [v4, v5, v6]
+		triangles = torch.cat((torch.stack((v1, v4, v5), dim=1),
+			torch.stack((v5, v2, v6), dim=1),
+			torch.stack((v5, v4, v6), dim=1),
+			torch.stack((v4, v3, v6), dim=1)))
+	points = (torch.cat(points) * (resolution - 1)).long()
+	voxel = torch.zeros(resolution, resolution, resolution)
+	voxel[points[:, 0], points[:, 1], points[:, 2]] = 1
+	return voxel
+
+
+def test_trianglemesh_to_voxelgrid_speed():
+	mesh = TriangleMesh.from_obj('tests/model.obj')
+	timings = []
+	for voxelize in [kal.conversions.trianglemesh_to_voxelgrid,
+			_subdivision_voxelgrid]:
+		best = float('inf')
+		for _ in range(3):
+			start = time.perf_counter()
+			voxels = voxelize(mesh, 256)
+			best = min(best, time.perf_counter() - start)
+		timings.append((best, voxels))
+	(exact_time, exact), (sampled_time, sampled) = timings
+	assert (sampled <= exact).all()
+	assert exact_time < sampled_time
+
 @pytest.mark.parametrize('device', ['cpu', 'cuda'])
 def test_trianglemesh_to_sdf(device):
 	mesh = TriangleMesh.from_obj('tests/model.obj')
@@ -31,6 +31,28 @@ def test_pointcloud_to_voxelgrid(device='cpu'):
     assert(voxels.shape == (32, 32, 32))
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_pointcloud_to_voxelgrid_scatter(device):
+    pts = torch.rand(4, 500, 3, device=device) - .5
+    voxels = kal.conversions.pointcloud_to_voxelgrid(pts, 16, 1. / 16)
+    assert(voxels.shape == (4, 16, 16, 16))
+    assert torch.equal(voxels[1],
+                       kal.conversions.pointcloud_to_voxelgrid(pts[1], 16, 1. / 16))
+
+    # the cell containing each point
+    cells = (pts[0] * 16 + 7.5).round().long()
+    counts = kal.conversions.pointcloud_to_voxelgrid(
+        pts[0], 16, 1. / 16, radius=0, reduce='count')
+    assert counts.sum() == 500
+    assert (counts[cells[:, 0], cells[:, 1], cells[:, 2]] >= 1).all()
+
+    features = torch.ones(500, 2, device=device)
+    means = kal.conversions.pointcloud_to_voxelgrid(
+        pts[0], 16, 1. / 16, radius=0, reduce='mean', features=features)
+    assert(means.shape == (16, 16, 16, 2))
+    assert torch.equal(means[..., 0], (counts > 0).float())
+
+
 def test_pointcloud_to_trianglemesh(device='cpu'):
     mesh = TriangleMesh.from_obj('tests/model.obj')
     if device == 'cuda':
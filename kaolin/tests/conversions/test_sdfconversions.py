@@ -70,6 +70,53 @@ def test_sdf_to_trianglemesh():
 	assert (torch.abs(verts[:,2])>.55).sum() == 0
 
 
+def test_sdf_to_trianglemesh_sparse():
+
+	# the box touches the bounding box, where the padding closes it
+	for sdf in [kal.rep.SDF.sphere(), kal.rep.SDF.box(h =.2, w = .4, l = .5)]:
+		verts, faces = kal.conversions.sdf_to_trianglemesh(sdf, bbox_center=0.,
+			resolution=10, bbox_dim=1)
+		voxels = kal.conversions.sdf_to_voxelgrid(sdf, bbox_center=0.,
+			resolution=10, bbox_dim=1)
+		dense_verts, dense_faces = kal.conversions.voxelgrid_to_trianglemesh(
+			voxels)
+
+		assert verts.shape == dense_verts.shape
+		assert faces.shape == dense_faces.shape
+		assert torch.equal(torch.unique(verts, dim=0),
+			torch.unique(dense_verts, dim=0))
+
+		edges = torch.cat((faces[:, :2], faces[:, 1:], faces[:, [2, 0]]))
+		_, counts = torch.unique(edges.sort(dim=1)[0], dim=0,
+			return_counts=True)
+		assert (counts == 2).all()
+
+
+def test_sdf_batched_evaluation():
+
+	sdf = kal.rep.SDF.sphere()
+	voxels = kal.conversions.sdf_to_voxelgrid(sdf, bbox_center=0.,
+		resolution=10, bbox_dim=1)
+	batch_sizes = []
+	def batched_sdf(points):
+		batch_sizes.append(points.shape[0])
+		return sdf(points)
+	chunked = kal.conversions.sdf_to_voxelgrid(batched_sdf, bbox_center=0.,
+		resolution=10, bbox_dim=1, batch_size=500, num_workers=4)
+	assert torch.equal(voxels, chunked)
+	assert max(batch_sizes) == 500
+
+	sdfs = [kal.rep.SDF.sphere(), kal.rep.SDF.box(h =.2, w = .4, l = .5)]
+	verts, faces = kal.conversions.sdf_to_trianglemesh(sdfs, bbox_center=0.,
+		resolution=10, bbox_dim=1, num_workers=2)
+	assert len(verts) == 2 and len(faces) == 2
+	for sdf, v, f in zip(sdfs, verts, faces):
+		single_verts, single_faces = kal.conversions.sdf_to_trianglemesh(sdf,
+			bbox_center=0., resolution=10, bbox_dim=1)
+		assert torch.equal(v, single_verts)
+		assert torch.equal(f, single_faces)
+
+
 def test_sdf_to_voxelgrid():
 
 	sdf = kal.rep.SDF.sphere()
@@ -56,6 +56,31 @@ def test_voxelgrid_to_trianglemesh(device):
 	assert faces.shape[0] > 0
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_voxelgrid_to_trianglemesh_batched(device):
+
+	voxel = (torch.rand([3, 16, 16, 16]) > .5).float().to(device)
+	verts, faces = kal.conversions.voxelgrid_to_trianglemesh(voxel,
+		num_workers=2)
+	assert len(verts) == 3 and len(faces) == 3
+	for i in range(3):
+		v, f = kal.conversions.voxelgrid_to_trianglemesh(voxel[i])
+		assert torch.equal(verts[i], v)
+		assert torch.equal(faces[i], f)
+		# welded and watertight: every edge is shared by two faces
+		assert torch.unique(v, dim=0).shape[0] == v.shape[0]
+		edges = torch.cat((f[:, :2], f[:, 1:], f[:, [2, 0]]))
+		_, counts = torch.unique(edges.sort(dim=1)[0], dim=0,
+			return_counts=True)
+		assert (counts == 2).all()
+
+	verts, faces = kal.conversions.voxelgrid_to_trianglemesh(
+		torch.ones([32, 32, 32]).to(device))
+	assert verts.shape == (6144, 3)
+	assert faces.shape == (12284, 3)
+	assert verts.device == voxel.device
+
+
 @pytest.mark.parametrize('device', ['cpu', 'cuda'])
 def test_voxelgrid_to_quadmesh(device):
 
@@ -72,6 +97,44 @@ def test_voxelgrid_to_quadmesh(device):
 	assert faces.shape[0] > 0
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_voxelgrid_to_quadmesh_merge(device):
+
+	voxel = torch.ones([16,16,16]).to(device)
+	verts, faces = kal.conversions.voxelgrid_to_quadmesh(voxel, merge=True)
+	assert (set(verts.shape) == set([8, 3]))
+	assert (set(faces.shape) == set([6, 4]))
+
+	# merged quads cover the same oriented area as the voxel faces
+	voxel = (torch.rand([16,16,16]) > .5).float().to(device)
+	areas = []
+	for merge in [False, True]:
+		verts, faces = kal.conversions.voxelgrid_to_quadmesh(voxel.clone(),
+			normalize=False, merge=merge)
+		quads = verts[faces]
+		areas.append(torch.cross(quads[:, 1] - quads[:, 0],
+			quads[:, 3] - quads[:, 0], dim=1).abs().sum(dim=0))
+	assert faces.shape[0] < (voxel.sum() * 6)
+	assert torch.allclose(areas[0], areas[1])
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_pack_voxelgrid(device):
+
+	voxel = torch.rand([5, 7, 9]).to(device)
+	packed = kal.conversions.pack_voxelgrid(voxel)
+	assert packed.dtype == torch.uint8
+	assert (set(packed.shape) == set([40]))
+	unpacked = kal.conversions.unpack_voxelgrid(packed, voxel.shape)
+	assert torch.equal(unpacked, (voxel > .5).float())
+
+	voxel = torch.rand([3, 16, 16, 16]).to(device)
+	packed = kal.conversions.pack_voxelgrid(voxel)
+	assert (set(packed.shape) == set([3, 512]))
+	unpacked = kal.conversions.unpack_voxelgrid(packed, voxel.shape)
+	assert torch.equal(unpacked, (voxel > .5).float())
+
+
 @pytest.mark.parametrize('device', ['cpu', 'cuda'])
 def test_voxelgrid_to_sdf(device):
 
@@ -89,3 +152,20 @@ def test_voxelgrid_to_sdf(device):
 	distances = sdf(points)
 	assert set(distances.shape) == set([200])
 	assert distances.sum() == 0
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_voxelgrid_to_sdf_edt(device):
+
+	coords = torch.arange(32, dtype=torch.float) / 32 - .5
+	coords = torch.stack(torch.meshgrid(coords, coords, coords, indexing='ij'))
+	voxel = (coords.norm(dim=0) < .3).float().to(device)
+	sdf = kal.conversions.voxelgrid_to_sdf(voxel, mode='edt')
+	points = (torch.rand((200,3)).to(device) - .5) * .8
+	distances = sdf(points)
+	assert set(distances.shape) == set([200])
+	assert torch.allclose(distances, points.norm(dim=1) - .3, atol=1. / 16)
+
+	voxel = torch.ones([10,10,10]).to(device)
+	sdf = kal.conversions.voxelgrid_to_sdf(voxel, mode='edt')
+	assert (sdf(torch.rand((200,3)).to(device) * .8 - .4) < 0).all()
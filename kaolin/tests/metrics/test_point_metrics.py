@@ -95,6 +95,42 @@ def test_f_score(device = 'cpu'):
 
 	assert (f3>= f2)
 
+def test_earth_movers_distance(device = 'cpu'): 
+	A = torch.rand(2,200,3).to(device)
+	B = torch.rand(2,200,3).to(device)
+
+	# exact value through a brute force assignment
+	from scipy.optimize import linear_sum_assignment
+	exact = []
+	for a, b in zip(A, B):
+		cost = ((a.unsqueeze(1) - b.unsqueeze(0))**2).sum(-1).sqrt().cpu()
+		rows, cols = linear_sum_assignment(cost.numpy())
+		exact.append(cost[rows, cols].mean())
+	exact = torch.stack(exact).to(device)
+
+	sinkhorn = kal.metrics.point.earth_movers_distance(A, B)
+	assert (set(sinkhorn.shape) == set([2]))
+	assert torch.allclose(sinkhorn, exact, rtol=0.05)
+
+	auction = kal.metrics.point.earth_movers_distance(A, B, method='auction')
+	assert (auction >= exact - 1e-5).all()
+	assert (auction <= exact + 0.01).all()
+
+	distance = kal.metrics.point.earth_movers_distance(A[0], A[0], method='auction')
+	assert distance < 1e-5
+
+
+def test_earth_movers_distance_grad(device = 'cpu'): 
+	A = torch.rand(100,3).to(device).requires_grad_()
+	B = torch.rand(80,3).to(device)
+	distance = kal.metrics.point.earth_movers_distance(A, B, p=2)
+	distance.backward()
+
+	# a small step against the gradient decreases the distance
+	with torch.no_grad():
+		step = kal.metrics.point.earth_movers_distance(A - 0.1 * A.grad, B, p=2)
+	assert step < distance
+
 def test_chamfer_distance_gpu(): 
 	test_chamfer_distance("cuda")
 def test_directed_distance_gpu(): 
@@ -18,7 +18,7 @@ import torch
 import sys
 
 import kaolin as kal
-from kaolin.metrics.voxel import iou
+from kaolin.metrics.voxel import iou, packed_iou
 
 def test_iou(device = 'cpu'): 	
 	
@@ -44,4 +44,23 @@ def test_iou(device = 'cpu'):
 	assert (distance != distance) # should be NaN
 
 def test_iou_gpu(): 
-	test_iou("cuda")
\ No newline at end of file
+	test_iou("cuda")
+def test_iou_batched(device = 'cpu'):
+	A = torch.rand(4,16,16,16).to(device)
+	B = (torch.rand(4,16,16,16) > .5).float().to(device)
+	distances = iou(A, B, reduction='none')
+	assert (set(distances.shape) == set([4]))
+	for i in range(4):
+		assert torch.allclose(distances[i], iou(A[i], B[i]))
+	assert torch.allclose(iou(A, B), distances.mean())
+	assert torch.allclose(iou(A, B, reduction='sum'), distances.sum())
+
+def test_packed_iou(device = 'cpu'):
+	A = torch.rand(4,16,16,16).to(device)
+	B = (torch.rand(4,16,16,16) > .5).float().to(device)
+	packed_A = kal.conversions.pack_voxelgrid(A)
+	packed_B = kal.conversions.pack_voxelgrid(B)
+	distances = packed_iou(packed_A, packed_B, reduction='none')
+	assert torch.allclose(distances, iou(A, B, reduction='none'))
+	assert torch.allclose(packed_iou(packed_A, packed_B), iou(A, B))
+	assert torch.allclose(packed_iou(packed_A[0], packed_B[0]), iou(A[0], B[0]))
@@ -36,3 +36,46 @@ def test_smoke():
     x = torch.randn(2, 128, 7).cuda()
     out = model(x)
     helpers._assert_shape_eq(out, (2, 128, 13))
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_smoke_device(device):
+    model = kal.models.PointNet2.PointNet2Segmenter(
+        in_features=4,
+        num_classes=13,
+        batchnorm=True,
+    ).to(device)
+    x = torch.randn(2, 128, 7, device=device)
+    out = model(x)
+    helpers._assert_shape_eq(out, (2, 128, 13))
+
+
+def test_ball_query_cpu():
+    xyz = torch.rand(2, 300, 3)
+    new_xyz = xyz[:, :20]
+    idx = kal.models.PointNet2.ball_query(0.2, 8, xyz, new_xyz)
+    helpers._assert_shape_eq(idx, (2, 20, 8))
+    for b in range(2):
+        for j in range(20):
+            dist = ((xyz[b] - new_xyz[b, j]) ** 2).sum(dim=1)
+            hits = (dist < 0.04).nonzero().view(-1)[:8].tolist()
+            hits += [hits[0]] * (8 - len(hits))
+            assert idx[b, j].tolist() == hits
+
+
+@pytest.mark.skipif(not torch.cuda.is_available(), reason='requires cuda')
+def test_cpu_matches_cuda():
+    xyz = torch.rand(2, 300, 3)
+    fps = kal.models.PointNet2.furthest_point_sampling
+    assert torch.equal(fps(xyz, 32), fps(xyz.cuda(), 32).cpu())
+
+    new_xyz = xyz[:, :50]
+    ball_query = kal.models.PointNet2.ball_query
+    assert torch.equal(ball_query(0.2, 16, xyz, new_xyz),
+                       ball_query(0.2, 16, xyz.cuda(), new_xyz.cuda()).cpu())
+
+    three_nn = kal.models.PointNet2.three_nn
+    dist, idx = three_nn(new_xyz, xyz)
+    dist_cuda, idx_cuda = three_nn(new_xyz.cuda(), xyz.cuda())
+    assert torch.equal(idx, idx_cuda.cpu())
+    assert torch.allclose(dist, dist_cuda.cpu())
@@ -0,0 +1,43 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+import kaolin as kal
+from kaolin import helpers
+
+
+def test_knn_chunked():
+    x = torch.rand(2, 8, 500)
+    dense = kal.models.dgcnn.knn(x, 10)
+    chunked = kal.models.dgcnn.knn(x, 10, chunk_size=64)
+    helpers._assert_shape_eq(chunked, (2, 500, 10))
+    assert torch.equal(dense.sort(dim=-1)[0], chunked.sort(dim=-1)[0])
+
+
+def test_approximate_knn():
+    xyz = torch.rand(2, 3, 2000)
+    exact = kal.models.dgcnn.knn(xyz, 10)
+    approx = kal.models.dgcnn.approximate_knn(xyz, 10)
+    helpers._assert_shape_eq(approx, (2, 2000, 10))
+    recall = (approx.unsqueeze(-1) == exact.unsqueeze(-2)).any(-1)
+    assert recall.float().mean() > 0.9
+
+
+def test_smoke_cpu():
+    model = kal.models.dgcnn.DGCNN(output_channels=5, use_cuda=False,
+                                   knn_chunk_size=256, approximate_knn=True)
+    model.eval()
+    out = model(torch.rand(2, 3, 1024))
+    helpers._assert_shape_eq(out, (2, 5))
@@ -66,3 +66,46 @@ def test_check_sign(device):
 # 	sign = torch.from_numpy(np.asarray(sign)).cuda()
     
 # 	print((sign == sign_fast).float().sum())
+
+def test_check_sign_thin_geometry():
+    # a thin axis aligned slab, which rays along z graze
+    vertices = torch.tensor([[x, y, z] for x in (0., 1.) for y in (0., .01)
+                             for z in (0., 1.)])
+    faces = torch.tensor([[0, 1, 3], [0, 3, 2], [4, 6, 7], [4, 7, 5],
+                          [0, 4, 5], [0, 5, 1], [2, 3, 7], [2, 7, 6],
+                          [0, 2, 6], [0, 6, 4], [1, 5, 7], [1, 7, 3]])
+    mesh = TriangleMesh.from_tensors(vertices, faces)
+    points = torch.rand(1000, 3) * torch.tensor([1., .01, 1.])
+    assert kal.rep.SDF.check_sign(mesh, points).all()
+    points[:, 1] += .02
+    assert not kal.rep.SDF.check_sign(mesh, points).any()
+
+def test_winding_number():
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    points = torch.rand(1000, 3) - .5
+    winding = kal.rep.SDF.winding_number(mesh, points).abs()
+    signs = kal.rep.SDF.check_sign(mesh, points)
+    assert ((winding > .5).numpy() == signs).all()
+
+    # removing faces opens the mesh, but occupancy is mostly preserved
+    keep = torch.arange(mesh.faces.shape[0]) % 20 != 0
+    open_mesh = TriangleMesh.from_tensors(mesh.vertices, mesh.faces[keep])
+    winding = kal.rep.SDF.winding_number(open_mesh, points).abs()
+    assert ((winding > .5).numpy() == signs).mean() > .95
+
+def test_mesh_sdf():
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    sdf = kal.rep.MeshSDF(mesh)
+    points = torch.rand(1000, 3) - .5
+    distances = sdf(points)
+    signs = kal.rep.SDF.check_sign(mesh, points)
+    assert ((distances < 0).numpy() == signs).all()
+    # exact distances are bounded by the distance to any vertex
+    to_vertices = torch.cdist(points, mesh.vertices).min(dim=1)[0]
+    assert (distances.abs() <= to_vertices + 1e-5).all()
+
+    # narrow band lookups agree with exact queries near the surface
+    grid_sdf = kal.rep.MeshSDF(mesh, resolution=32)
+    points = mesh.sample(1000)[0] + torch.randn(1000, 3) * .005
+    assert torch.allclose(grid_sdf(points), sdf(points),
+                          atol=grid_sdf.grid_cell)
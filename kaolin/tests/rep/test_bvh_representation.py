@@ -0,0 +1,89 @@
+# Copyright (c) 2019, NVIDIA CORPORATION. All rights reserved.
+
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+
+#     http://www.apache.org/licenses/LICENSE-2.0
+
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+import torch
+
+import kaolin as kal
+from kaolin.rep import TriangleMesh
+
+
+def _brute_force_distance(points, mesh):
+    v = mesh.vertices[mesh.faces]
+    samples = []
+    for _ in range(200):
+        u = torch.rand(v.shape[0], 1)
+        w = torch.rand(v.shape[0], 1)
+        flip = (u + w) > 1
+        u[flip], w[flip] = 1 - u[flip], 1 - w[flip]
+        samples.append(v[:, 0] + u * (v[:, 1] - v[:, 0]) +
+                       w * (v[:, 2] - v[:, 0]))
+    samples = torch.cat(samples)
+    return torch.cdist(points, samples).min(dim=1)[0]
+
+
+@pytest.mark.parametrize('split', ['sah', 'median'])
+def test_closest_point(split):
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    bvh = kal.rep.BVH(mesh.vertices, mesh.faces, split=split)
+    points = torch.rand(200, 3) - .5
+    distances, face_idx, bary = bvh.closest_point(points)
+
+    assert distances.shape == (200,)
+    assert torch.allclose(bary.sum(dim=1), torch.ones(200), atol=1e-5)
+    # the reported face and barycentrics reproduce the distance
+    tri = mesh.vertices[mesh.faces[face_idx]]
+    closest = (bary.unsqueeze(-1) * tri).sum(dim=1)
+    assert torch.allclose((points - closest).norm(dim=1), distances,
+                          atol=1e-5)
+    # and no sampled surface point is closer
+    assert (_brute_force_distance(points, mesh) >= distances - 1e-5).all()
+
+
+def test_intersect_ray():
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    bvh = mesh.get_bvh()
+    origins = torch.zeros(100, 3)
+    directions = torch.randn(100, 3)
+    t, face_idx, bary = bvh.intersect_ray(origins, directions)
+    # the origin is inside the model, every ray leaves it
+    assert (face_idx >= 0).all()
+    tri = mesh.vertices[mesh.faces[face_idx]]
+    hits = (bary.unsqueeze(-1) * tri).sum(dim=1)
+    assert torch.allclose(hits, origins + t.view(-1, 1) * directions,
+                          atol=1e-4)
+
+    t, face_idx, _ = bvh.intersect_ray(origins + 10, directions.abs())
+    assert (face_idx == -1).all()
+    assert torch.isinf(t).all()
+
+
+def test_intersect_ray_miss():
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    bvh = mesh.get_bvh()
+    # rays that miss every box are dropped at the root instead of
+    # walking the whole tree
+    origins = torch.rand(100000, 3) + 10
+    directions = torch.randn(100000, 3).abs()
+    t, face_idx, _ = bvh.intersect_ray(origins, directions)
+    assert (face_idx == -1).all()
+    assert torch.isinf(t).all()
+
+
+def test_bvh_cache():
+    mesh = TriangleMesh.from_obj('tests/model.obj')
+    bvh = mesh.get_bvh()
+    assert mesh.get_bvh() is bvh
+    mesh.vertices = mesh.vertices * 2
+    assert mesh.get_bvh() is not bvh
@@ -27,6 +27,46 @@ def test_pointcloud_creation(device='cpu'):
 	pcd = kal.rep.PointCloud(points=pts, normals=normals)
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_pointcloud_downsample(device):
+	points = torch.rand(2, 2000, 3).to(device)
+	for method, kwargs in [('random', {'num_points': 100}),
+						   ('furthest', {'num_points': 100})]:
+		samples, idx = kal.rep.downsample_points(points, method, **kwargs)
+		assert set(idx.shape) == set([2, 100])
+		assert torch.equal(samples, points[torch.arange(2).unsqueeze(1), idx])
+
+	samples, idx = kal.rep.downsample_points(points, 'poisson', radius=.1)
+	for i in range(2):
+		cloud = samples[i].unique(dim=0)
+		distances = torch.cdist(cloud, cloud) + torch.eye(cloud.shape[0]).to(device)
+		assert distances.min() >= .1
+		assert torch.cdist(points[i], cloud).min(dim=1)[0].max() < .1
+
+	pcd = kal.rep.PointCloud(points=points[0], normals=points[0], device=device)
+	pooled, idx = pcd.downsample('voxel', voxel_size=.25)
+	assert set(pooled.points.shape) == set([64, 3])
+	assert torch.equal(pooled.normals, points[0][idx])
+	assert ((pooled.points - points[0][idx]).abs() < .25).all()
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_pointcloud_estimate_normals(device):
+	points = torch.randn(2, 5000, 3).to(device)
+	points = points / points.norm(dim=-1, keepdim=True)
+	normals = kal.rep.estimate_normals(points, k=16)
+	assert normals.shape == points.shape
+	assert ((normals * points).sum(-1).abs() > .99).all()
+
+	normals = kal.rep.estimate_normals(points, orient='viewpoint')
+	assert ((normals * points).sum(-1) < -.99).all()
+
+	pcd = kal.rep.PointCloud(points=points[0], device=device)
+	normals = pcd.estimate_normals(orient='mst')
+	assert torch.equal(normals, pcd.normals)
+	assert ((normals * points[0]).sum(-1) > .99).all()
+
+
 # def test_points(device = 'cpu'): 
 # 	points1 = torch.ones((100,3)).to(device)
 # 	points2 = kal.rep.point.scale(points1, torch.FloatTensor([.5]).to(device))
@@ -103,6 +103,24 @@ def test_fill(device):
     assert filled_voxel.sum() == 0
 
 
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_batched_voxel_ops(device):
+    voxel = (torch.rand([3, 16, 16, 16]) > .6).float().to(device)
+    voxel[:, 2:14, 2:14, 2:14] = 1
+    voxel[:, 4:12, 4:12, 4:12] = 0
+    ops = [(kal.conversions.voxelgridconversions.downsample, ([2, 2, 2],)),
+           (kal.conversions.voxelgridconversions.upsample, (40,)),
+           (kal.conversions.voxelgridconversions.fill, ()),
+           (kal.conversions.voxelgridconversions.extract_surface, ())]
+    for op, args in ops:
+        batched = op(voxel.clone(), *args)
+        for i in range(3):
+            assert torch.equal(batched[i], op(voxel[i].clone(), *args))
+
+    filled = kal.conversions.voxelgridconversions.fill(voxel.clone())
+    assert (filled[:, 4:12, 4:12, 4:12] == 1).all()
+
+
 @pytest.mark.parametrize('device', ['cpu', 'cuda'])
 def test_extract_surface(device):
     voxel = torch.ones([32, 32, 32]).to(device)
@@ -165,3 +183,110 @@ def test_project_odms(device):
     new_voxel = kal.conversions.voxelgridconversions.project_odms(odms)
     assert (set(new_voxel.shape) == set([32, 32, 32]))
     assert (torch.abs(voxel - new_voxel).sum() == 0)
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_odms_batched(device):
+    voxel = (torch.rand([4, 16, 16, 16]) > .6).float().to(device)
+    odms = kal.conversions.voxelgridconversions.extract_odms(voxel.clone())
+    assert (set(odms.shape) == set([4, 6, 16, 16]))
+    assert odms.device == voxel.device
+    projected = kal.conversions.voxelgridconversions.project_odms(
+        odms, voxel, votes=2)
+    for i in range(4):
+        single = kal.conversions.voxelgridconversions.extract_odms(
+            voxel[i].clone())
+        assert torch.equal(odms[i], single)
+        assert torch.equal(projected[i],
+                           kal.conversions.voxelgridconversions.project_odms(
+                               single, voxel[i], votes=2))
+
+    # carving with the odms of a grid keeps all of its voxels
+    assert (projected >= voxel).all()
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_sparse_voxelgrid(device):
+    voxel = (torch.rand([20, 20, 20]) > .6).float().to(device)
+    voxel[5:15, 5:15, 5:15] = 1
+    grid = kal.rep.SparseVoxelGrid.from_dense(voxel)
+    assert len(grid) == voxel.sum()
+    assert torch.equal(grid.to_dense(), voxel)
+
+    coords = torch.tensor([[10, 10, 10], [0, 0, 0], [-1, 3, 3]])
+    assert grid.contains(coords).tolist() == [True, bool(voxel[0, 0, 0]),
+                                              False]
+    neighbors = grid.neighbors(6)
+    assert (set(neighbors.shape) == set([len(grid), 6]))
+
+    surface = kal.conversions.voxelgridconversions.extract_surface(voxel)
+    assert torch.equal(grid.extract_surface().to_dense(), surface)
+
+    dilated = grid.dilate(connectivity=26).to_dense()
+    assert (dilated >= voxel).all()
+    assert dilated.sum() > voxel.sum()
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_sparse_voxelgrid_conversions(device):
+    voxel = (torch.rand([16, 16, 16]) > .5).float().to(device)
+    grid = kal.rep.SparseVoxelGrid.from_dense(voxel)
+
+    verts, faces = kal.conversions.voxelgridconversions.voxelgrid_to_quadmesh(
+        voxel)
+    sparse_verts, sparse_faces = \
+        kal.conversions.voxelgridconversions.sparsevoxelgrid_to_quadmesh(grid)
+    assert torch.allclose(verts.to(device), sparse_verts)
+    assert torch.equal(faces.to(device), sparse_faces)
+
+    points = kal.conversions.voxelgridconversions.sparsevoxelgrid_to_pointcloud(
+        grid, 100)
+    assert (set(points.shape) == set([100, 3]))
+    assert points.abs().max() <= .5
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_octree_voxelgrid(device, tmp_path):
+    voxel = (torch.rand([20, 13, 17]) > .5).float().to(device)
+    voxel[:16, :8, :16] = 1
+    octree = kal.rep.OctreeVoxelGrid.from_dense(voxel)
+    assert octree.resolution == 32
+    dense = octree.to_dense()
+    assert torch.equal(dense[:20, :13, :17], voxel)
+    assert dense.sum() == voxel.sum()
+    assert len(octree) < voxel.numel()
+
+    # coarser levels are max pooled
+    for level in range(octree.depth + 1):
+        pooled = torch.nn.functional.max_pool3d(
+            dense[None, None], 2 ** (octree.depth - level))[0, 0]
+        assert torch.equal(octree.to_dense(level), pooled)
+
+    coords = torch.randint(0, 32, (1000, 3), device=device)
+    points = coords.float() + torch.rand(1000, 3, device=device)
+    occupied = dense[coords[:, 0], coords[:, 1], coords[:, 2]] > 0
+    assert torch.equal(octree.query(points), occupied)
+    assert not octree.query(torch.tensor([[-1., 0., 0.]])).any()
+
+    octree.save(str(tmp_path / 'octree.npz'))
+    loaded = kal.rep.OctreeVoxelGrid.load(str(tmp_path / 'octree.npz'),
+                                          device)
+    assert torch.equal(loaded.to_dense(), dense)
+
+
+def test_octree_voxelgrid_from_sdf():
+    sdf = kal.rep.SDF.sphere(r=.6)
+    octree = kal.rep.OctreeVoxelGrid.from_sdf(sdf, 6, bbox_dim=2.)
+    points = torch.rand(1000, 3) * 2 - 1
+    inside = points.norm(dim=1) < .5
+    outside = points.norm(dim=1) > .7
+    occupied = octree.query(points)
+    assert occupied[inside].all() and not occupied[outside].any()
+    assert len(octree) < 64 ** 3 / 10
+
+
+def test_octree_voxelgrid_from_mesh():
+    mesh = kal.rep.TriangleMesh.from_obj('tests/model.obj')
+    octree = kal.rep.OctreeVoxelGrid.from_mesh(mesh, 6)
+    surface = kal.conversions.trianglemesh_to_sparsevoxelgrid(mesh, 64)
+    assert torch.equal(octree.to_sparse().keys, surface.keys)
@@ -34,6 +34,23 @@ def test_rotate_pointcloud(device='cpu'):
     assert_allclose(iden(pc), torch.ones(4, 3))
 
 
+def test_compose_affine_fusion(device='cpu'):
+    pc = torch.rand(2, 100, 3, device=device)
+    angle = torch.tensor(0.3)
+    rmat = torch.tensor([[angle.cos(), -angle.sin(), 0.],
+                         [angle.sin(), angle.cos(), 0.],
+                         [0., 0., 1.]], device=device)
+    tforms = [kal.transforms.ScalePointCloud(2),
+              kal.transforms.RotatePointCloud(rmat),
+              kal.transforms.ScalePointCloud(0.5)]
+    compose = kal.transforms.Compose(tforms)
+    assert len(compose.stages) == 1
+    expected = pc
+    for t in tforms:
+        expected = t(expected)
+    assert_allclose(compose(pc), expected)
+
+
 def test_realign_pointcloud(device='cpu'):
     torch.manual_seed(1234)
     src = 10 * torch.rand(4, 3).to(device)
@@ -46,6 +63,40 @@ def test_realign_pointcloud(device='cpu'):
     assert_allclose(src_.std(-2), tgt.std(-2), atol=1e-2, rtol=1e1)
 
 
+def test_register_pointcloud(device='cpu'):
+    torch.manual_seed(1234)
+    tgt = torch.rand(2, 2000, 3).to(device)
+    angle = torch.tensor(.05)
+    rotation = torch.tensor([[angle.cos(), -angle.sin(), 0],
+                             [angle.sin(), angle.cos(), 0],
+                             [0, 0, 1]]).to(device)
+    src = (tgt - .02) @ rotation
+    for mode in ['point_to_point', 'point_to_plane']:
+        register = kal.transforms.RegisterPointCloud(tgt, mode=mode)
+        assert_allclose(register(src), tgt, atol=1e-4, rtol=0)
+    _, rotation_, translation = kal.transforms.pointcloudfunc.icp(
+        src[0], tgt[0], num_samples=500)
+    assert_allclose(rotation_, rotation, atol=1e-4, rtol=0)
+    assert_allclose(translation, torch.full((3,), .02).to(device),
+                    atol=1e-4, rtol=0)
+
+
+
+def test_register_pointcloud_batch(device='cpu'):
+    torch.manual_seed(1234)
+    tgt = torch.rand(2000, 3).to(device)
+    angles = torch.tensor([.05, -.05])
+    rotations = torch.stack([torch.tensor([[a.cos(), -a.sin(), 0],
+                                           [a.sin(), a.cos(), 0],
+                                           [0, 0, 1]]) for a in angles])
+    src = (tgt - .02) @ rotations.to(device)
+    for mode in ['point_to_point', 'point_to_plane']:
+        register = kal.transforms.RegisterPointCloud(tgt, mode=mode)
+        assert_allclose(register(src), tgt.expand(2, -1, -1), atol=1e-4,
+                        rtol=0)
+    with pytest.raises(AssertionError):
+        kal.transforms.pointcloudfunc.icp(src[:1], src)
+
 def test_normalize_pointcloud(device='cpu'):
     src = torch.rand(4, 3).to(device)
     normalize = kal.transforms.NormalizePointCloud()
@@ -0,0 +1,41 @@
+import pytest
+
+import torch
+
+import kaolin as kal
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_connected_components(device):
+    voxel = torch.zeros(16, 16, 16, device=device)
+    voxel[:4, :4, :4] = 1
+    voxel[8:14, 8:14, 8:14] = 1
+    voxel[4, 4, 4] = 1
+    labels, sizes = kal.transforms.voxelfunc.connected_components(voxel)
+    assert labels.device == voxel.device
+    assert sizes.tolist() == [64, 1, 216]
+    assert labels[0, 0, 0] == 1 and labels[15, 15, 15] == 0
+
+    # the corner voxel joins the first cube with 26-connectivity
+    labels, sizes = kal.transforms.voxelfunc.connected_components(
+        voxel, connectivity=26)
+    assert sizes.tolist() == [65, 216]
+
+    largest = kal.transforms.voxelfunc.max_connected(voxel)
+    assert largest.sum() == 216 and largest[10, 10, 10] == 1
+
+    grid = kal.rep.SparseVoxelGrid.from_dense(voxel)
+    labels, sizes = kal.transforms.voxelfunc.connected_components(grid)
+    assert sizes.tolist() == [64, 1, 216]
+    sparse_largest = kal.transforms.voxelfunc.max_connected(grid)
+    assert torch.equal(sparse_largest.to_dense(), largest)
+
+
+@pytest.mark.parametrize('device', ['cpu', 'cuda'])
+def test_max_connected_batched(device):
+    voxel = torch.rand(3, 12, 12, 12, device=device)
+    largest = kal.transforms.voxelfunc.max_connected(voxel, .6, 18)
+    assert (set(largest.shape) == set([3, 12, 12, 12]))
+    for i in range(3):
+        assert torch.equal(largest[i], kal.transforms.voxelfunc.max_connected(
+            voxel[i], .6, 18))